@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+'''
+Portal pages used as benchmark fixtures, and enlarged variants of them.
+The committed fixtures are synthetic, rendered by the portal emulator with
+`python -m benchmarks.record`; record real pages with its `--url` option.
+'''
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from src.tarjeta_metrobus.parsers import MOVEMENTS_MARKER
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+PAGES = ('session', 'resume', 'movements')
+
+
+def load(name: str) -> str:
+    '''
+    Read a fixture page
+
+    Args:
+        name (str): One of PAGES
+    Returns:
+        str: Page HTML
+    '''
+    return (FIXTURES / f'{name}.html').read_text(encoding='utf-8')
+
+
+def enlarge_movements(html: str, rows: int) -> str:
+    '''
+    Grow a movements page to `rows` data rows by repeating its own rows
+
+    Args:
+        html (str): Movements page
+        rows (int): Wanted number of data rows
+    Returns:
+        str: Page HTML
+    '''
+    soup = BeautifulSoup(html, 'html.parser')
+    table = soup.find(string=MOVEMENTS_MARKER).parent.parent.parent.parent
+    data_rows = table.find_all('tr')[2:]
+    markup = [str(row) for row in data_rows]
+
+    for row in data_rows:
+        row.decompose()
+
+    grown = ''.join(markup[index % len(markup)] for index in range(rows))
+    table.append(BeautifulSoup(grown, 'html.parser'))
+
+    return str(soup)
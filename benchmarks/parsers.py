@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+'''
+Scraping hot path benchmarks
+
+    python -m benchmarks.parsers                     # compare with benchmarks/baseline.json
+    python -m benchmarks.parsers --update-baseline   # store a new baseline
+    python -m benchmarks.parsers --report-only       # list regressions without failing
+
+Before timing, every available parser backend must give identical results
+on every page; a mismatch fails the run.
+'''
+import sys
+from typing import List
+
+from bs4 import builder_registry
+
+from src.tarjeta_metrobus.models import CardMovement
+from src.tarjeta_metrobus.parsers import (CARD_INFO_MARKER,
+                                          CARD_RESUME_MARKER,
+                                          PARSER_BACKENDS,
+                                          make_soup,
+                                          parse_card_info,
+                                          parse_card_resume,
+                                          parse_card_stats,
+                                          parse_ksi,
+                                          parse_movements)
+from src.tarjeta_metrobus.utils import bs_table_to_dict, table_to_data
+
+from . import pages
+from .runner import Result, arguments, finish, measure
+
+SUITE = 'parsers'
+SIZES = (1000, 10000, 30000)
+
+
+def backends() -> List[str]:
+    '''
+    Parser backends installed here
+    '''
+    return [backend for backend in PARSER_BACKENDS if builder_registry.lookup(backend) is not None]
+
+
+def parse_all(html: dict, backend: str) -> tuple:
+    '''
+    Parse every page with a backend
+    '''
+    session = make_soup(html['session'], backend)
+    resume = make_soup(html['resume'], backend)
+
+    return (parse_ksi(session),
+            parse_card_info(session),
+            parse_card_resume(resume),
+            parse_card_stats(resume),
+            parse_movements(make_soup(html['movements'], backend)))
+
+
+def check_parity(html: dict, installed: List[str]) -> bool:
+    '''
+    Whether every backend gives the same models
+    '''
+    expected = parse_all(html, installed[0])
+    ok = True
+
+    for backend in installed[1:]:
+        if parse_all(html, backend) != expected:
+            print(f'Parser parity failure: {backend} differs from {installed[0]}')
+            ok = False
+
+    return ok
+
+
+def run(sizes: List[int], min_time: float) -> List[Result]:
+    '''
+    Run every case
+    '''
+    installed = backends()
+    recorded = {name: pages.load(name) for name in pages.PAGES}
+    movement_pages = {'recorded': recorded['movements']}
+    movement_pages.update({f'{size}rows': pages.enlarge_movements(recorded['movements'], size) for size in sizes})
+
+    for label, movements in movement_pages.items():
+        if not check_parity({**recorded, 'movements': movements}, installed):
+            print(f'on the {label} movements page')
+            sys.exit(1)
+
+    results = []
+
+    for backend in installed:
+        session = make_soup(recorded['session'], backend)
+        info_table = session.find(string=CARD_INFO_MARKER).parent.parent.parent
+        resume = make_soup(recorded['resume'], backend)
+        resume_table = resume.find(string=CARD_RESUME_MARKER).parent.parent.parent
+
+        # Loop values are bound as defaults: flagged cases run again after the loop
+        results.append(measure(f'{backend}/soup/session',
+                               lambda backend=backend: make_soup(recorded['session'], backend), min_time))
+        results.append(measure(f'{backend}/soup/resume',
+                               lambda backend=backend: make_soup(recorded['resume'], backend), min_time))
+        results.append(measure(f'{backend}/bs_table_to_dict/info',
+                               lambda table=info_table: bs_table_to_dict(table), min_time))
+        results.append(measure(f'{backend}/bs_table_to_dict/resume',
+                               lambda table=resume_table: bs_table_to_dict(table), min_time))
+        results.append(measure(f'{backend}/table_to_data/uses',
+                               lambda resume=resume: table_to_data(resume, 'Monto utilizado'), min_time))
+
+        for label, movements in movement_pages.items():
+            soup = make_soup(movements, backend)
+            results.append(measure(f'{backend}/movements/{label}/soup',
+                                   lambda movements=movements, backend=backend: make_soup(movements, backend),
+                                   min_time))
+            results.append(measure(f'{backend}/movements/{label}/parse',
+                                   lambda soup=soup: parse_movements(soup), min_time))
+
+    movements = parse_movements(make_soup(recorded['movements']))
+    dumped = CardMovement.schema().dump(movements, many=True)
+    schema = CardMovement.schema()
+
+    results.append(measure('models/movements/schema_dump', lambda: CardMovement.schema().dump(movements, many=True),
+                           min_time))
+    results.append(measure('models/movements/schema_load', lambda: schema.load(dumped, many=True), min_time))
+    results.append(measure('models/movements/to_dict', lambda: [movement.to_dict() for movement in movements],
+                           min_time))
+    results.append(measure('models/movements/from_dict', lambda: [CardMovement.from_dict(item) for item in dumped],
+                           min_time))
+
+    return results
+
+
+def main():
+    '''
+    Run the suite
+    '''
+    parser = arguments(__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES),
+                        help='Comma separated movement table sizes to synthesise')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    finish(SUITE, run(sizes, args.min_time), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+'''
+Record the portal pages used as benchmark fixtures
+
+    python -m benchmarks.record                      # offline, from the emulator renderers
+    python -m benchmarks.record --url http://127.0.0.1:8099/PortalCAE-WAR-MODULE --card 33070524
+'''
+import argparse
+import datetime
+
+import requests
+
+from src.tarjeta_metrobus.emulator import (PANAMA,
+                                           EmulatorConfig,
+                                           SyntheticCard,
+                                           render_movements_page,
+                                           render_resume_page,
+                                           render_session_page)
+from src.tarjeta_metrobus.models import Services
+from src.tarjeta_metrobus.parsers import make_soup, parse_ksi
+from src.tarjeta_metrobus.portal import DEFAULT_HEADERS, MOVEMENTS_PAGE, RESUME_PAGE, comerciales_params, session_params
+
+from .pages import FIXTURES
+
+CARD = '33070524'
+RECORDED_AT = PANAMA.localize(datetime.datetime(2024, 6, 1, 12, 0))
+# First line of the pages rendered offline, so they are not mistaken for real portal pages
+SYNTHETIC = '<!-- Synthetic page rendered by src.tarjeta_metrobus.emulator, see benchmarks/record.py -->\n'
+
+
+def record_offline(card_number: str) -> dict:
+    '''
+    Render the pages of a synthetic card with a fixed seed and clock,
+    labelled as synthetic
+
+    Args:
+        card_number (str): Card number
+    Returns:
+        dict: Page name to HTML
+    '''
+    card = SyntheticCard.generate(card_number, EmulatorConfig(seed=0), now=RECORDED_AT)
+
+    return {
+        'session': SYNTHETIC + render_session_page(card, '0123456789ABCDEF0123456789ABCDEF'),
+        'resume': SYNTHETIC + render_resume_page(card),
+        'movements': SYNTHETIC + render_movements_page(card, days=45),
+    }
+
+
+def record_online(url: str, card_number: str) -> dict:
+    '''
+    Download the pages of a card from a running portal
+
+    Args:
+        url (str): Portal base URL
+        card_number (str): Card number
+    Returns:
+        dict: Page name to HTML
+    '''
+    with requests.Session() as session:
+        session.headers.update(DEFAULT_HEADERS)
+        session.get(url, timeout=15)
+
+        pages = {'session': session.get(f'{url}/{Services.SESSION.value}',
+                                        params=session_params(card_number), timeout=15).text}
+        ksi = parse_ksi(make_soup(pages['session'])).ksi
+
+        for name, page in (('resume', RESUME_PAGE), ('movements', MOVEMENTS_PAGE)):
+            params = comerciales_params(ksi, *page).to_dict()
+            pages[name] = session.get(f'{url}/{Services.COMMERCE.value}', params=params, timeout=15).text
+
+    return pages
+
+
+def main():
+    '''
+    Record the fixtures
+    '''
+    parser = argparse.ArgumentParser(description='Record benchmark fixtures')
+    parser.add_argument('--url', help='Portal base URL. Defaults to rendering synthetic pages offline.')
+    parser.add_argument('--card', default=CARD)
+    args = parser.parse_args()
+
+    pages = record_online(args.url.rstrip('/'), args.card) if args.url else record_offline(args.card)
+
+    FIXTURES.mkdir(exist_ok=True)
+    for name, html in pages.items():
+        (FIXTURES / f'{name}.html').write_text(html, encoding='utf-8')
+        print(f'{name}: {len(html)} bytes')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+'''
+Timing, memory and baseline helpers shared by the benchmark suites
+'''
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BASELINE = Path(__file__).parent / 'baseline.json'
+
+
+@dataclass
+class Result:
+    '''
+    Outcome of one benchmark case
+    '''
+    name: str
+    ops_per_sec: float
+    peak_bytes: int
+    # Takes the measurement again, when the case can be re-run in process
+    rerun: Optional[Callable[[], 'Result']] = field(default=None, repr=False, compare=False)
+
+
+def measure(name: str, func: Callable[[], object], min_time: float = 0.5, max_runs: int = 1000,
+            repeats: int = 5) -> Result:
+    '''
+    Time a callable and measure its peak traced memory. The time is split
+    in `repeats` rounds of at least one run each, and the median round
+    rate is reported, so one slow or fast run, e.g. a GC pause or a cold
+    cache, does not skew cases that only run a few times.
+
+    Args:
+        name (str): Case name
+        func (Callable[[], object]): Code under test
+        min_time (float, optional): Seconds to keep repeating for. Defaults to 0.5.
+        max_runs (int, optional): Upper bound on repetitions. Defaults to 1000.
+        repeats (int, optional): Timed rounds. Defaults to 5.
+    Returns:
+        Result
+    '''
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rates = []
+    for _ in range(repeats):
+        runs = 0
+        started = time.perf_counter()
+        elapsed = 0.0
+        while runs < max(1, max_runs // repeats) and (runs == 0 or elapsed < min_time / repeats):
+            func()
+            runs += 1
+            elapsed = time.perf_counter() - started
+        rates.append(runs / elapsed)
+
+    return Result(name=name, ops_per_sec=statistics.median(rates), peak_bytes=peak,
+                  rerun=lambda: measure(name, func, min_time, max_runs, repeats))
+
+
+def load_baseline(suite: str) -> Dict[str, float]:
+    '''
+    Stored ops/sec of a suite
+
+    Args:
+        suite (str): Suite name
+    Returns:
+        Dict[str, float]
+    '''
+    if not BASELINE.exists():
+        return {}
+
+    return json.loads(BASELINE.read_text()).get(suite, {})
+
+
+def save_baseline(suite: str, results: List[Result]) -> None:
+    '''
+    Store the ops/sec of a suite, keeping the other suites
+
+    Args:
+        suite (str): Suite name
+        results (List[Result]): Suite results
+    '''
+    data = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    data[suite] = {result.name: round(result.ops_per_sec, 3) for result in results}
+    BASELINE.write_text(json.dumps(data, indent=2, sort_keys=True) + '\n')
+
+
+def report(suite: str, results: List[Result], tolerance: float) -> List[str]:
+    '''
+    Print results next to the baseline and list the regressions
+
+    Args:
+        suite (str): Suite name
+        results (List[Result]): Suite results
+        tolerance (float): Allowed slowdown, as a fraction of the baseline
+    Returns:
+        List[str]: Names of the cases slower than the baseline allows
+    '''
+    baseline = load_baseline(suite)
+    regressions = []
+
+    print(f'{"case":<48} {"ops/sec":>12} {"baseline":>12} {"change":>8} {"peak KiB":>10}')
+    for result in results:
+        base = baseline.get(result.name)
+        change = ''
+        if base:
+            ratio = result.ops_per_sec / base - 1
+            change = f'{ratio:+.0%}'
+            if ratio < -tolerance:
+                regressions.append(result.name)
+                change += ' !'
+
+        print(f'{result.name:<48} {result.ops_per_sec:>12.2f} {base or "-":>12} {change:>8} '
+              f'{result.peak_bytes / 1024:>10.1f}')
+
+    return regressions
+
+
+def confirm(suite: str, results: List[Result], regressions: List[str], tolerance: float,
+            retries: int) -> List[str]:
+    '''
+    Measure flagged cases again, keeping their fastest rate, so a case
+    slowed down by a passing load spike is not reported as a regression
+
+    Args:
+        suite (str): Suite name
+        results (List[Result]): Suite results
+        regressions (List[str]): Names of the flagged cases
+        tolerance (float): Allowed slowdown, as a fraction of the baseline
+        retries (int): Measurements to take again at most per flagged case
+    Returns:
+        List[str]: Names of the cases still slower than the baseline allows
+    '''
+    baseline = load_baseline(suite)
+    confirmed = []
+
+    for result in results:
+        if result.name not in regressions:
+            continue
+
+        best = result.ops_per_sec
+        for _ in range(retries if result.rerun is not None else 0):
+            best = max(best, result.rerun().ops_per_sec)
+            if best / baseline[result.name] - 1 >= -tolerance:
+                break
+
+        change = best / baseline[result.name] - 1
+        print(f'{result.name:<48} {best:>12.2f} {baseline[result.name]:>12} {change:>+8.0%} (re-measured)')
+        if change < -tolerance:
+            confirmed.append(result.name)
+
+    return confirmed
+
+
+def arguments(description: str) -> argparse.ArgumentParser:
+    '''
+    Command line options common to every suite
+
+    Args:
+        description (str): Suite description
+    Returns:
+        argparse.ArgumentParser
+    '''
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--update-baseline', action='store_true', help='Store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown against the baseline before flagging a case (default 0.25)')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='Times a flagged case is measured again before it counts as a regression (default 3)')
+    parser.add_argument('--report-only', action='store_true',
+                        help='Report regressions without exiting non-zero, e.g. on a shared or busy machine')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Seconds spent on each case')
+    return parser
+
+
+def finish(suite: str, results: List[Result], args: argparse.Namespace) -> None:
+    '''
+    Report a suite and update the baseline if asked. Otherwise flagged cases
+    are measured again, and regressions they confirm exit non-zero unless
+    `--report-only` is given.
+
+    Args:
+        suite (str): Suite name
+        results (List[Result]): Suite results
+        args (argparse.Namespace): Parsed `arguments`
+    '''
+    regressions = report(suite, results, args.tolerance)
+
+    if args.update_baseline:
+        save_baseline(suite, results)
+        print(f'Baseline updated: {BASELINE}')
+        return
+
+    if regressions:
+        print(f'Measuring {len(regressions)} flagged case(s) again')
+        regressions = confirm(suite, results, regressions, args.tolerance, args.retries)
+
+    if regressions:
+        print(f'{len(regressions)} case(s) regressed more than {args.tolerance:.0%}: {", ".join(regressions)}')
+        if not args.report_only:
+            sys.exit(1)
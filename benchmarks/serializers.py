@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+'''
+API serialization benchmarks
+
+    python -m benchmarks.serializers                     # compare with benchmarks/baseline.json
+    python -m benchmarks.serializers --update-baseline   # store a new baseline
+    python -m benchmarks.serializers --report-only       # list regressions without failing
+
+Each model is serialized the way the card API used to (dataclasses_json
+dump, then flask-restx marshalling, then json.dumps) and with the
+precompiled serializers. Both must give the same JSON; a mismatch fails
+the run.
+'''
+import json
+import sys
+from typing import Callable, Dict, List, Tuple
+
+from flask_restx import marshal
+
+from src.apis.card import (card_info_schema,
+                           card_movement_schema,
+                           card_resume_schema,
+                           card_snapshot_schema,
+                           card_stats_schema)
+from src.tarjeta_metrobus.models import CardMovement, CardSnapshot
+from src.tarjeta_metrobus.parsers import (make_soup,
+                                          parse_card_info,
+                                          parse_card_resume,
+                                          parse_card_stats,
+                                          parse_movements)
+from src.tarjeta_metrobus.serializers import dumps, dumps_many
+
+from . import pages
+from .runner import Result, arguments, finish, measure
+
+SUITE = 'serializers'
+SIZES = (1000, 10000)
+
+
+def cases(sizes: List[int]) -> Dict[str, Tuple[Callable[[], object], Callable[[], object]]]:
+    '''
+    Legacy and fast serialization of every model, by case name
+    '''
+    session = make_soup(pages.load('session'))
+    resume = make_soup(pages.load('resume'))
+    recorded = pages.load('movements')
+
+    info = parse_card_info(session)
+    card_resume = parse_card_resume(resume)
+    stats = parse_card_stats(resume)
+    movement_lists = {'recorded': parse_movements(make_soup(recorded))}
+    movement_lists.update({f'{size}rows': parse_movements(make_soup(pages.enlarge_movements(recorded, size)))
+                           for size in sizes})
+    snapshot = CardSnapshot(info=info, resume=card_resume, stats=stats, movements=movement_lists['recorded'])
+
+    result = {
+        'info': (lambda: json.dumps(marshal(info.to_dict(), card_info_schema)),
+                 lambda: dumps(info)),
+        'resume': (lambda: json.dumps(marshal(card_resume.to_dict(), card_resume_schema)),
+                   lambda: dumps(card_resume)),
+        'stats': (lambda: json.dumps(marshal(stats.to_dict(), card_stats_schema)),
+                  lambda: dumps(stats)),
+        'snapshot': (lambda: json.dumps(marshal(snapshot.to_dict(), card_snapshot_schema)),
+                     lambda: dumps(snapshot)),
+    }
+
+    for label, movements in movement_lists.items():
+        result[f'movements/{label}'] = (
+            lambda movements=movements: json.dumps(marshal(CardMovement.schema().dump(movements, many=True),
+                                                           card_movement_schema)),
+            lambda movements=movements: dumps_many(movements, CardMovement))
+
+    return result
+
+
+def check_parity(name: str, legacy: Callable[[], object], fast: Callable[[], object]) -> bool:
+    '''
+    Whether both paths give the same JSON document
+    '''
+    if json.loads(legacy()) != json.loads(fast()):
+        print(f'Serializer parity failure on {name}')
+        return False
+
+    return True
+
+
+def run(sizes: List[int], min_time: float) -> List[Result]:
+    '''
+    Run every case
+    '''
+    suite_cases = cases(sizes)
+
+    if not all([check_parity(name, legacy, fast) for name, (legacy, fast) in suite_cases.items()]):
+        sys.exit(1)
+
+    results = []
+
+    for name, (legacy, fast) in suite_cases.items():
+        results.append(measure(f'{name}/legacy', legacy, min_time))
+        results.append(measure(f'{name}/dumps', fast, min_time))
+
+    return results
+
+
+def main():
+    '''
+    Run the suite
+    '''
+    parser = arguments(__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES),
+                        help='Comma separated movement list sizes to synthesise')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    finish(SUITE, run(sizes, args.min_time), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+'''
+Startup benchmarks
+
+    python -m benchmarks.startup                     # compare with benchmarks/baseline.json
+    python -m benchmarks.startup --update-baseline   # store a new baseline
+    python -m benchmarks.startup --report-only       # list regressions without failing
+
+Each run starts a fresh interpreter that imports the API and serves its
+first card request from the portal emulator: the work a new worker or a
+restarted container does before it is useful. Cases report runs per
+second of the median run, with the peak RSS of the child as peak memory.
+Importing the API must not load the optional heavy modules in DEFERRED;
+finding one of them loaded fails the run.
+'''
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+
+from .runner import Result, arguments, finish
+
+SUITE = 'startup'
+ROOT = Path(__file__).resolve().parent.parent
+CARD = 33070524
+
+# Modules only some requests or modes need, kept out of the API import
+DEFERRED = ('pandas', 'marshmallow_dataclass', 'aiohttp', 'gunicorn', 'pstats')
+
+CHILD = '''
+import json, resource, sys, time
+started = time.perf_counter()
+import src.main
+imported = time.perf_counter()
+response = src.main.app.test_client().get(sys.argv[1])
+served = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'first_request': served - imported,
+    'status': response.status_code,
+    'deferred': [name for name in sys.argv[2:] if name in sys.modules],
+    'maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+'''
+
+
+def free_port() -> int:
+    '''
+    A port nothing listens on
+    '''
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_emulator() -> tuple:
+    '''
+    Run the portal emulator without latency nor errors
+
+    Returns:
+        tuple: Process and portal URL
+    '''
+    port = free_port()
+    process = subprocess.Popen([sys.executable, '-m', 'src.tarjeta_metrobus.emulator', '--port', str(port),
+                                '--latency', '0', '--jitter', '0', '--error-rate', '0', '--missing-rate', '0'],
+                               cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}/PortalCAE-WAR-MODULE'
+
+    deadline = time.monotonic() + 15
+    while True:
+        try:
+            urllib.request.urlopen(url, timeout=1).close()
+            return process, url
+        except OSError:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.kill()
+                raise RuntimeError('The portal emulator did not start')
+            time.sleep(0.1)
+
+
+def cold_start(url: str) -> Dict[str, float]:
+    '''
+    Import the API and serve one request in a new interpreter
+
+    Args:
+        url (str): Portal URL
+    Returns:
+        Dict[str, float]: Child measurements plus the whole process time
+    '''
+    env = dict(os.environ,
+               PYTHONPATH=str(ROOT),
+               TMPMA_PORTAL_URL=url,
+               TMPMA_REFRESH_WORKERS='0',
+               TMPMA_HISTORY_PATH='')
+
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD, f'/api/v1/card/{CARD}/info', *DEFERRED],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    elapsed = time.perf_counter() - started
+
+    measurements = json.loads(output.strip().splitlines()[-1])
+    measurements['process'] = elapsed
+    return measurements
+
+
+def run(runs: int) -> List[Result]:
+    '''
+    Run every case
+    '''
+    emulator, url = start_emulator()
+    try:
+        samples = [cold_start(url) for _ in range(runs)]
+    finally:
+        emulator.kill()
+        emulator.wait()
+
+    failed = False
+    for sample in samples:
+        if sample['status'] != 200:
+            print(f'First request answered {sample["status"]}')
+            failed = True
+        if sample['deferred']:
+            print(f'Importing the API loaded {", ".join(sample["deferred"])}')
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+    # ru_maxrss is in KiB on Linux
+    peak = max(sample['maxrss'] for sample in samples) * 1024
+
+    return [Result(name=case, ops_per_sec=1 / statistics.median(sample[case] for sample in samples), peak_bytes=peak)
+            for case in ('import', 'first_request', 'process')]
+
+
+def main():
+    '''
+    Run the suite
+    '''
+    parser = arguments(__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7, help='Cold starts to take the median of')
+    args = parser.parse_args()
+
+    finish(SUITE, run(args.runs), args)
+
+
+if __name__ == "__main__":
+    main()
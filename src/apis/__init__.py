@@ -7,6 +7,7 @@ from flask_restx import Api
 from .home import api as ns_home
 from .cat import api as ns_cat
 from .card import api as ns_card
+from .profiling import api as ns_profiles
 
 # blueprint = Blueprint('api', __name__, url_prefix='/api/v1')
 
@@ -25,3 +26,4 @@ api = Api(
 api.add_namespace(ns_home, path='/')
 api.add_namespace(ns_cat, path='/cats')
 api.add_namespace(ns_card, path='/card')
+api.add_namespace(ns_profiles, path='/profiles')
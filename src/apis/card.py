@@ -1,39 +1,290 @@
-from flask_restx import Namespace, Resource, fields
+import datetime
+import functools
+import math
+from typing import Any, Callable, Hashable, Iterator, Union
 
+import requests
+from flask import Response, request, stream_with_context
+from flask_restx import Namespace, Resource, fields, inputs
+
+from src.core.cache import StaleWhileRevalidateCache
+from src.core.deadline import DeadlineExceeded, deadline, remaining
+from src.core.governor import UpstreamRejected
+from src.core.http import ENCODINGS, chunked, compress, compress_stream, negotiate_encoding, strong_etag
+from src.core.metrics import Callback
+from src.core.resilience import UpstreamError
+from src.core.scheduler import RefreshScheduler
 from src.tarjeta_metrobus import TarjetaMetrobusPanama
-from src.tarjeta_metrobus.models import CardMovement
+from src.tarjeta_metrobus.models import SNAPSHOT_SECTIONS, CardMovement, Services
+from src.tarjeta_metrobus.portal import snapshot_sections
+from src.tarjeta_metrobus.settings import HISTORY_BATCH_SIZE
+from src.tarjeta_metrobus.utils import PANAMA_TZINFO
+from src.tarjeta_metrobus.serializers import dumps, dumps_csv, dumps_lines, dumps_many
+
+from .settings import (BATCH_MAX_CARDS,
+                       BATCH_TIMEOUT,
+                       BROTLI_QUALITY,
+                       COMPRESS_MIN_SIZE,
+                       EXPORT_CHUNK_SIZE,
+                       GZIP_LEVEL,
+                       REFRESH_IDLE_TTL,
+                       REFRESH_JITTER,
+                       REFRESH_MAX_CARDS,
+                       REFRESH_MAX_INTERVAL,
+                       REFRESH_MIN_INTERVAL,
+                       REFRESH_MIN_REQUESTS,
+                       REFRESH_RATE,
+                       REFRESH_WORKERS,
+                       REQUEST_TIMEOUT,
+                       RESPONSE_CACHE_SIZE,
+                       RESPONSE_CACHE_STALE_TTL,
+                       RESPONSE_CACHE_TTL,
+                       RESPONSE_CACHE_WORKERS)
+
+DEADLINE_HEADER = 'X-Request-Timeout'
+
+# Streamed movement exports: media type and serializer per format
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', dumps_lines),
+    'csv': ('text/csv', dumps_csv),
+}
+
+
+def request_deadline(view: Callable[..., Any]) -> Callable[..., Any]:
+    '''
+    Run a card resource within REQUEST_TIMEOUT seconds, or the `timeout`
+    of its class, or within the shorter budget the client sends in the
+    X-Request-Timeout header
+    '''
+    timeout = getattr(getattr(view, 'view_class', None), 'timeout', REQUEST_TIMEOUT)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        budget = timeout if timeout > 0 else None
+
+        try:
+            asked = float(request.headers.get(DEADLINE_HEADER, ''))
+        except ValueError:
+            asked = None
+
+        if asked is not None and asked > 0:
+            budget = asked if budget is None else min(budget, asked)
+
+        with deadline(budget):
+            return view(*args, **kwargs)
+
+    return wrapper
+
+
+api = Namespace('card', description='Card related operations', decorators=[request_deadline])
+
+
+def get_client() -> TarjetaMetrobusPanama:
+    '''
+    Portal client, created on first use so that importing the API opens
+    no database and forked workers each build their own
+
+    Returns:
+        TarjetaMetrobusPanama
+    '''
+    return TarjetaMetrobusPanama()
+
+
+response_cache = StaleWhileRevalidateCache(maxsize=RESPONSE_CACHE_SIZE,
+                                           stale_ttl=RESPONSE_CACHE_STALE_TTL,
+                                           workers=RESPONSE_CACHE_WORKERS)
+
+
+def refresh_card(number: int) -> None:
+    '''
+    Reload every section of a watched card into the response cache, with
+    the three portal requests of a full snapshot
+
+    Args:
+        number (int): Card number
+    '''
+    snapshot = get_client().get_card_snapshot(number)
+
+    if snapshot is None:
+        return
+
+    for kind in ('info', 'resume', 'stats', 'movements'):
+        response_cache.set((kind, number), getattr(snapshot, kind), ttl=RESPONSE_CACHE_TTL[kind])
+
+    response_cache.set(('snapshot', (number, snapshot_sections())), snapshot, ttl=RESPONSE_CACHE_TTL['snapshot'])
+
+
+refresher = None
+if REFRESH_WORKERS > 0:
+    refresher = RefreshScheduler(refresh_card,
+                                 workers=REFRESH_WORKERS,
+                                 min_interval=REFRESH_MIN_INTERVAL,
+                                 max_interval=REFRESH_MAX_INTERVAL,
+                                 jitter=REFRESH_JITTER,
+                                 idle_ttl=REFRESH_IDLE_TTL,
+                                 max_watched=REFRESH_MAX_CARDS,
+                                 min_requests=REFRESH_MIN_REQUESTS,
+                                 rate=REFRESH_RATE)
+
+
+Callback('tmpma_response_cache_lookups_total', 'Response cache lookups by result', 'counter', ('result',),
+         lambda: {(result,): response_cache.stats()[key]
+                  for result, key in (('hit', 'hits'), ('stale', 'staleHits'), ('miss', 'misses'))})
+Callback('tmpma_response_cache_size', 'Cached responses', 'gauge', (),
+         lambda: {(): len(response_cache)})
+Callback('tmpma_governor_queued', 'Portal requests waiting for admission', 'gauge', ('service',),
+         lambda: {(service.name,): governor.stats()['queued'] for service, governor in get_client().governors.items()})
+Callback('tmpma_circuit_open', 'Whether the circuit breaker of a portal service refuses requests', 'gauge',
+         ('service',),
+         lambda: {(service.name,): int(resilience.breaker.state != 'closed')
+                  for service, resilience in get_client().resilience.items()})
+Callback('tmpma_upstream_retries_total', 'Portal requests retried after a failure', 'counter', ('service',),
+         lambda: {(service.name,): resilience.retries for service, resilience in get_client().resilience.items()})
+Callback('tmpma_upstream_hedges_total', 'Duplicate portal requests started for slow ones', 'counter',
+         ('service',),
+         lambda: {(service.name,): resilience.hedges for service, resilience in get_client().resilience.items()})
+Callback('tmpma_coalesced_lookups_total', 'Lookups that waited on an identical running one', 'counter', (),
+         lambda: {(): get_client().flights.stats()['coalesced']})
+Callback('tmpma_session_pool_idle', 'Warm portal sessions ready', 'gauge', (),
+         lambda: {(): get_client().pool.stats()['idle']})
+
+if refresher is not None:
+    Callback('tmpma_refresh_queue_depth', 'Watched cards due for a refresh and waiting for a worker', 'gauge', (),
+             lambda: {(): refresher.stats()['queueDepth']})
+    Callback('tmpma_refresh_lag_seconds', 'Seconds the most overdue waiting card is late', 'gauge', (),
+             lambda: {(): refresher.stats()['lag']}, aggregate='max')
+    Callback('tmpma_refresh_watched', 'Cards on the refresh watchlist', 'gauge', (),
+             lambda: {(): refresher.stats()['watched']})
+
+
+def cached(kind: str, number: int, loader: Callable[[], Any], params: Hashable = None) -> Any:
+    '''
+    Serve a portal lookup from the response cache, and keep the card on the
+    background refresh watchlist
+
+    Args:
+        kind (str): Kind of data, selects the TTL from RESPONSE_CACHE_TTL
+        number (int): Card number
+        loader (Callable[[], Any]): Portal lookup
+        params (Hashable, optional): Lookup parameters besides the card. Defaults to None.
+    Returns:
+        Any: Lookup result
+    '''
+    if refresher is not None:
+        refresher.touch(number)
 
-api = Namespace('card', description='Card related operations')
+    key = number if params is None else (number, params)
+    return response_cache.get_or_load((kind, key), loader, ttl=RESPONSE_CACHE_TTL[kind])
+
+
+def json_response(body: bytes) -> Response:
+    '''
+    Wrap serialized JSON in a response, skipping flask-restx marshalling.
+
+    The response carries a strong ETag of the JSON, and a client sending it
+    back in If-None-Match gets an empty 304 instead. Bodies of at least
+    COMPRESS_MIN_SIZE bytes are compressed for clients accepting br or
+    gzip; the encoding is appended to their ETag, as the bytes differ.
+
+    Args:
+        body (bytes): JSON from `dumps` or `dumps_many`
+    Returns:
+        Response
+    '''
+    tag = strong_etag(body)
+    encoding = negotiate_encoding(request.accept_encodings) if len(body) >= COMPRESS_MIN_SIZE else None
+    headers = {'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+
+    if any(request.if_none_match.contains(variant) for variant in (tag, *(f'{tag}-{name}' for name in ENCODINGS))):
+        response = Response(status=304, headers=headers)
+    else:
+        if encoding is not None:
+            body = compress(body, encoding, BROTLI_QUALITY if encoding == 'br' else GZIP_LEVEL)
+            headers['Content-Encoding'] = encoding
+        response = Response(body, mimetype='application/json', headers=headers)
+
+    response.set_etag(tag if encoding is None else f'{tag}-{encoding}')
+    return response
+
+
+def export_response(movements: Iterator[CardMovement], export_format: str, filename: str) -> Response:
+    '''
+    Stream movements as they are produced, in chunks of EXPORT_CHUNK_SIZE
+    bytes, compressed for clients accepting br or gzip
+
+    Args:
+        movements (Iterator[CardMovement]): Movements
+        export_format (str): One of EXPORT_FORMATS
+        filename (str): Download name, without extension
+    Returns:
+        Response
+    '''
+    mimetype, dump = EXPORT_FORMATS[export_format]
+    body = chunked(dump(movements, CardMovement), EXPORT_CHUNK_SIZE)
+    headers = {
+        'Vary': 'Accept-Encoding',
+        'Cache-Control': 'no-cache',
+        'Content-Disposition': f'attachment; filename={filename}.{export_format}',
+    }
+
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is not None:
+        body = compress_stream(body, encoding, BROTLI_QUALITY if encoding == 'br' else GZIP_LEVEL)
+        headers['Content-Encoding'] = encoding
+
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+
+def panama_datetime(value: Union[datetime.datetime, None]) -> Union[datetime.datetime, None]:
+    '''
+    Read a naive query datetime as Panama time
+
+    Args:
+        value (Union[datetime.datetime, None]): Parsed query argument
+    Returns:
+        Union[datetime.datetime, None]
+    '''
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=PANAMA_TZINFO)
+
+    return value
 
-tmpma = TarjetaMetrobusPanama()
 
 card_info_schema = api.model('CardInfo', {
     'noTarjeta': fields.String(description='The card number'),
     'estadoDeContrato': fields.String(description='The card status'),
-    'saldoTarjeta': fields.String(description='The card balance'),
-    'fechaSaldo': fields.String(description='The card last date'),
+    'saldoTarjeta': fields.String(description='The card balance, as the portal shows it'),
+    'fechaSaldo': fields.String(description='The card last date, as the portal shows it'),
+    'saldoTarjetaValue': fields.String(description='The card balance as a decimal number'),
+    'fechaSaldoValue': fields.String(description='The card last date in ISO 8601'),
 })
 
 card_resume_schema = api.model('CardResume', {
     'noTarjeta': fields.String(description='The card number'),
     'estadoTarjeta': fields.String(description='The card status'),
     'tipoDeTarjeta': fields.String(description='The card type'),
-    'saldoTarjeta': fields.String(description='The card balance')
+    'saldoTarjeta': fields.String(description='The card balance, as the portal shows it'),
+    'saldoTarjetaValue': fields.String(description='The card balance as a decimal number')
 })
 
 card_movement_schema = api.model('CardMovement', {
     'noTransaccion': fields.String(description='The transaction number'),
     'movimiento': fields.String(description='The transaction type'),
-    'fechaYHora': fields.String(description='The transaction datetime'),
+    'fechaYHora': fields.String(description='The transaction datetime, as the portal shows it'),
     'lugar': fields.String(description='The transaction place'),
-    'monto': fields.String(description='The transaction amount'),
-    'saldoTarjeta': fields.String(description='The card balance after transaction')
+    'monto': fields.String(description='The transaction amount, as the portal shows it'),
+    'saldoTarjeta': fields.String(description='The card balance after transaction, as the portal shows it'),
+    'fechaYHoraValue': fields.String(description='The transaction datetime in ISO 8601'),
+    'montoValue': fields.String(description='The transaction amount as a decimal number'),
+    'saldoTarjetaValue': fields.String(description='The card balance after transaction as a decimal number')
 })
 
 card_stat_schema = api.model('CardStats', {
     'month': fields.String(),
     'amount': fields.String(),
-    'count': fields.String()
+    'count': fields.String(),
+    'amountValue': fields.String(description='The amount as a decimal number'),
+    'countValue': fields.Integer()
 })
 
 card_stats_schema = api.model('CardStats', {
@@ -41,6 +292,105 @@ card_stats_schema = api.model('CardStats', {
     'charges': fields.List(fields.Nested(card_stat_schema)),
 })
 
+card_snapshot_schema = api.model('CardSnapshot', {
+    'info': fields.Nested(card_info_schema, allow_null=True),
+    'resume': fields.Nested(card_resume_schema, allow_null=True),
+    'stats': fields.Nested(card_stats_schema, allow_null=True),
+    'movements': fields.List(fields.Nested(card_movement_schema), allow_null=True),
+})
+
+card_batch_request_schema = api.model('CardBatchRequest', {
+    'cards': fields.List(fields.String, required=True, description='The card numbers'),
+    'sections': fields.List(fields.String, description=f'Any of {", ".join(SNAPSHOT_SECTIONS)}. Defaults to all.'),
+})
+
+card_batch_result_schema = api.model('CardBatchResult', {
+    'card': fields.String(description='The card number'),
+    'snapshot': fields.Nested(card_snapshot_schema, allow_null=True),
+    'error': fields.String(description='Why the card could not be fetched'),
+})
+
+cache_stats_schema = api.model('CacheStats', {
+    'size': fields.Integer(description='Cached responses'),
+    'maxsize': fields.Integer(description='Cache capacity'),
+    'hits': fields.Integer(description='Fresh hits'),
+    'staleHits': fields.Integer(description='Stale responses served while refreshing'),
+    'misses': fields.Integer(description='Lookups that waited on the portal'),
+    'refreshing': fields.Integer(description='Background refreshes in flight'),
+    'refreshErrors': fields.Integer(description='Background refreshes that failed'),
+})
+
+governor_stats_schema = api.model('GovernorStats', {
+    'inFlight': fields.Integer(description='Portal requests running'),
+    'queued': fields.Integer(description='Portal requests waiting for admission'),
+    'backgroundQueued': fields.Integer(description='Background refresh requests waiting for admission'),
+    'tokens': fields.Float(description='Requests that may start right away'),
+    'admitted': fields.Integer(description='Portal requests admitted'),
+    'rejected': fields.Integer(description='Portal requests turned away'),
+    'expired': fields.Integer(description='Portal requests whose request deadline ended the wait'),
+    'waitTime': fields.Float(description='Seconds spent waiting by admitted requests'),
+})
+
+coalescing_stats_schema = api.model('CoalescingStats', {
+    'inFlight': fields.Integer(description='Distinct lookups running'),
+    'calls': fields.Integer(description='Lookups that ran'),
+    'coalesced': fields.Integer(description='Lookups that waited on an identical running one'),
+})
+
+resilience_stats_schema = api.model('ResilienceStats', {
+    'circuit': fields.String(description='Circuit breaker state: closed, open or half_open'),
+    'failures': fields.Integer(description='Consecutive failed portal requests'),
+    'opened': fields.Integer(description='Times the circuit opened'),
+    'refused': fields.Integer(description='Requests refused while the circuit was open'),
+    'calls': fields.Integer(description='Portal calls, each made of one or more attempts'),
+    'retries': fields.Integer(description='Attempts retried after a failure'),
+    'hedges': fields.Integer(description='Duplicate attempts started for slow requests'),
+    'hedgeWins': fields.Integer(description='Hedged attempts that answered first'),
+    'hedgeDelay': fields.Float(description='Seconds after which a request is hedged, null when not hedging'),
+})
+
+upstream_stats_schema = api.model('UpstreamStats', {
+    **{service.name: fields.Nested(governor_stats_schema) for service in Services},
+    'coalescing': fields.Nested(coalescing_stats_schema),
+    'resilience': fields.Nested(api.model('UpstreamResilience', {
+        service.name: fields.Nested(resilience_stats_schema) for service in Services
+    })),
+})
+
+refresh_stats_schema = api.model('RefreshStats', {
+    'watched': fields.Integer(description='Cards on the watchlist'),
+    'queueDepth': fields.Integer(description='Cards due for a refresh and waiting for a worker'),
+    'running': fields.Integer(description='Refreshes in flight'),
+    'lag': fields.Float(description='Seconds the most overdue waiting card is late'),
+    'lastLag': fields.Float(description='Seconds the last started refresh was late'),
+    'refreshes': fields.Integer(description='Refreshes done'),
+    'refreshErrors': fields.Integer(description='Refreshes that failed'),
+    'dropped': fields.Integer(description='Cards that left the watchlist'),
+})
+
+history_sync_schema = api.model('HistorySync', {
+    'new': fields.Integer(description='Movements stored by this sync'),
+    'total': fields.Integer(description='Movements stored for the card'),
+})
+
+snapshot_parser = api.parser()
+snapshot_parser.add_argument('sections', type=str, location='args',
+                             help=f'Comma separated sections: {", ".join(SNAPSHOT_SECTIONS)}. Defaults to all.')
+
+transactions_parser = api.parser()
+transactions_parser.add_argument('since', type=inputs.datetime_from_iso8601, location='args',
+                                 help='Only movements at or after this time, ISO 8601. '
+                                      'Panama time when no offset is given.')
+transactions_parser.add_argument('after', type=str, location='args',
+                                 help='Only movements newer than this transaction number')
+
+history_parser = api.parser()
+history_parser.add_argument('from', type=inputs.datetime_from_iso8601, location='args', dest='start',
+                            help='Earliest movement, ISO 8601, inclusive. Panama time when no offset is given.')
+history_parser.add_argument('to', type=inputs.datetime_from_iso8601, location='args', dest='end',
+                            help='Latest movement, ISO 8601, exclusive. Panama time when no offset is given.')
+history_parser.add_argument('limit', type=inputs.positive, location='args', help='Maximum number of movements')
+
 
 @api.route('/info/<int:number>', '/<int:number>/info')
 @api.param('number', 'The card identifier')
@@ -48,14 +398,14 @@ card_stats_schema = api.model('CardStats', {
 class CardInfo(Resource):
     '''Card information'''
     @api.doc('get_card_info')
-    @api.marshal_with(card_info_schema)
+    @api.response(200, 'Success', card_info_schema)
     def get(self, number):
         '''Fetch a card given its identifier'''
-        card_info = tmpma.get_card_info(number)
+        card_info = cached('info', number, lambda: get_client().get_card_info(number))
         if card_info is None:
             api.abort(404)
 
-        return card_info.to_dict()
+        return json_response(dumps(card_info))
 
 
 @api.route('/card_resume/<int:number>', '/<int:number>/resume')
@@ -64,28 +414,54 @@ class CardInfo(Resource):
 class CardResume(Resource):
     '''Card resume'''
     @api.doc('get_card_resume')
-    @api.marshal_with(card_resume_schema)
+    @api.response(200, 'Success', card_resume_schema)
     def get(self, number):
         '''Fetch a card resume given its identifier'''
-        card_resume = tmpma.get_card_resume(number)
+        card_resume = cached('resume', number, lambda: get_client().get_card_resume(number))
         if card_resume is None:
             api.abort(404)
 
-        return card_resume.to_dict()
+        return json_response(dumps(card_resume))
 
 
 @api.route('/trx/<int:number>', '/<int:number>/trx', '/<int:number>/transactions')
 class CardTransactions(Resource):
     '''Card transactions'''
     @api.doc('list_transactions')
-    @api.marshal_list_with(card_movement_schema)
+    @api.expect(transactions_parser)
+    @api.response(200, 'Success', [card_movement_schema])
     def get(self, number):
         '''List all transactions'''
-        transactions = tmpma.get_movements(number)
+        args = transactions_parser.parse_args()
+        since = panama_datetime(args['since']) or args['after'] or None
+
+        transactions = cached('movements', number, lambda: get_client().get_movements(number, since), since)
+        if transactions is None:
+            api.abort(404)
+
+        return json_response(dumps_many(transactions, CardMovement))
+
+
+@api.route('/<int:number>/transactions.<any(ndjson, csv):export_format>')
+@api.param('number', 'The card identifier')
+@api.param('export_format', 'ndjson or csv')
+@api.response(404, 'Card not found')
+class CardTransactionsExport(Resource):
+    '''Card transactions export'''
+    @api.doc('export_transactions')
+    @api.expect(transactions_parser)
+    @api.response(200, 'One movement per line, newest first, streamed as the portal table is read')
+    @api.produces(['application/x-ndjson', 'text/csv'])
+    def get(self, number, export_format):
+        '''Export all transactions'''
+        args = transactions_parser.parse_args()
+        since = panama_datetime(args['since']) or args['after'] or None
+
+        transactions = get_client().iter_movements(number, since)
         if transactions is None:
             api.abort(404)
 
-        return CardMovement.schema().dump(transactions, many=True)
+        return export_response(transactions, export_format, f'{number}-transactions')
 
 
 @api.route('/resume/<int:number>', '/<int:number>/uses', '/<int:number>/stats', '/stats/<int:number>')
@@ -94,11 +470,196 @@ class CardTransactions(Resource):
 class CardStats(Resource):
     '''Card stats'''
     @api.doc('get_card_stats')
-    @api.marshal_with(card_stats_schema)
+    @api.response(200, 'Success', card_stats_schema)
     def get(self, number):
         '''Fetch a card resume given its identifier'''
-        card_resume = tmpma.get_card_resume_uses_charges(number)
+        card_resume = cached('stats', number, lambda: get_client().get_card_resume_uses_charges(number))
         if card_resume is None:
             api.abort(404)
 
-        return card_resume.to_dict()
+        return json_response(dumps(card_resume))
+
+
+@api.route('/snapshot/<int:number>', '/<int:number>/snapshot')
+@api.param('number', 'The card identifier')
+@api.response(400, 'Unknown section')
+@api.response(404, 'Card not found')
+class CardSnapshot(Resource):
+    '''Card snapshot'''
+    @api.doc('get_card_snapshot')
+    @api.expect(snapshot_parser)
+    @api.response(200, 'Success', card_snapshot_schema)
+    def get(self, number):
+        '''Fetch several card sections at once, with the fewest portal requests'''
+        args = snapshot_parser.parse_args()
+        sections = None
+        if args['sections']:
+            sections = [section.strip() for section in args['sections'].split(',') if section.strip()]
+
+        try:
+            sections = snapshot_sections(sections)
+        except ValueError as error:
+            api.abort(400, str(error))
+
+        snapshot = cached('snapshot', number, lambda: get_client().get_card_snapshot(number, sections), sections)
+
+        if snapshot is None:
+            api.abort(404)
+
+        return json_response(dumps(snapshot))
+
+
+@api.route('/<int:number>/history')
+@api.param('number', 'The card identifier')
+@api.response(404, 'Movement history is disabled')
+class CardHistory(Resource):
+    '''Card movement history'''
+    @api.doc('list_history')
+    @api.expect(history_parser)
+    @api.response(200, 'Success', [card_movement_schema])
+    def get(self, number):
+        '''List stored movements, newest first, without querying the portal'''
+        if get_client().history is None:
+            api.abort(404, 'Movement history is disabled')
+
+        args = history_parser.parse_args()
+        movements = get_client().history.movements(number,
+                                                   start=panama_datetime(args['start']),
+                                                   end=panama_datetime(args['end']),
+                                                   limit=args['limit'])
+
+        return json_response(dumps_many(movements, CardMovement))
+
+
+@api.route('/<int:number>/history.<any(ndjson, csv):export_format>')
+@api.param('number', 'The card identifier')
+@api.param('export_format', 'ndjson or csv')
+@api.response(404, 'Movement history is disabled')
+class CardHistoryExport(Resource):
+    '''Card movement history export'''
+    @api.doc('export_history')
+    @api.expect(history_parser)
+    @api.response(200, 'One movement per line, newest first, streamed from the history in batches')
+    @api.produces(['application/x-ndjson', 'text/csv'])
+    def get(self, number, export_format):
+        '''Export stored movements, newest first, without querying the portal'''
+        if get_client().history is None:
+            api.abort(404, 'Movement history is disabled')
+
+        args = history_parser.parse_args()
+        movements = get_client().history.iter_movements(number,
+                                                        start=panama_datetime(args['start']),
+                                                        end=panama_datetime(args['end']),
+                                                        limit=args['limit'],
+                                                        batch_size=HISTORY_BATCH_SIZE)
+
+        return export_response(movements, export_format, f'{number}-history')
+
+
+@api.route('/<int:number>/history/sync')
+@api.param('number', 'The card identifier')
+@api.response(404, 'Card not found or movement history disabled')
+class CardHistorySync(Resource):
+    '''Card movement history sync'''
+    @api.doc('sync_history')
+    @api.marshal_with(history_sync_schema)
+    def post(self, number):
+        '''Fetch the card movements and store the new ones'''
+        if get_client().history is None:
+            api.abort(404, 'Movement history is disabled')
+
+        new = get_client().sync_movements(number)
+        if new is None:
+            api.abort(404)
+
+        return {'new': new, 'total': get_client().history.count(number)}
+
+
+@api.errorhandler(UpstreamRejected)
+def upstream_rejected(error):
+    '''Portal requests are being shed, or the portal is down, ask the client to come back later'''
+    return {'message': str(error)}, 503, {'Retry-After': str(math.ceil(getattr(error, 'retry_after', 1)))}
+
+
+@api.errorhandler(DeadlineExceeded)
+def deadline_exceeded(error):
+    '''The request ran out of time before the portal answered'''
+    return {'message': str(error)}, 504
+
+
+@api.errorhandler(UpstreamError)
+@api.errorhandler(requests.RequestException)
+def upstream_failed(error):
+    '''The portal kept failing after the retries'''
+    return {'message': f'Portal request failed: {error}'}, 502
+
+
+@api.route('/upstream')
+class CardUpstream(Resource):
+    '''Portal request governors'''
+    @api.doc('get_card_upstream_stats')
+    @api.marshal_with(upstream_stats_schema)
+    def get(self):
+        '''Admission, retry and circuit breaker counters of each portal service, and lookup coalescing counters'''
+        stats = {service.name: governor.stats() for service, governor in get_client().governors.items()}
+        stats['coalescing'] = get_client().flights.stats()
+        stats['resilience'] = {service.name: resilience.stats()
+                               for service, resilience in get_client().resilience.items()}
+
+        return stats
+
+
+@api.route('/refresh')
+@api.response(404, 'Background refresh is disabled')
+class CardRefresh(Resource):
+    '''Card background refresh'''
+    @api.doc('get_card_refresh_stats')
+    @api.marshal_with(refresh_stats_schema)
+    def get(self):
+        '''Watchlist size, refresh queue depth and lag'''
+        if refresher is None:
+            api.abort(404, 'Background refresh is disabled')
+
+        return refresher.stats()
+
+
+@api.route('/cache')
+class CardCache(Resource):
+    '''Card response cache'''
+    @api.doc('get_card_cache_stats')
+    @api.marshal_with(cache_stats_schema)
+    def get(self):
+        '''Response cache hit and miss counters'''
+        return response_cache.stats()
+
+
+@api.route('/batch')
+@api.response(400, 'Invalid batch')
+class CardBatch(Resource):
+    '''Card batch lookup'''
+    timeout = BATCH_TIMEOUT
+
+    @api.doc('get_card_batch')
+    @api.expect(card_batch_request_schema, validate=True)
+    @api.response(200, 'One JSON CardBatchResult per line, in completion order', card_batch_result_schema)
+    @api.produces(['application/x-ndjson'])
+    def post(self):
+        '''Fetch snapshots of many cards, streamed as they complete'''
+        body = request.get_json()
+        cards = [str(card) for card in body['cards']]
+
+        if len(cards) > BATCH_MAX_CARDS:
+            api.abort(400, f'At most {BATCH_MAX_CARDS} cards per batch')
+
+        try:
+            capacity = get_client().batch_capacity(body.get('sections'), remaining())
+        except ValueError as error:
+            api.abort(400, str(error))
+
+        if capacity is not None and len(set(cards)) > capacity:
+            api.abort(400, f'At most {capacity} cards can be looked up within the batch time budget')
+
+        results = get_client().get_card_snapshots(cards, body.get('sections'))
+
+        lines = (dumps(result) + b'\n' for result in results)
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
@@ -7,8 +7,6 @@ from dataclasses import dataclass
 from dataclasses_json import DataClassJsonMixin
 from flask_restx import Namespace, Resource, fields
 
-import marshmallow_dataclass
-
 api = Namespace('home', description='', path='')
 
 info = api.model('Info', {
@@ -30,7 +28,16 @@ class Info(DataClassJsonMixin):
     license: str
 
 
-InfoSchema = marshmallow_dataclass.class_schema(Info)
+def __getattr__(name: str):
+    # InfoSchema is built on first access, keeping marshmallow_dataclass and
+    # the schema generation out of the API import
+    if name == 'InfoSchema':
+        import marshmallow_dataclass
+
+        schema = globals()['InfoSchema'] = marshmallow_dataclass.class_schema(Info)
+        return schema
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 @api.route('/')
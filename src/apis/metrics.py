@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+'''
+Request metrics of the API and the Prometheus `/metrics` endpoint
+'''
+import time
+
+from flask import Flask, Response, g, request
+
+from src.core.metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram
+
+REQUEST_SECONDS = Histogram('tmpma_http_request_seconds', 'API request latency', ('method', 'endpoint'))
+REQUESTS = Counter('tmpma_http_requests_total', 'API requests by response status', ('method', 'endpoint', 'status'))
+REQUESTS_IN_FLIGHT = Gauge('tmpma_http_requests_in_flight', 'API requests being served')
+
+
+def endpoint() -> str:
+    '''
+    Route of the current request, so card numbers do not become label values
+    '''
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def before_request() -> None:
+    g.metrics_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.labels().inc()
+
+
+def after_request(response: Response) -> Response:
+    started = g.pop('metrics_started', None)
+
+    if started is not None:
+        route = endpoint()
+        REQUEST_SECONDS.labels(request.method, route).observe(time.perf_counter() - started)
+        REQUESTS.labels(request.method, route, response.status_code).inc()
+
+    return response
+
+
+def teardown_request(_error: BaseException = None) -> None:
+    REQUESTS_IN_FLIGHT.labels().dec()
+
+
+def metrics() -> Response:
+    '''
+    Every registered metric in the Prometheus text format
+    '''
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+def init_app(app: Flask) -> None:
+    '''
+    Record request metrics of an app and serve them at `/metrics`
+
+    Args:
+        app (Flask): Application
+    '''
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
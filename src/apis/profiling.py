@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+'''
+On-demand CPU profiling of API requests
+
+A request is profiled when it carries `X-Profile-Token: <TMPMA_PROFILE_TOKEN>`
+or is picked by the TMPMA_PROFILE_SAMPLE_RATE sampling. Profiling stops once
+the response body is sent, so streamed exports are profiled whole. The
+profile is kept in the TMPMA_PROFILE_DIR ring, its id returned in the
+`X-Profile-Id` response header, and it can be listed, downloaded or summarized from the
+`profiles` namespace with the same token header.
+
+cProfile records every thread of the interpreter, so one request is
+profiled at a time and its profile also holds what other threads did
+meanwhile.
+'''
+import cProfile
+import hmac
+import random
+import threading
+import time
+
+from flask import Flask, Response, g, request, send_file
+from flask_restx import Namespace, Resource, fields, inputs
+
+from src.core.profiling import SORT_KEYS, ProfileRing
+
+from .settings import PROFILE_DIR, PROFILE_KEEP, PROFILE_SAMPLE_RATE, PROFILE_TOKEN
+
+TOKEN_HEADER = 'X-Profile-Token'
+
+api = Namespace('profiles', description='Request CPU profiles')
+
+ring = ProfileRing(PROFILE_DIR, keep=PROFILE_KEEP)
+
+# Held while a request is being profiled
+_profiling = threading.Lock()
+
+
+def authorized() -> bool:
+    '''
+    Whether the current request carries the profiling token
+    '''
+    token = request.headers.get(TOKEN_HEADER)
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def before_request() -> None:
+    if not (authorized() or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)):
+        return
+
+    if not _profiling.acquire(blocking=False):
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler, e.g. a debugger, is active
+        _profiling.release()
+        return
+
+    g.profiler = profiler
+    g.profile_started = time.perf_counter()
+
+
+def after_request(response: Response) -> Response:
+    profiler = g.pop('profiler', None)
+
+    if profiler is None:
+        return response
+
+    started = g.pop('profile_started')
+    profile_id = ring.new_id()
+    meta = {
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'status': response.status_code,
+        'sampled': not authorized(),
+    }
+
+    def finish() -> None:
+        # Runs once the body is sent, so streamed bodies are profiled too
+        try:
+            profiler.disable()
+            ring.save(profiler, {**meta, 'seconds': round(time.perf_counter() - started, 6)}, profile_id)
+        except OSError:
+            # A full or read-only disk must not fail the request
+            pass
+        finally:
+            _profiling.release()
+
+    response.call_on_close(finish)
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+def teardown_request(_error: BaseException = None) -> None:
+    profiler = g.pop('profiler', None)
+
+    if profiler is not None:
+        profiler.disable()
+        _profiling.release()
+
+
+def init_app(app: Flask) -> None:
+    '''
+    Profile the requests of an app on demand
+
+    Args:
+        app (Flask): Application
+    '''
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
+
+
+profile_schema = api.model('Profile', {
+    'id': fields.String(description='Profile id'),
+    'created': fields.Float(description='Unix time the profile was stored'),
+    'method': fields.String(description='Request method'),
+    'path': fields.String(description='Request path and query'),
+    'status': fields.Integer(description='Response status'),
+    'seconds': fields.Float(description='Profiled request duration'),
+    'sampled': fields.Boolean(description='Picked by sampling rather than asked for'),
+})
+
+summary_parser = api.parser()
+summary_parser.add_argument('sort', type=str, location='args', default='cumulative', choices=SORT_KEYS,
+                            help='pstats sort key')
+summary_parser.add_argument('limit', type=inputs.positive, location='args', default=40,
+                            help='Number of functions')
+
+
+def check_token() -> None:
+    '''
+    Abort unless profiling is enabled and the token is given
+    '''
+    if not PROFILE_TOKEN:
+        api.abort(404, 'Profiling is disabled')
+
+    if not authorized():
+        api.abort(403, f'Missing or wrong {TOKEN_HEADER} header')
+
+
+@api.route('/')
+@api.header(TOKEN_HEADER, 'Profiling token', required=True)
+@api.response(403, 'Missing or wrong token')
+class Profiles(Resource):
+    '''Stored profiles'''
+    @api.doc('list_profiles')
+    @api.marshal_list_with(profile_schema)
+    def get(self):
+        '''List stored profiles, newest first'''
+        check_token()
+        return ring.list()
+
+
+@api.route('/<string:profile_id>')
+@api.param('profile_id', 'The profile id')
+@api.header(TOKEN_HEADER, 'Profiling token', required=True)
+@api.response(403, 'Missing or wrong token')
+@api.response(404, 'Profile not found')
+class Profile(Resource):
+    '''Stored profile'''
+    @api.doc('get_profile')
+    @api.produces(['application/octet-stream'])
+    def get(self, profile_id):
+        '''Download a profile, for pstats or snakeviz'''
+        check_token()
+        if ring.meta(profile_id) is None:
+            api.abort(404)
+
+        return send_file(ring.path(profile_id), mimetype='application/octet-stream',
+                         as_attachment=True, download_name=f'{profile_id}.prof')
+
+
+@api.route('/<string:profile_id>/summary')
+@api.param('profile_id', 'The profile id')
+@api.header(TOKEN_HEADER, 'Profiling token', required=True)
+@api.response(403, 'Missing or wrong token')
+@api.response(404, 'Profile not found')
+class ProfileSummary(Resource):
+    '''Stored profile summary'''
+    @api.doc('get_profile_summary')
+    @api.expect(summary_parser)
+    @api.produces(['text/plain'])
+    def get(self, profile_id):
+        '''Most expensive functions of a profile'''
+        check_token()
+        args = summary_parser.parse_args()
+        summary = ring.summary(profile_id, sort=args['sort'], limit=args['limit'])
+
+        if summary is None:
+            api.abort(404)
+
+        return Response(summary, mimetype='text/plain')
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+'''
+Settings for the API, read from the environment
+'''
+import os
+import tempfile
+
+from src.core.utils import available_cpus, env_float, env_int, env_str
+
+# Seconds a card request may take in total, below the load balancer timeout. Clients may ask for less
+# with an X-Request-Timeout header. 0 disables the deadline
+REQUEST_TIMEOUT = env_float('TMPMA_REQUEST_TIMEOUT', 25)
+
+# Smallest card response body, in bytes, compressed for clients accepting br or gzip
+COMPRESS_MIN_SIZE = env_int('TMPMA_COMPRESS_MIN_SIZE', 1024)
+# gzip level (1-9) and brotli quality (0-11) of card responses, trading CPU for size
+GZIP_LEVEL = env_int('TMPMA_GZIP_LEVEL', 6)
+BROTLI_QUALITY = env_int('TMPMA_BROTLI_QUALITY', 4)
+# Bytes of rows gathered before a streamed movement export sends them
+EXPORT_CHUNK_SIZE = env_int('TMPMA_EXPORT_CHUNK_SIZE', 16384)
+
+# Maximum number of card responses kept in memory
+RESPONSE_CACHE_SIZE = env_int('TMPMA_RESPONSE_CACHE_SIZE', 4096)
+# Seconds an expired response is still served while it is refreshed
+RESPONSE_CACHE_STALE_TTL = env_float('TMPMA_RESPONSE_CACHE_STALE_TTL', 300)
+# Threads refreshing stale responses
+RESPONSE_CACHE_WORKERS = env_int('TMPMA_RESPONSE_CACHE_WORKERS', 4)
+# Seconds a response is fresh, per kind of data
+RESPONSE_CACHE_TTL = {
+    'info': env_float('TMPMA_RESPONSE_CACHE_TTL_INFO', 30),
+    'resume': env_float('TMPMA_RESPONSE_CACHE_TTL_RESUME', 30),
+    'movements': env_float('TMPMA_RESPONSE_CACHE_TTL_MOVEMENTS', 60),
+    'stats': env_float('TMPMA_RESPONSE_CACHE_TTL_STATS', 3600),
+    'snapshot': env_float('TMPMA_RESPONSE_CACHE_TTL_SNAPSHOT', 30),
+}
+
+# Maximum number of cards accepted by one batch request
+BATCH_MAX_CARDS = env_int('TMPMA_BATCH_MAX_CARDS', 500)
+# Seconds a batch request may take, instead of REQUEST_TIMEOUT. Batches with more cards than the
+# portal governors admit in that time are refused
+BATCH_TIMEOUT = env_float('TMPMA_BATCH_TIMEOUT', 120)
+
+# Threads refreshing watched cards in the background, 0 disables the refresh
+REFRESH_WORKERS = env_int('TMPMA_REFRESH_WORKERS', 2)
+# Bounds, in seconds, of the refresh interval of a watched card
+REFRESH_MIN_INTERVAL = env_float('TMPMA_REFRESH_MIN_INTERVAL', 30)
+REFRESH_MAX_INTERVAL = env_float('TMPMA_REFRESH_MAX_INTERVAL', 900)
+# Random spread of each refresh interval, as a fraction of it
+REFRESH_JITTER = env_float('TMPMA_REFRESH_JITTER', 0.2)
+# Seconds without requests before a card leaves the watchlist, by default as long as a stale
+# response is still served
+REFRESH_IDLE_TTL = env_float('TMPMA_REFRESH_IDLE_TTL', RESPONSE_CACHE_STALE_TTL)
+# Requests, each within REFRESH_IDLE_TTL of the previous one, before a card is watched
+REFRESH_MIN_REQUESTS = env_int('TMPMA_REFRESH_MIN_REQUESTS', 2)
+# Background refreshes started per second at most, each a three-request snapshot. 0 for no limit
+REFRESH_RATE = env_float('TMPMA_REFRESH_RATE', 1)
+# Maximum number of watched cards
+REFRESH_MAX_CARDS = env_int('TMPMA_REFRESH_MAX_CARDS', 10000)
+
+# Token that requests send in X-Profile-Token to be profiled and to read profiles. Empty disables the endpoints
+PROFILE_TOKEN = env_str('TMPMA_PROFILE_TOKEN', '')
+# Fraction of requests profiled without asking, e.g. 0.001
+PROFILE_SAMPLE_RATE = env_float('TMPMA_PROFILE_SAMPLE_RATE', 0)
+# Directory keeping the last PROFILE_KEEP profiles
+PROFILE_DIR = env_str('TMPMA_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'tmpma-profiles'))
+PROFILE_KEEP = env_int('TMPMA_PROFILE_KEEP', 50)
+
+# Directory where the production workers share their metrics, so /metrics answers with the totals
+# of every worker whichever one serves the scrape. Emptied when the server starts. Empty leaves each
+# worker with its own metrics, and then every worker must be scraped on its own
+METRICS_DIR = env_str('TMPMA_METRICS_DIR', os.path.join(tempfile.gettempdir(), 'tmpma-metrics'))
+# Seconds between the metric snapshots each worker writes there: how far behind the other workers
+# a scrape may be
+METRICS_SHARE_INTERVAL = env_float('TMPMA_METRICS_SHARE_INTERVAL', 5)
+
+# Server run by the `app` script: 'development' (Flask debug server) or 'production' (gunicorn)
+SERVER_MODE = env_str('TMPMA_SERVER_MODE', 'development')
+# Production worker processes, one per usable CPU by default
+SERVER_WORKERS = env_int('TMPMA_SERVER_WORKERS', available_cpus())
+# Threads per worker, serving requests while others wait on the portal
+SERVER_THREADS = env_int('TMPMA_SERVER_THREADS', 8)
+# Seconds a worker may go silent before it is killed and replaced
+SERVER_TIMEOUT = env_int('TMPMA_SERVER_TIMEOUT', 60)
+# Seconds workers get to finish their requests on restart or shutdown
+SERVER_GRACEFUL_TIMEOUT = env_int('TMPMA_SERVER_GRACEFUL_TIMEOUT', 30)
+# Seconds an idle client connection is kept open
+SERVER_KEEPALIVE = env_int('TMPMA_SERVER_KEEPALIVE', 5)
+# Requests after which a worker is replaced, plus a random spread so they do not restart together. 0 never
+SERVER_MAX_REQUESTS = env_int('TMPMA_SERVER_MAX_REQUESTS', 0)
+SERVER_MAX_REQUESTS_JITTER = env_int('TMPMA_SERVER_MAX_REQUESTS_JITTER', 0)
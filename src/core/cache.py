@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+'''
+In-memory caches
+'''
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    '''
+    Thread-safe mapping whose entries expire after a time-to-live and which
+    evicts the least recently used entry once `maxsize` is reached.
+    '''
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300,
+                 timer: Callable[[], float] = time.monotonic) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        '''
+        Get a live entry and mark it as recently used
+
+        Args:
+            key (Hashable): Entry key
+            default (Any, optional): Value returned on a miss. Defaults to None.
+        Returns:
+            Any: Cached value or default
+        '''
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+
+            value, expires_at = item
+            if expires_at <= self.timer():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+
+    def set(self, key: Hashable, value: Any, ttl: float = None) -> None:
+        '''
+        Store an entry, evicting the least recently used ones when full
+
+        Args:
+            key (Hashable): Entry key
+            value (Any): Value to store
+            ttl (float, optional): Entry time-to-live. Defaults to the cache ttl.
+        '''
+        expires_at = self.timer() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        '''
+        Remove an entry
+
+        Args:
+            key (Hashable): Entry key
+            default (Any, optional): Value returned when missing. Defaults to None.
+        Returns:
+            Any: Removed value or default
+        '''
+        with self._lock:
+            item = self._data.pop(key, None)
+
+        return default if item is None else item[0]
+
+
+    def clear(self) -> None:
+        '''
+        Remove every entry
+        '''
+        with self._lock:
+            self._data.clear()
+
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and item[1] > self.timer()
+
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class StaleWhileRevalidateCache:
+    '''
+    Thread-safe LRU cache of loader results. An entry is fresh for `ttl`
+    seconds and then stale for another `stale_ttl` seconds: stale entries
+    are served immediately while a background thread reloads them. Entries
+    past both windows are reloaded synchronously.
+    '''
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60, stale_ttl: float = 300,
+                 workers: int = 4, timer: Callable[[], float] = time.monotonic) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.workers = workers
+        self.timer = timer
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any],
+                    ttl: float = None, stale_ttl: float = None) -> Any:
+        '''
+        Get a cached value, loading it when missing and refreshing it in the
+        background when stale. `None` results are not cached.
+
+        Args:
+            key (Hashable): Entry key
+            loader (Callable[[], Any]): Produces the value
+            ttl (float, optional): Fresh window. Defaults to the cache ttl.
+            stale_ttl (float, optional): Stale window. Defaults to the cache stale_ttl.
+        Returns:
+            Any: Cached or loaded value
+        '''
+        now = self.timer()
+
+        with self._lock:
+            item = self._data.get(key)
+
+            if item is not None:
+                value, fresh_until, stale_until = item
+
+                if now < fresh_until:
+                    self.hits += 1
+                    self._data.move_to_end(key)
+                    return value
+
+                if now < stale_until:
+                    self.stale_hits += 1
+                    self._data.move_to_end(key)
+                    refresh = key not in self._refreshing
+                    if refresh:
+                        self._refreshing.add(key)
+                else:
+                    del self._data[key]
+                    item = None
+
+            if item is None:
+                self.misses += 1
+
+        if item is not None:
+            if refresh:
+                self._submit(key, loader, ttl, stale_ttl)
+            return value
+
+        value = loader()
+        self.set(key, value, ttl=ttl, stale_ttl=stale_ttl)
+
+        return value
+
+
+    def set(self, key: Hashable, value: Any, ttl: float = None, stale_ttl: float = None) -> None:
+        '''
+        Store an entry, evicting the least recently used ones when full.
+        `None` values are ignored.
+
+        Args:
+            key (Hashable): Entry key
+            value (Any): Value to store
+            ttl (float, optional): Fresh window. Defaults to the cache ttl.
+            stale_ttl (float, optional): Stale window. Defaults to the cache stale_ttl.
+        '''
+        if value is None:
+            return
+
+        fresh_until = self.timer() + (self.ttl if ttl is None else ttl)
+        stale_until = fresh_until + (self.stale_ttl if stale_ttl is None else stale_ttl)
+
+        with self._lock:
+            self._data[key] = (value, fresh_until, stale_until)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        '''
+        Remove an entry
+
+        Args:
+            key (Hashable): Entry key
+            default (Any, optional): Value returned when missing. Defaults to None.
+        Returns:
+            Any: Removed value or default
+        '''
+        with self._lock:
+            item = self._data.pop(key, None)
+
+        return default if item is None else item[0]
+
+
+    def clear(self) -> None:
+        '''
+        Remove every entry
+        '''
+        with self._lock:
+            self._data.clear()
+
+
+    def stats(self) -> dict:
+        '''
+        Cache counters
+
+        Returns:
+            dict
+        '''
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'staleHits': self.stale_hits,
+                'misses': self.misses,
+                'refreshing': len(self._refreshing),
+                'refreshErrors': self.refresh_errors,
+            }
+
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+    def _submit(self, key: Hashable, loader: Callable[[], Any], ttl: float, stale_ttl: float) -> None:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='cache-refresh')
+
+        self._executor.submit(self._refresh, key, loader, ttl, stale_ttl)
+
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any], ttl: float, stale_ttl: float) -> None:
+        try:
+            self.set(key, loader(), ttl=ttl, stale_ttl=stale_ttl)
+        except Exception:
+            with self._lock:
+                self.refresh_errors += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
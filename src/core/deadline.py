@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+'''
+Deadlines spanning a whole call chain
+
+A deadline is set once for an operation and every blocking hop below it
+asks for its share of what is left instead of using its own fixed
+timeout:
+
+    with deadline(10):
+        session.get(url, timeout=timeout(15))   # at most the remaining budget
+
+The deadline lives in a context variable, so it follows the call chain
+within a thread. Work handed to other threads must carry it explicitly,
+e.g. with `contextvars.copy_context().run` or `until(current())`.
+'''
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Union
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    '''
+    Raised when the time budget of an operation is spent
+    '''
+
+
+def current() -> Union[float, None]:
+    '''
+    Deadline of the running operation
+
+    Returns:
+        Union[float, None]: `time.monotonic()` value, None without deadline
+    '''
+    return _deadline.get()
+
+
+@contextmanager
+def until(at: Union[float, None]) -> Iterator[None]:
+    '''
+    Run a `with` block under an absolute deadline. An enclosing deadline
+    that is earlier still applies.
+
+    Args:
+        at (Union[float, None]): `time.monotonic()` value, None to keep the enclosing deadline
+    '''
+    enclosing = _deadline.get()
+    if at is None or (enclosing is not None and enclosing <= at):
+        yield
+        return
+
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def deadline(seconds: Union[float, None]):
+    '''
+    Run a `with` block with a time budget
+
+    Args:
+        seconds (Union[float, None]): Budget from now, None to keep the enclosing deadline
+    '''
+    return until(None if seconds is None else time.monotonic() + seconds)
+
+
+def remaining() -> Union[float, None]:
+    '''
+    Seconds left before the deadline
+
+    Returns:
+        Union[float, None]: Seconds, negative once passed, None without deadline
+    '''
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def expired() -> bool:
+    '''
+    Whether the deadline has passed
+    '''
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check() -> None:
+    '''
+    Stop work once the deadline has passed
+
+    Raises:
+        DeadlineExceeded
+    '''
+    if expired():
+        raise DeadlineExceeded('Deadline exceeded')
+
+
+def timeout(default: float) -> float:
+    '''
+    Timeout of one blocking hop: its usual `default`, cut to the time left
+
+    Args:
+        default (float): Timeout of the hop without deadline
+    Returns:
+        float: Seconds
+    Raises:
+        DeadlineExceeded: When no time is left
+    '''
+    left = remaining()
+
+    if left is None:
+        return default
+
+    if left <= 0:
+        raise DeadlineExceeded('Deadline exceeded')
+
+    return min(default, left)
+
+
+def bounded(func: Callable[..., Any]) -> Callable[..., Any]:
+    '''
+    Let callers of a function pass an overall `timeout` keyword, in
+    seconds, that bounds everything the call does
+
+    Args:
+        func (Callable[..., Any]): Function to wrap
+    Returns:
+        Callable[..., Any]
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, timeout: float = None, **kwargs):
+        if timeout is None:
+            return func(*args, **kwargs)
+
+        with deadline(timeout):
+            check()
+            return func(*args, **kwargs)
+
+    return wrapper
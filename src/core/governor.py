@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+'''
+Upstream request governor
+'''
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from .deadline import DeadlineExceeded, remaining
+
+_background: contextvars.ContextVar = contextvars.ContextVar('background', default=False)
+
+
+class UpstreamRejected(Exception):
+    '''
+    Raised when a request is turned away instead of sent upstream, because
+    the wait queue is full or the wait took too long
+    '''
+
+
+@contextmanager
+def background() -> Iterator[None]:
+    '''
+    Run a `with` block as background work: its requests yield to the
+    others at every governor, see `RateGovernor`
+    '''
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+class RateGovernor:
+    '''
+    Admission control for requests to an upstream. A request is admitted
+    once a token is available (token bucket of `rate` per second holding at
+    most `burst`) and fewer than `max_in_flight` requests are running.
+    Requests that cannot be admitted at once wait in FIFO order; when
+    `max_queue` are already waiting they are rejected immediately.
+
+    A `rate` or `max_in_flight` of 0 disables that limit.
+
+    Requests made within `background()` have a lower priority. They wait
+    in a queue of their own, are only admitted while no other request
+    waits, and leave `reserve` tokens in the bucket for the others, so
+    background work cannot take the tokens user requests need.
+    '''
+
+    def __init__(self, rate: float = 10, burst: int = 20, max_in_flight: int = 8, max_queue: int = 100,
+                 timeout: float = 10, reserve: int = 0, timer: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.reserve = min(max(0, reserve), self.burst - 1)
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.timer = timer
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self.wait_time = 0.0
+
+        self._tokens = float(self.burst)
+        self._refilled_at = timer()
+        self._in_flight = 0
+        self._waiters: deque = deque()
+        self._background_waiters: deque = deque()
+        self._cond = threading.Condition()
+
+
+    def acquire(self, timeout: float = None) -> None:
+        '''
+        Wait for admission, at most until the deadline of the running
+        operation, see `src.core.deadline`
+
+        Args:
+            timeout (float, optional): Seconds to wait. Defaults to the governor timeout.
+        Raises:
+            UpstreamRejected: When the queue is full or the wait times out
+            DeadlineExceeded: When the operation deadline passes first
+        '''
+        started = self.timer()
+        deadline = started + (self.timeout if timeout is None else timeout)
+        left = remaining()
+        cut_short = left is not None and started + left < deadline
+        if cut_short:
+            if left <= 0:
+                with self._cond:
+                    self.expired += 1
+                raise DeadlineExceeded('Deadline exceeded')
+            deadline = started + left
+        low = _background.get()
+        waiters = self._background_waiters if low else self._waiters
+
+        with self._cond:
+            if self._first(None, low) and self._admit(started, low):
+                self.admitted += 1
+                return
+
+            if len(waiters) >= self.max_queue:
+                self.rejected += 1
+                raise UpstreamRejected(f'Upstream queue full ({self.max_queue} waiting)')
+
+            waiter = object()
+            waiters.append(waiter)
+
+            try:
+                while True:
+                    now = self.timer()
+
+                    if self._first(waiter, low) and self._admit(now, low):
+                        self.admitted += 1
+                        self.wait_time += now - started
+                        return
+
+                    if now >= deadline:
+                        if cut_short:
+                            self.expired += 1
+                            raise DeadlineExceeded(f'Deadline exceeded, waited {now - started:.1f}s for upstream')
+                        self.rejected += 1
+                        raise UpstreamRejected(f'Upstream busy, waited {now - started:.1f}s')
+
+                    self._cond.wait(min(deadline - now, self._until_token(now, low)))
+            finally:
+                waiters.remove(waiter)
+                self._cond.notify_all()
+
+
+    def release(self) -> None:
+        '''
+        Mark an admitted request as finished
+        '''
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+
+    @contextmanager
+    def slot(self, timeout: float = None) -> Iterator[None]:
+        '''
+        Hold an admission for the duration of a `with` block
+
+        Args:
+            timeout (float, optional): Seconds to wait. Defaults to the governor timeout.
+        Raises:
+            UpstreamRejected: When the queue is full or the wait times out
+        '''
+        self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+    def capacity(self, seconds: float) -> float:
+        '''
+        Most requests the token bucket can admit over `seconds`, starting full
+
+        Args:
+            seconds (float): Time span
+        Returns:
+            float: Requests, infinite without rate limit
+        '''
+        if self.rate <= 0:
+            return float('inf')
+
+        return self.burst + self.rate * max(0, seconds)
+
+
+    def stats(self) -> dict:
+        '''
+        Governor occupancy and counters
+
+        Returns:
+            dict
+        '''
+        with self._cond:
+            self._refill(self.timer())
+
+            return {
+                'inFlight': self._in_flight,
+                'queued': len(self._waiters),
+                'backgroundQueued': len(self._background_waiters),
+                'tokens': round(self._tokens, 3),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'expired': self.expired,
+                'waitTime': round(self.wait_time, 3),
+            }
+
+
+    def _refill(self, now: float) -> None:
+        if self.rate > 0:
+            self._tokens = min(float(self.burst), self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+
+    def _first(self, waiter: object, low: bool) -> bool:
+        # Called with the condition held: whether `waiter`, None for a new
+        # request, is next in line. Background requests also let every
+        # other waiting request go first
+        if low and self._waiters:
+            return False
+
+        waiters = self._background_waiters if low else self._waiters
+        return not waiters if waiter is None else waiters[0] is waiter
+
+
+    def _admit(self, now: float, low: bool = False) -> bool:
+        # Called with the condition held
+        if self.max_in_flight > 0 and self._in_flight >= self.max_in_flight:
+            return False
+
+        if self.rate > 0:
+            self._refill(now)
+            if self._tokens < 1 + (self.reserve if low else 0):
+                return False
+            self._tokens -= 1
+
+        self._in_flight += 1
+        return True
+
+
+    def _until_token(self, now: float, low: bool = False) -> float:
+        # Seconds until the next usable token, or a long nap when only a release can help
+        needed = 1 + (self.reserve if low else 0)
+        if self.rate <= 0 or self._tokens >= needed:
+            return 1.0
+
+        return (needed - self._tokens) / self.rate
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+'''
+Entity tags and content encodings of HTTP responses
+
+Brotli needs the optional `brotli` dependency (`poetry install -E compression`);
+without it only gzip is offered.
+'''
+import gzip
+import hashlib
+import zlib
+from typing import Iterable, Iterator, Union
+
+from werkzeug.datastructures import Accept
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content encodings this process can produce, preferred first
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def accept_encoding() -> str:
+    '''
+    Accept-Encoding header value for upstream requests: the encodings both
+    requests/urllib3 and aiohttp can decode here
+
+    Returns:
+        str
+    '''
+    return 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'
+
+
+def strong_etag(body: bytes) -> str:
+    '''
+    Strong entity tag of a response body, without quotes
+
+    Args:
+        body (bytes): Body
+    Returns:
+        str
+    '''
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def negotiate_encoding(accept: Accept, encodings: Iterable[str] = ENCODINGS) -> Union[str, None]:
+    '''
+    Content encoding a client prefers among the ones offered
+
+    Args:
+        accept (Accept): Parsed Accept-Encoding header, e.g. `request.accept_encodings`
+        encodings (Iterable[str], optional): Offered encodings, preferred first. Defaults to ENCODINGS.
+    Returns:
+        Union[str, None]: Encoding, None for the identity
+    '''
+    best, best_quality = None, 0
+
+    for encoding in encodings:
+        quality = accept.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+
+    return best
+
+
+def compress(body: bytes, encoding: str, level: int = 6) -> bytes:
+    '''
+    Encode a response body
+
+    Args:
+        body (bytes): Body
+        encoding (str): One of ENCODINGS
+        level (int, optional): gzip level 1-9, or brotli quality 0-11. Defaults to 6.
+    Returns:
+        bytes
+    Raises:
+        ValueError: On an encoding not in ENCODINGS
+    '''
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=level, mtime=0)
+
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(body, quality=level)
+
+    raise ValueError(f'Unsupported content encoding {encoding!r}, expected one of: {", ".join(ENCODINGS)}')
+
+
+def chunked(parts: Iterable[bytes], size: int = 16384) -> Iterator[bytes]:
+    '''
+    Group small byte strings, e.g. the lines of a streamed export, into
+    chunks of at least `size` bytes, so a chunked response is not sent one
+    tiny frame per line
+
+    Args:
+        parts (Iterable[bytes]): Byte strings
+        size (int, optional): Minimum chunk size, the last chunk excepted. Defaults to 16384.
+    Yields:
+        bytes: Chunk
+    '''
+    buffer, buffered = [], 0
+
+    for part in parts:
+        buffer.append(part)
+        buffered += len(part)
+
+        if buffered >= size:
+            yield b''.join(buffer)
+            buffer, buffered = [], 0
+
+    if buffer:
+        yield b''.join(buffer)
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str, level: int = 6) -> Iterator[bytes]:
+    '''
+    Encode a streamed response body chunk by chunk. Each chunk is flushed,
+    so the client can decode everything received so far.
+
+    Args:
+        chunks (Iterable[bytes]): Body chunks
+        encoding (str): One of ENCODINGS
+        level (int, optional): gzip level 1-9, or brotli quality 0-11. Defaults to 6.
+    Yields:
+        bytes: Encoded chunk
+    Raises:
+        ValueError: On an encoding not in ENCODINGS
+    '''
+    if encoding == 'gzip':
+        # wbits 31: zlib stream with a gzip header and trailer
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        process, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+    elif encoding == 'br' and brotli is not None:
+        compressor = brotli.Compressor(quality=level)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        raise ValueError(f'Unsupported content encoding {encoding!r}, expected one of: {", ".join(ENCODINGS)}')
+
+    for chunk in chunks:
+        yield process(chunk) + flush()
+
+    yield finish()
@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+'''
+In-process metrics in the Prometheus text exposition format
+
+Metrics are created once at import time and registered in `REGISTRY`.
+Recording a value is a dict lookup plus a short lock, cheap enough to
+leave on in production:
+
+    LOOKUPS = Counter('tmpma_lookups_total', 'Card lookups', ('kind',))
+    LOOKUPS.labels('info').inc()
+
+Each process counts on its own. Processes serving the same app, such as
+gunicorn workers, share their counts through a directory: after
+`REGISTRY.share(directory)` a process writes a snapshot of its metrics
+there every few seconds and renders the totals of every snapshot, so a
+scrape answered by any worker covers all of them. Counters and histograms
+of a finished process are kept, see `retire`; its gauges are dropped.
+'''
+import atexit
+import bisect
+import glob
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+# Seconds, from a fast cache hit to a portal request close to its timeout
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Sample name, label names, label values and value
+Sample = Tuple[str, Tuple[str, ...], Tuple[str, ...], float]
+
+# How the samples of several processes combine
+AGGREGATES = {'sum': sum, 'max': max}
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_sample(sample: Sample) -> str:
+    name, labelnames, values, value = sample
+    return f'{name}{_format_labels(labelnames, values)} {_format_value(value)}'
+
+
+def _write_json(path: str, data: dict) -> None:
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+        json.dump(data, file)
+    os.replace(f'{path}.tmp', path)
+
+
+def _read_json(path: str) -> dict:
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        # Removed or being replaced meanwhile
+        return {}
+
+
+def clear(directory: str) -> None:
+    '''
+    Remove the snapshots of a share directory, before the processes sharing
+    it start
+
+    Args:
+        directory (str): Share directory
+    '''
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        os.remove(path)
+
+
+def retire(directory: str, pid: int) -> None:
+    '''
+    Drop the gauges of a finished process from its snapshot, keeping what
+    it counted
+
+    Args:
+        directory (str): Share directory
+        pid (int): Process id
+    '''
+    path = os.path.join(directory, f'{pid}.json')
+    families = _read_json(path)
+
+    if families:
+        _write_json(path, {name: family for name, family in families.items() if family['kind'] != 'gauge'})
+
+
+class Registry:
+    '''
+    Set of metrics rendered together
+    '''
+
+    def __init__(self) -> None:
+        self.directory: str = None
+        self._metrics: List['Metric'] = []
+        self._lock = threading.Lock()
+        self._sharer: threading.Thread = None
+
+
+    def register(self, metric: 'Metric') -> 'Metric':
+        '''
+        Add a metric
+
+        Args:
+            metric (Metric): Metric
+        Returns:
+            Metric: The same metric
+        '''
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+
+    def snapshot(self) -> dict:
+        '''
+        Current samples of every metric, by metric name
+
+        Returns:
+            dict: JSON-serializable families
+        '''
+        with self._lock:
+            metrics = list(self._metrics)
+
+        return {metric.name: {'documentation': metric.documentation,
+                              'kind': metric.kind,
+                              'aggregate': metric.aggregate,
+                              'samples': metric.collect()}
+                for metric in metrics}
+
+
+    def share(self, directory: str, interval: float = 5) -> None:
+        '''
+        Share the metrics of this process with the others rendering from
+        `directory`: write a snapshot there every `interval` seconds and on
+        exit, and render the totals of every snapshot
+
+        Args:
+            directory (str): Share directory
+            interval (float, optional): Seconds between snapshots. Defaults to 5.
+        '''
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._write()
+
+        if self._sharer is None:
+            self._sharer = threading.Thread(target=self._run, args=(interval,), name='metrics-share', daemon=True)
+            self._sharer.start()
+            atexit.register(self._flush)
+
+
+    def render(self) -> str:
+        '''
+        Render every metric in the Prometheus text format, summed over the
+        processes sharing the directory, if any
+
+        Returns:
+            str
+        '''
+        if self.directory is None:
+            families = self.snapshot()
+        else:
+            families = self._merge(self._write())
+
+        lines = []
+        for name, family in families.items():
+            lines.append(f'# HELP {name} {family["documentation"]}')
+            lines.append(f'# TYPE {name} {family["kind"]}')
+            lines.extend(_format_sample(sample) for sample in family['samples'])
+
+        return '\n'.join(lines) + '\n'
+
+
+    def _write(self) -> dict:
+        families = self.snapshot()
+        if self.directory is not None:
+            _write_json(os.path.join(self.directory, f'{os.getpid()}.json'), families)
+        return families
+
+
+    def _merge(self, own: dict) -> dict:
+        snapshots = [own]
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.json'))):
+            if os.path.basename(path) != f'{os.getpid()}.json':
+                snapshots.append(_read_json(path))
+
+        merged: Dict[str, dict] = {}
+        values: Dict[str, Dict[tuple, list]] = {}
+        for families in snapshots:
+            for name, family in families.items():
+                if name not in merged:
+                    merged[name] = {**family, 'samples': []}
+                    values[name] = {}
+                for sample_name, labelnames, labelvalues, value in family['samples']:
+                    key = (sample_name, tuple(labelnames), tuple(labelvalues))
+                    values[name].setdefault(key, []).append(value)
+
+        for name, family in merged.items():
+            combine = AGGREGATES[family['aggregate']]
+            family['samples'] = [(*key, combine(samples)) for key, samples in values[name].items()]
+
+        return merged
+
+
+    def _flush(self) -> None:
+        try:
+            self._write()
+        except Exception:
+            pass
+
+
+    def _run(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            self._flush()
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    '''
+    Metric family with optional labels. `labels()` returns the child for
+    one combination of label values, creating it on first use.
+    '''
+    kind = 'untyped'
+    # How the processes sharing a directory combine their values, see AGGREGATES
+    aggregate = 'sum'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Registry = REGISTRY) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._aliases: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+        if registry is not None:
+            registry.register(self)
+
+
+    def labels(self, *values) -> object:
+        '''
+        Child metric for some label values
+
+        Returns:
+            object: Child with the methods of its metric kind
+        '''
+        child = self._aliases.get(values)
+        if child is not None:
+            return child
+
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {values}')
+
+        key = tuple(str(value) for value in values)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._child()
+            self._aliases[values] = child
+
+        return child
+
+
+    def collect(self) -> List[Sample]:
+        '''
+        Samples of every child
+        '''
+        with self._lock:
+            children = sorted(self._children.items())
+
+        samples = []
+        for values, child in children:
+            samples.extend(self._child_samples(values, child))
+        return samples
+
+
+    def samples(self) -> List[str]:
+        '''
+        Exposition lines of every child
+        '''
+        return [_format_sample(sample) for sample in self.collect()]
+
+
+    def _child(self) -> object:
+        raise NotImplementedError
+
+
+    def _child_samples(self, values: Tuple[str, ...], child: object) -> List[Sample]:
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+
+    def dec(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value -= amount
+
+
+    def set(self, value: float) -> None:
+        with self.lock:
+            self.value = value
+
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        '''
+        Increase the value for the duration of a `with` block
+        '''
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class Counter(Metric):
+    '''
+    Monotonic count
+    '''
+    kind = 'counter'
+
+    def _child(self) -> _Value:
+        return _Value()
+
+
+    def _child_samples(self, values: Tuple[str, ...], child: _Value) -> List[Sample]:
+        return [(self.name, self.labelnames, values, child.value)]
+
+
+class Gauge(Counter):
+    '''
+    Value that goes up and down
+    '''
+    kind = 'gauge'
+
+
+class _Buckets:
+    __slots__ = ('bounds', 'counts', 'sum', 'lock')
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        '''
+        Observe the duration of a `with` block, in seconds
+        '''
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(Metric):
+    '''
+    Distribution of observed values over cumulative buckets
+    '''
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Registry = REGISTRY) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+
+    def _child(self) -> _Buckets:
+        return _Buckets(self.buckets)
+
+
+    def _child_samples(self, values: Tuple[str, ...], child: _Buckets) -> List[Sample]:
+        with child.lock:
+            counts, total = list(child.counts), child.sum
+
+        names = self.labelnames + ('le',)
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            samples.append((f'{self.name}_bucket', names, values + (_format_value(bound),), cumulative))
+
+        samples.append((f'{self.name}_sum', self.labelnames, values, total))
+        samples.append((f'{self.name}_count', self.labelnames, values, cumulative))
+        return samples
+
+
+class Callback(Metric):
+    '''
+    Metric read at render time from a function returning the value of each
+    combination of label values, for state that is already counted
+    elsewhere such as cache statistics
+    '''
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: Sequence[str],
+                 func: Callable[[], Dict[Tuple[str, ...], float]], registry: Registry = REGISTRY,
+                 aggregate: str = 'sum') -> None:
+        self.kind = kind
+        self.func = func
+        self.aggregate = aggregate
+        super().__init__(name, documentation, labelnames, registry)
+
+
+    def collect(self) -> List[Sample]:
+        return [(self.name, self.labelnames, tuple(str(value) for value in values), value)
+                for values, value in sorted(self.func().items())]
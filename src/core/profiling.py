@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+'''
+Bounded on-disk store of CPU profiles
+'''
+import cProfile
+import io
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from typing import List, Union
+
+PROFILE_ID = re.compile(r'^[0-9]+-[0-9a-f]{8}$')
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls', 'pcalls', 'filename', 'name')
+
+
+class ProfileRing:
+    '''
+    Directory keeping the last `keep` profiles, each as a pstats dump plus a
+    JSON file describing what was profiled. Older profiles are deleted as
+    new ones arrive, so several processes can share the directory.
+    '''
+
+    def __init__(self, directory: str, keep: int = 50) -> None:
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def new_id() -> str:
+        '''
+        Id for a profile, to hand out before the profile is saved
+
+        Returns:
+            str
+        '''
+        return f'{time.time_ns() // 1_000_000}-{secrets.token_hex(4)}'
+
+
+    def save(self, profiler: cProfile.Profile, meta: dict, profile_id: str = None) -> str:
+        '''
+        Store a finished profile and drop the oldest ones beyond `keep`
+
+        Args:
+            profiler (cProfile.Profile): Disabled profiler
+            meta (dict): What was profiled
+            profile_id (str, optional): Id from `new_id`. Defaults to a new one.
+        Returns:
+            str: Profile id
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+
+        profile_id = self.new_id() if profile_id is None else profile_id
+        meta = {'id': profile_id, 'created': time.time(), **meta}
+
+        path = self.path(profile_id)
+        profiler.dump_stats(f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+
+        with open(self._meta_path(profile_id), 'w', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file)
+
+        with self._lock:
+            for old_id in self.ids()[self.keep:]:
+                for old_path in (self.path(old_id), self._meta_path(old_id)):
+                    try:
+                        os.remove(old_path)
+                    except FileNotFoundError:
+                        pass
+
+        return profile_id
+
+
+    def ids(self) -> List[str]:
+        '''
+        Stored profile ids, newest first
+
+        Returns:
+            List[str]
+        '''
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+
+        ids = [name[:-len('.prof')] for name in names if name.endswith('.prof')]
+        return sorted((profile_id for profile_id in ids if PROFILE_ID.match(profile_id)),
+                      key=lambda profile_id: int(profile_id.split('-')[0]), reverse=True)
+
+
+    def list(self) -> List[dict]:
+        '''
+        Descriptions of the stored profiles, newest first
+
+        Returns:
+            List[dict]
+        '''
+        return [meta for meta in (self.meta(profile_id) for profile_id in self.ids()) if meta is not None]
+
+
+    def meta(self, profile_id: str) -> Union[dict, None]:
+        '''
+        Description of a stored profile
+
+        Args:
+            profile_id (str): Profile id
+        Returns:
+            Union[dict, None]: Description, None when unknown
+        '''
+        if not PROFILE_ID.match(profile_id):
+            return None
+
+        try:
+            with open(self._meta_path(profile_id), encoding='utf-8') as meta_file:
+                return json.load(meta_file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+
+    def path(self, profile_id: str) -> str:
+        '''
+        File of a profile, loadable with `pstats.Stats` or snakeviz
+
+        Args:
+            profile_id (str): Profile id
+        Returns:
+            str
+        Raises:
+            ValueError: On a malformed id
+        '''
+        if not PROFILE_ID.match(profile_id):
+            raise ValueError(f'Invalid profile id {profile_id!r}')
+
+        return os.path.join(self.directory, f'{profile_id}.prof')
+
+
+    def summary(self, profile_id: str, sort: str = 'cumulative', limit: int = 40) -> Union[str, None]:
+        '''
+        Text report of the most expensive functions of a profile
+
+        Args:
+            profile_id (str): Profile id
+            sort (str, optional): One of SORT_KEYS. Defaults to 'cumulative'.
+            limit (int, optional): Number of functions. Defaults to 40.
+        Returns:
+            Union[str, None]: Report, None when unknown
+        Raises:
+            ValueError: On an unknown sort key
+        '''
+        if sort not in SORT_KEYS:
+            raise ValueError(f'Unknown sort {sort!r}, expected one of: {", ".join(SORT_KEYS)}')
+
+        if self.meta(profile_id) is None:
+            return None
+
+        import pstats
+
+        stream = io.StringIO()
+        try:
+            pstats.Stats(self.path(profile_id), stream=stream).strip_dirs().sort_stats(sort).print_stats(limit)
+        except FileNotFoundError:
+            return None
+
+        return stream.getvalue()
+
+
+    def _meta_path(self, profile_id: str) -> str:
+        return os.path.join(self.directory, f'{profile_id}.json')
@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+'''
+Retries, circuit breaking and hedging of upstream calls
+
+`Resilience` wraps one attempt at an upstream call, e.g. a single HTTP
+request, and runs it:
+
+- through a `CircuitBreaker`, which fails fast with `CircuitOpen` while
+  the upstream keeps failing and lets a trial call through once it has
+  rested;
+- hedged: when an attempt is slower than a percentile of the recent
+  latencies, a duplicate is started and the first answer wins;
+- retried with full-jitter exponential backoff when it fails with one of
+  the retryable errors.
+
+Only idempotent calls may be retried or hedged, since either can run
+them more than once. Coroutines go through `Resilience.acall`, which
+retries and breaks circuits the same way but does not hedge.
+
+Calls honour the `deadline` of their context: no retry is attempted that
+could not finish in time, and a call failing after its deadline raises
+`DeadlineExceeded` without counting against the circuit.
+'''
+import asyncio
+import contextvars
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Iterator, Tuple, Type, Union
+
+from .deadline import DeadlineExceeded, expired, remaining
+from .governor import UpstreamRejected
+
+
+class UpstreamError(Exception):
+    '''
+    Raised when the upstream answers with an error status
+    '''
+
+    def __init__(self, status: int, message: str = None) -> None:
+        super().__init__(message or f'Upstream answered {status}')
+        self.status = status
+
+
+class CircuitOpen(UpstreamRejected):
+    '''
+    Raised instead of calling an upstream whose circuit is open
+    '''
+
+    def __init__(self, retry_after: float) -> None:
+        super().__init__(f'Upstream unavailable, retry in {math.ceil(retry_after)}s')
+        self.retry_after = retry_after
+
+
+class RetryPolicy:
+    '''
+    Up to `attempts` attempts in total, separated by exponential backoffs
+    starting at `backoff` seconds and capped at `max_backoff`. Each backoff
+    is drawn uniformly between 0 and its exponential value ("full jitter"),
+    so clients that failed together do not retry together.
+    '''
+
+    def __init__(self, attempts: int = 3, backoff: float = 0.2, max_backoff: float = 2) -> None:
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+
+    def backoffs(self) -> Iterator[float]:
+        '''
+        Seconds to sleep before each retry
+
+        Returns:
+            Iterator[float]: `attempts - 1` backoffs
+        '''
+        for retry in range(self.attempts - 1):
+            yield random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+
+class CircuitBreaker:
+    '''
+    Circuit breaker counting consecutive failures. Once `failure_threshold`
+    calls in a row have failed the circuit opens and calls are refused for
+    `reset_timeout` seconds. Then it is half open: one trial call goes
+    through, closing the circuit on success and opening it again on
+    failure.
+
+    A `failure_threshold` of 0 disables the breaker.
+    '''
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30,
+                 timer: Callable[[], float] = time.monotonic) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.timer = timer
+        self.failures = 0
+        self.opened = 0
+        self.refused = 0
+
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+
+    @property
+    def state(self) -> str:
+        '''
+        Current state: closed, open or half_open
+        '''
+        with self._lock:
+            return self._current_state(self.timer())
+
+
+    def allow(self) -> None:
+        '''
+        Check that a call may go upstream
+
+        Raises:
+            CircuitOpen: While the circuit is open, or a trial call is already running
+        '''
+        if self.failure_threshold <= 0:
+            return
+
+        with self._lock:
+            now = self.timer()
+            state = self._current_state(now)
+
+            if state == self.CLOSED:
+                return
+
+            if state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return
+
+            self.refused += 1
+            # Half open with its trial call running: it should be over soon
+            raise CircuitOpen(self._opened_at + self.reset_timeout - now if state == self.OPEN else 1)
+
+
+    def success(self) -> None:
+        '''
+        Record a call that got an answer
+        '''
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+            self._trial = False
+
+
+    def cancel(self) -> None:
+        '''
+        Record a call that ended without telling whether the upstream works,
+        e.g. turned away before being sent
+        '''
+        with self._lock:
+            self._trial = False
+
+
+    def failure(self) -> None:
+        '''
+        Record a call that failed
+        '''
+        if self.failure_threshold <= 0:
+            return
+
+        with self._lock:
+            self.failures += 1
+            now = self.timer()
+
+            if self._trial or (self._state == self.CLOSED and self.failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = now
+                self._trial = False
+                self.opened += 1
+
+
+    def _current_state(self, now: float) -> str:
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+
+        return self._state
+
+
+class LatencyWindow:
+    '''
+    Latencies of the last `size` successful calls
+    '''
+
+    def __init__(self, size: int = 200) -> None:
+        self._samples: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+
+    def add(self, seconds: float) -> None:
+        '''
+        Record the latency of a call
+        '''
+        with self._lock:
+            self._samples.append(seconds)
+
+
+    def percentile(self, percentile: float, min_samples: int = 20) -> Union[float, None]:
+        '''
+        Latency under which `percentile` percent of the recorded calls finished
+
+        Args:
+            percentile (float): Between 0 and 100
+            min_samples (int, optional): Samples needed for an answer. Defaults to 20.
+        Returns:
+            Union[float, None]: Seconds, None while there are too few samples
+        '''
+        with self._lock:
+            samples = sorted(self._samples)
+
+        if len(samples) < max(1, min_samples):
+            return None
+
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+
+class Resilience:
+    '''
+    Retry, circuit breaker and hedging settings of one upstream endpoint
+
+    Args:
+        retryable (Tuple[Type[BaseException], ...]): Errors meaning the upstream failed. They count
+            against the circuit and are retried; other errors pass through untouched.
+        attempts (int, optional): Attempts in total, 1 disables retries. Defaults to 3.
+        backoff (float, optional): First retry backoff in seconds. Defaults to 0.2.
+        max_backoff (float, optional): Cap of the retry backoffs in seconds. Defaults to 2.
+        failure_threshold (int, optional): Consecutive failures opening the circuit, 0 disables it. Defaults to 5.
+        reset_timeout (float, optional): Seconds the circuit stays open. Defaults to 30.
+        hedge_percentile (float, optional): Latency percentile after which a duplicate attempt is started,
+            0 disables hedging. Defaults to 0.
+        hedge_min_delay (float, optional): Shortest wait before hedging, in seconds. Defaults to 0.05.
+        hedge_workers (int, optional): Threads running hedged attempts. Defaults to 16.
+    '''
+
+    def __init__(self, retryable: Tuple[Type[BaseException], ...] = (UpstreamError,),
+                 attempts: int = 3, backoff: float = 0.2, max_backoff: float = 2,
+                 failure_threshold: int = 5, reset_timeout: float = 30,
+                 hedge_percentile: float = 0, hedge_min_delay: float = 0.05, hedge_workers: int = 16,
+                 timer: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep) -> None:
+        self.retryable = retryable
+        self.retry = RetryPolicy(attempts, backoff, max_backoff)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, timer)
+        self.latencies = LatencyWindow()
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_workers = hedge_workers
+        self.timer = timer
+        self.sleep = sleep
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+        self._executor: ThreadPoolExecutor = None
+        self._lock = threading.Lock()
+
+
+    def call(self, attempt: Callable[[], Any]) -> Any:
+        '''
+        Run an idempotent upstream call
+
+        Args:
+            attempt (Callable[[], Any]): One attempt at the call
+        Returns:
+            Any: Result of the first successful attempt
+        Raises:
+            CircuitOpen: When the circuit is open
+            DeadlineExceeded: When the deadline passes first
+            Exception: The error of the last attempt once retries are exhausted
+        '''
+        self._count('calls')
+        backoffs = self.retry.backoffs()
+
+        while True:
+            self.breaker.allow()
+
+            try:
+                result = self._hedged(attempt)
+            except BaseException as error:
+                self.sleep(self._backoff(error, backoffs))
+                continue
+
+            self.breaker.success()
+            return result
+
+
+    async def acall(self, attempt: Callable[[], Awaitable[Any]],
+                    retryable: Tuple[Type[BaseException], ...] = None) -> Any:
+        '''
+        Run an idempotent upstream call from a coroutine, as `call` does but
+        without hedging
+
+        Args:
+            attempt (Callable[[], Awaitable[Any]]): One attempt at the call
+            retryable (Tuple[Type[BaseException], ...], optional): Errors of the asynchronous client meaning
+                the upstream failed. Defaults to the `retryable` errors of the endpoint.
+        Returns:
+            Any: Result of the first successful attempt
+        Raises:
+            CircuitOpen: When the circuit is open
+            DeadlineExceeded: When the deadline passes first
+            Exception: The error of the last attempt once retries are exhausted
+        '''
+        self._count('calls')
+        backoffs = self.retry.backoffs()
+
+        while True:
+            self.breaker.allow()
+
+            try:
+                started = self.timer()
+                result = await attempt()
+                self.latencies.add(self.timer() - started)
+            except BaseException as error:
+                await asyncio.sleep(self._backoff(error, backoffs, retryable))
+                continue
+
+            self.breaker.success()
+            return result
+
+
+    def stats(self) -> dict:
+        '''
+        Current counters
+
+        Returns:
+            dict
+        '''
+        return {
+            'circuit': self.breaker.state,
+            'failures': self.breaker.failures,
+            'opened': self.breaker.opened,
+            'refused': self.breaker.refused,
+            'calls': self.calls,
+            'retries': self.retries,
+            'hedges': self.hedges,
+            'hedgeWins': self.hedge_wins,
+            'hedgeDelay': self._hedge_delay(),
+        }
+
+
+    def close(self) -> None:
+        '''
+        Stop the hedging threads
+        '''
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+    def _backoff(self, error: BaseException, backoffs: Iterator[float],
+                 retryable: Tuple[Type[BaseException], ...] = None) -> float:
+        # Seconds to wait before retrying a failed attempt, or the error to raise
+        if isinstance(error, DeadlineExceeded):
+            # Timeouts cut short by the deadline say nothing about the upstream
+            self.breaker.cancel()
+            raise error
+
+        if expired():
+            self.breaker.cancel()
+            raise DeadlineExceeded(f'Deadline exceeded: {error}') from error
+
+        if not isinstance(error, self.retryable if retryable is None else retryable):
+            self.breaker.cancel()
+            raise error
+
+        self.breaker.failure()
+
+        backoff = next(backoffs, None)
+        if backoff is None:
+            raise error
+
+        left = remaining()
+        if left is not None and left <= backoff:
+            raise DeadlineExceeded(f'Deadline exceeded before a retry: {error}') from error
+
+        self._count('retries')
+        return backoff
+
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+
+    def _timed(self, attempt: Callable[[], Any]) -> Any:
+        started = self.timer()
+        result = attempt()
+        self.latencies.add(self.timer() - started)
+        return result
+
+
+    def _hedge_delay(self) -> Union[float, None]:
+        if self.hedge_percentile <= 0:
+            return None
+
+        latency = self.latencies.percentile(self.hedge_percentile)
+        return None if latency is None else max(self.hedge_min_delay, latency)
+
+
+    def _hedged(self, attempt: Callable[[], Any]) -> Any:
+        delay = self._hedge_delay()
+
+        if delay is None:
+            return self._timed(attempt)
+
+        executor = self._get_executor()
+        # Attempts run in other threads, under the deadline of the caller
+        first = executor.submit(contextvars.copy_context().run, self._timed, attempt)
+
+        # Not `first.result(timeout=...)`: its TimeoutError would also catch
+        # a DeadlineExceeded raised by the attempt itself
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        self._count('hedges')
+        hedge = executor.submit(contextvars.copy_context().run, self._hedge, first, attempt)
+        pending = {first, hedge}
+        error = None
+
+        # The slower attempt is cancelled if it has not started yet, e.g.
+        # while every hedging thread is busy, and else left to finish on
+        # its own, its result dropped
+        while pending:
+            left = remaining()
+            done, pending = wait(pending, timeout=None if left is None else max(0, left),
+                                 return_when=FIRST_COMPLETED)
+
+            if not done:
+                for future in pending:
+                    future.cancel()
+                raise DeadlineExceeded('Deadline exceeded waiting for hedged attempts')
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    self._count('hedge_wins', future is hedge)
+                    return future.result()
+
+                # A hedge turned away by admission control is no worse than no hedge
+                if error is None or not isinstance(future.exception(), UpstreamRejected):
+                    error = future.exception()
+
+        raise error
+
+
+    def _hedge(self, first: Future, attempt: Callable[[], Any]) -> Any:
+        # A hedge that only gets a thread once the first attempt answered
+        # would be a wasted upstream call
+        if first.done() and not first.cancelled() and first.exception() is None:
+            raise CancelledError('First attempt already answered')
+
+        return self._timed(attempt)
+
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.hedge_workers, thread_name_prefix='hedge')
+
+        return self._executor
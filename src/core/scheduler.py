@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+'''
+Background refresh of recently requested keys
+'''
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List
+
+from .governor import RateGovernor, background
+
+# Weight of the newest gap in the moving average of the time between requests
+GAP_SMOOTHING = 0.3
+# Refreshes per average gap between requests
+REFRESHES_PER_GAP = 4
+
+
+class _Watched:
+    '''
+    Watched key plus its request and refresh bookkeeping
+    '''
+    __slots__ = ('key', 'last_request', 'gap', 'interval', 'refreshed_at', 'due', 'running')
+
+    def __init__(self, key: Hashable, now: float, interval: float) -> None:
+        self.key = key
+        self.last_request = now
+        self.gap: float = None
+        self.interval = interval
+        self.refreshed_at = now
+        self.due = now
+        self.running = False
+
+
+class RefreshScheduler:
+    '''
+    Keeps a watchlist of recently requested keys and calls `refresh` for
+    each of them on a jittered schedule from a few worker threads.
+
+    A key joins the watchlist once it has been touched `min_requests`
+    times, each within `idle_ttl` seconds of the previous one, and leaves
+    it once it has not been touched for `idle_ttl` seconds. Keys requested
+    often are refreshed often: the refresh interval is a fraction of the
+    average time between requests, bounded by `min_interval` and
+    `max_interval`.
+
+    Refreshes run as `background()` work, and at most `rate` of them start
+    per second (0 for no limit), whatever the size of the watchlist.
+    '''
+
+    def __init__(self, refresh: Callable[[Hashable], None], workers: int = 2,
+                 min_interval: float = 30, max_interval: float = 900, jitter: float = 0.2,
+                 idle_ttl: float = 300, max_watched: int = 10000, min_requests: int = 2,
+                 rate: float = 0, timer: Callable[[], float] = time.monotonic) -> None:
+        self.refresh = refresh
+        self.workers = workers
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.jitter = jitter
+        self.idle_ttl = idle_ttl
+        self.max_watched = max_watched
+        self.min_requests = max(1, min_requests)
+        self.pacer = RateGovernor(rate=rate, burst=1, max_in_flight=0, max_queue=max(1, workers),
+                                  timeout=float('inf'), timer=timer)
+        self.timer = timer
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.dropped = 0
+        self.last_lag = 0.0
+
+        self._watched: 'OrderedDict[Hashable, _Watched]' = OrderedDict()
+        # Keys touched fewer than min_requests times: (touches, last touch)
+        self._candidates: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._heap: List[tuple] = []
+        self._sequence = itertools.count()
+        self._running = 0
+        self._cond = threading.Condition()
+        self._stop = False
+        self._threads: List[threading.Thread] = []
+
+
+    def touch(self, key: Hashable) -> None:
+        '''
+        Record a request for a key, adding it to the watchlist if needed
+
+        Args:
+            key (Hashable): Requested key
+        '''
+        now = self.timer()
+
+        with self._cond:
+            item = self._watched.get(key)
+
+            if item is None and not self._promote(key, now):
+                return
+
+            if item is None:
+                item = _Watched(key, now, self.max_interval)
+                self._watched[key] = item
+
+                while len(self._watched) > self.max_watched:
+                    self._watched.popitem(last=False)
+                    self.dropped += 1
+
+                self._schedule(item, now + self._jittered(item.interval))
+            else:
+                gap = now - item.last_request
+                item.gap = gap if item.gap is None else item.gap + GAP_SMOOTHING * (gap - item.gap)
+                item.last_request = now
+                item.interval = min(self.max_interval, max(self.min_interval, item.gap / REFRESHES_PER_GAP))
+                self._watched.move_to_end(key)
+
+                due = max(now, item.refreshed_at + item.interval)
+                if not item.running and due < item.due:
+                    self._schedule(item, due)
+
+        self._ensure_workers()
+
+
+    def unwatch(self, key: Hashable) -> None:
+        '''
+        Remove a key from the watchlist
+
+        Args:
+            key (Hashable): Watched key
+        '''
+        with self._cond:
+            self._watched.pop(key, None)
+            self._candidates.pop(key, None)
+
+
+    def stats(self) -> dict:
+        '''
+        Watchlist size, refresh queue depth and lag
+
+        Returns:
+            dict
+        '''
+        now = self.timer()
+
+        with self._cond:
+            overdue = [now - item.due for item in self._watched.values() if not item.running and item.due <= now]
+
+            return {
+                'watched': len(self._watched),
+                'queueDepth': len(overdue),
+                'running': self._running,
+                'lag': max(overdue, default=0.0),
+                'lastLag': self.last_lag,
+                'refreshes': self.refreshes,
+                'refreshErrors': self.refresh_errors,
+                'dropped': self.dropped,
+            }
+
+
+    def close(self) -> None:
+        '''
+        Stop the worker threads once their current refresh is done. The
+        scheduler cannot be restarted.
+        '''
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+
+
+    def _promote(self, key: Hashable, now: float) -> bool:
+        # Called with the condition held: count a touch of an unwatched key,
+        # telling whether it is now requested often enough to be watched
+        touches, last = self._candidates.pop(key, (0, now))
+        touches = touches + 1 if now - last < self.idle_ttl else 1
+
+        if touches >= self.min_requests:
+            return True
+
+        self._candidates[key] = (touches, now)
+        while len(self._candidates) > self.max_watched:
+            self._candidates.popitem(last=False)
+
+        return False
+
+
+    def _jittered(self, interval: float) -> float:
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+    def _schedule(self, item: _Watched, due: float) -> None:
+        item.due = due
+        heapq.heappush(self._heap, (due, next(self._sequence), item.key))
+        self._cond.notify()
+
+
+    def _next(self) -> _Watched:
+        # Called with the condition held; returns None when stopping
+        while not self._stop:
+            now = self.timer()
+
+            if self._heap and self._heap[0][0] <= now:
+                due, _, key = heapq.heappop(self._heap)
+                item = self._watched.get(key)
+
+                # Entry superseded by a later _schedule, or key unwatched
+                if item is None or item.due != due or item.running:
+                    continue
+
+                if now - item.last_request >= self.idle_ttl:
+                    del self._watched[key]
+                    self.dropped += 1
+                    continue
+
+                item.running = True
+                self._running += 1
+                self.last_lag = now - due
+                return item
+
+            self._cond.wait(self._heap[0][0] - now if self._heap else None)
+
+        return None
+
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                item = self._next()
+
+            if item is None:
+                return
+
+            try:
+                self.pacer.acquire()
+                try:
+                    with background():
+                        self.refresh(item.key)
+                finally:
+                    self.pacer.release()
+            except Exception:
+                failed = True
+            else:
+                failed = False
+
+            with self._cond:
+                item.running = False
+                self._running -= 1
+                self.refreshes += 1
+                self.refresh_errors += failed
+                item.refreshed_at = self.timer()
+
+                if self._watched.get(item.key) is item:
+                    self._schedule(item, item.refreshed_at + self._jittered(item.interval))
+
+
+    def _ensure_workers(self) -> None:
+        if len(self._threads) >= self.workers and all(thread.is_alive() for thread in self._threads):
+            return
+
+        with self._cond:
+            if self._stop:
+                return
+
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'refresh-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+'''
+Pool of reusable, pre-warmed HTTP sessions
+'''
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List
+
+import requests
+
+from .deadline import DeadlineExceeded, remaining
+from .governor import UpstreamRejected
+
+
+class PoolTimeout(UpstreamRejected):
+    '''
+    Raised when no session becomes available in time
+    '''
+
+
+class _PooledSession:
+    '''
+    Session plus its bookkeeping timestamps
+    '''
+    __slots__ = ('session', 'created_at', 'last_used')
+
+    def __init__(self, session: requests.Session, now: float) -> None:
+        self.session = session
+        self.created_at = now
+        self.last_used = now
+
+
+class SessionPool:
+    '''
+    Bounded pool of warm `requests.Session` objects with checkout/return
+    semantics. Each session keeps its cookie jar and kept-alive connections
+    between checkouts. A background thread replaces sessions older than
+    `max_age`, re-warms sessions idle for longer than `max_idle` and keeps at
+    least `min_idle` warm sessions ready.
+    '''
+
+    def __init__(self, factory: Callable[[], requests.Session],
+                 warm: Callable[[requests.Session], None] = None,
+                 size: int = 8, min_idle: int = 1, max_age: float = 300,
+                 max_idle: float = 60, timeout: float = 15,
+                 timer: Callable[[], float] = time.monotonic) -> None:
+        self.factory = factory
+        self.warm = warm
+        self.size = size
+        self.min_idle = min(min_idle, size)
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.timer = timer
+
+        self._idle: List[_PooledSession] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._stop = threading.Event()
+        self._maintainer: threading.Thread = None
+
+
+    def checkout(self, timeout: float = None) -> _PooledSession:
+        '''
+        Take a session out of the pool, creating one if none is idle. The
+        wait ends at the latest with the deadline of the running operation,
+        see `src.core.deadline`
+
+        Args:
+            timeout (float, optional): Seconds to wait for a free slot. Defaults to the pool timeout.
+        Returns:
+            _PooledSession
+        Raises:
+            PoolTimeout: When no slot frees up in time
+            DeadlineExceeded: When the operation deadline passes first
+        '''
+        self._ensure_maintainer()
+
+        wait = self.timeout if timeout is None else timeout
+        left = remaining()
+        cut_short = left is not None and left < wait
+        if cut_short:
+            if left <= 0:
+                raise DeadlineExceeded('Deadline exceeded')
+            wait = left
+
+        if not self._slots.acquire(timeout=wait):
+            if cut_short:
+                raise DeadlineExceeded(f'Deadline exceeded, waited {wait:.1f}s for a session')
+            raise PoolTimeout(f'No session available in a pool of {self.size}')
+
+        try:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+
+            if entry is not None and self._expired(entry):
+                entry.session.close()
+                entry = None
+
+            if entry is None:
+                entry = _PooledSession(self.factory(), self.timer())
+
+            return entry
+        except BaseException:
+            self._slots.release()
+            raise
+
+
+    def checkin(self, entry: _PooledSession, discard: bool = False) -> None:
+        '''
+        Return a session to the pool
+
+        Args:
+            entry (_PooledSession): Session taken with `checkout`
+            discard (bool, optional): Close the session instead of reusing it. Defaults to False.
+        '''
+        try:
+            if discard or self._stop.is_set():
+                entry.session.close()
+            else:
+                entry.last_used = self.timer()
+                with self._lock:
+                    self._idle.append(entry)
+        finally:
+            self._slots.release()
+
+
+    @contextmanager
+    def session(self, timeout: float = None) -> Iterator[requests.Session]:
+        '''
+        Borrow a session for the duration of a `with` block. Sessions that
+        raise are discarded rather than returned.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a free slot. Defaults to the pool timeout.
+        Yields:
+            requests.Session
+        Raises:
+            PoolTimeout: When no slot frees up in time
+            DeadlineExceeded: When the operation deadline passes first
+        '''
+        entry = self.checkout(timeout=timeout)
+        try:
+            yield entry.session
+        except BaseException:
+            self.checkin(entry, discard=True)
+            raise
+        else:
+            self.checkin(entry)
+
+
+    def prewarm(self, count: int = None) -> None:
+        '''
+        Fill the pool with warm idle sessions
+
+        Args:
+            count (int, optional): Number of idle sessions wanted. Defaults to `min_idle`.
+        '''
+        count = min(self.min_idle if count is None else count, self.size)
+
+        while True:
+            with self._lock:
+                if len(self._idle) >= count:
+                    return
+
+            if not self._slots.acquire(blocking=False):
+                return
+
+            try:
+                entry = _PooledSession(self.factory(), self.timer())
+            except Exception:
+                self._slots.release()
+                return
+
+            self.checkin(entry)
+
+
+    def maintain(self) -> None:
+        '''
+        Replace expired idle sessions, re-warm stale ones and top the pool
+        up to `min_idle`
+        '''
+        now = self.timer()
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        keep = []
+        for entry in idle:
+            if self._expired(entry, now):
+                entry.session.close()
+                continue
+
+            if self.warm is not None and now - entry.last_used >= self.max_idle:
+                try:
+                    self.warm(entry.session)
+                except Exception:
+                    entry.session.close()
+                    continue
+                entry.last_used = self.timer()
+
+            keep.append(entry)
+
+        with self._lock:
+            self._idle[:0] = keep
+
+        self.prewarm()
+
+
+    def close(self) -> None:
+        '''
+        Stop the maintenance thread and close idle sessions
+        '''
+        self._stop.set()
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for entry in idle:
+            entry.session.close()
+
+
+    def stats(self) -> dict:
+        '''
+        Current pool occupancy
+
+        Returns:
+            dict
+        '''
+        with self._lock:
+            idle = len(self._idle)
+
+        return {'size': self.size, 'idle': idle}
+
+
+    def _expired(self, entry: _PooledSession, now: float = None) -> bool:
+        return (self.timer() if now is None else now) - entry.created_at >= self.max_age
+
+
+    def _ensure_maintainer(self) -> None:
+        if self._maintainer is not None and self._maintainer.is_alive():
+            return
+
+        with self._lock:
+            if self._maintainer is not None and self._maintainer.is_alive():
+                return
+
+            self._stop.clear()
+            self._maintainer = threading.Thread(target=self._run, name='session-pool', daemon=True)
+            self._maintainer.start()
+
+
+    def _run(self) -> None:
+        interval = max(1.0, min(self.max_idle, self.max_age) / 2)
+
+        while True:
+            try:
+                self.maintain()
+            except Exception:
+                pass
+
+            if self._stop.wait(interval):
+                return
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+'''
+Coalescing of identical concurrent calls
+'''
+import functools
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from .deadline import DeadlineExceeded, remaining
+
+
+class _Call:
+    '''
+    In-flight call shared by its leader and followers
+    '''
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    '''
+    Runs at most one call per key at a time. Callers arriving while a call
+    with the same key is in flight wait for it and get its result, or its
+    exception, instead of running their own.
+    '''
+
+    def __init__(self) -> None:
+        self.leaders = 0
+        self.followers = 0
+
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        '''
+        Call `func`, or join the in-flight call with the same key. A leader
+        running out of its own deadline does not fail its followers: they
+        try again, one of them leading, under their own deadlines.
+
+        Args:
+            key (Hashable): Call identity
+            func (Callable[..., Any]): Function to call
+        Returns:
+            Any: Result of the call
+        '''
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self.leaders += 1
+                else:
+                    self.followers += 1
+
+            if leader:
+                break
+
+            # Followers give up at their own deadline, the leader goes on
+            left = remaining()
+            if not call.done.wait(None if left is None else max(0, left)):
+                raise DeadlineExceeded('Deadline exceeded waiting for an identical call')
+            if isinstance(call.error, DeadlineExceeded):
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+    def stats(self) -> dict:
+        '''
+        Coalescing counters
+
+        Returns:
+            dict
+        '''
+        with self._lock:
+            return {
+                'inFlight': len(self._calls),
+                'calls': self.leaders,
+                'coalesced': self.followers,
+            }
+
+
+def coalesced(method: Callable[..., Any]) -> Callable[..., Any]:
+    '''
+    Coalesce concurrent calls of a method with equal arguments through the
+    `flights` SingleFlight of its instance. Calls with unhashable arguments
+    run on their own.
+
+    Args:
+        method (Callable[..., Any]): Method to wrap
+    Returns:
+        Callable[..., Any]
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+
+        try:
+            hash(key)
+        except TypeError:
+            return method(self, *args, **kwargs)
+
+        return self.flights.do(key, method, self, *args, **kwargs)
+
+    return wrapper
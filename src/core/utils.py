@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+'''
+Shared helpers
+'''
+import math
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    '''
+    Read an integer from the environment
+
+    Args:
+        name (str): Variable name
+        default (int): Value used when the variable is unset or empty
+    Returns:
+        int
+    '''
+    value = os.environ.get(name)
+    return default if value in (None, '') else int(value)
+
+
+def env_float(name: str, default: float) -> float:
+    '''
+    Read a float from the environment
+
+    Args:
+        name (str): Variable name
+        default (float): Value used when the variable is unset or empty
+    Returns:
+        float
+    '''
+    value = os.environ.get(name)
+    return default if value in (None, '') else float(value)
+
+
+def env_str(name: str, default: str) -> str:
+    '''
+    Read a string from the environment
+
+    Args:
+        name (str): Variable name
+        default (str): Value used when the variable is unset or empty
+    Returns:
+        str
+    '''
+    value = os.environ.get(name)
+    return default if value in (None, '') else value
+
+
+def available_cpus() -> int:
+    '''
+    Number of CPUs this process may use: its CPU affinity, further limited
+    by a container CPU quota (cgroup v2 `cpu.max` or v1 `cpu.cfs_quota_us`)
+
+    Returns:
+        int: At least 1
+    '''
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = None
+    try:
+        with open('/sys/fs/cgroup/cpu.max', encoding='ascii') as cpu_max:
+            limit, period = cpu_max.read().split()
+            if limit != 'max':
+                quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            with (open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', encoding='ascii') as quota_file,
+                  open('/sys/fs/cgroup/cpu/cpu.cfs_period_us', encoding='ascii') as period_file):
+                limit, period = int(quota_file.read()), int(period_file.read())
+                if limit > 0:
+                    quota = limit / period
+        except (OSError, ValueError):
+            pass
+
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+
+    return max(1, cpus)
@@ -2,21 +2,66 @@
 '''
 API for Tarjeta Metrobus Panama
 '''
+import argparse
 import os
 from flask import Flask
 
-from .apis import api
+from .apis import api, metrics, profiling
+from .apis.settings import (METRICS_DIR,
+                            METRICS_SHARE_INTERVAL,
+                            SERVER_GRACEFUL_TIMEOUT,
+                            SERVER_KEEPALIVE,
+                            SERVER_MAX_REQUESTS,
+                            SERVER_MAX_REQUESTS_JITTER,
+                            SERVER_MODE,
+                            SERVER_THREADS,
+                            SERVER_TIMEOUT,
+                            SERVER_WORKERS)
+from .tarjeta_metrobus.parsers import check_parser_backend
+
+# The client is built on first use, so check its HTML parser here: a bad
+# TMPMA_HTML_PARSER must fail at startup rather than on the first request
+check_parser_backend()
 
 app = Flask(__name__)
 api.init_app(app)
+metrics.init_app(app)
+profiling.init_app(app)
 
 
 def main():
     '''
-    Run the API
+    Run the API, with the Flask debug server or, with `--mode production`
+    or TMPMA_SERVER_MODE=production, with gunicorn
     '''
-    print('PORT', os.environ.get('PORT', 80))
-    app.run(port=int(os.environ.get('PORT', 80)), debug=True)
+    parser = argparse.ArgumentParser(description='API for Tarjeta Metrobus Panama')
+    parser.add_argument('--mode', choices=('development', 'production'), default=SERVER_MODE)
+    parser.add_argument('--host', default=None, help='Defaults to 127.0.0.1, 0.0.0.0 in production')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 80)))
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='Production worker processes')
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help='Production threads per worker')
+    args = parser.parse_args()
+
+    print('PORT', args.port)
+
+    if args.mode == 'production':
+        from .server import serve
+
+        serve(app,
+              host=args.host or '0.0.0.0',
+              port=args.port,
+              workers=args.workers,
+              threads=args.threads,
+              timeout=SERVER_TIMEOUT,
+              graceful_timeout=SERVER_GRACEFUL_TIMEOUT,
+              keepalive=SERVER_KEEPALIVE,
+              max_requests=SERVER_MAX_REQUESTS,
+              max_requests_jitter=SERVER_MAX_REQUESTS_JITTER,
+              metrics_dir=METRICS_DIR,
+              metrics_interval=METRICS_SHARE_INTERVAL)
+        return
+
+    app.run(host=args.host, port=args.port, debug=True)
 
 
 if __name__ == "__main__":
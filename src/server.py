@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+'''
+Production server for the API: gunicorn pre-forking one process per CPU,
+each serving requests from a pool of threads.
+
+The app is imported once in the master before forking, so workers start
+instantly and share its memory pages copy-on-write. Nothing imported
+starts a thread or opens a connection to the portal until a request
+needs it, so every worker builds its own.
+
+Metrics are counted in each worker; with a metrics directory the workers
+share them there, so a scrape answered by any worker reports the totals,
+see `src.core.metrics`.
+
+gunicorn handles the usual signals: SIGHUP replaces the workers
+gracefully, SIGTERM drains them within the graceful timeout, SIGTTIN and
+SIGTTOU add or remove a worker.
+'''
+import gc
+import os
+
+from flask import Flask
+from gunicorn.app.base import BaseApplication
+
+from src.core import metrics
+
+
+class Server(BaseApplication):
+    '''
+    gunicorn application serving an already imported Flask app
+    '''
+
+    def __init__(self, app: Flask, options: dict) -> None:
+        self.application = app
+        self.options = options
+        super().__init__()
+
+
+    def load_config(self) -> None:
+        for key, value in self.options.items():
+            if value is not None:
+                self.cfg.set(key, value)
+
+
+    def load(self) -> Flask:
+        return self.application
+
+
+def when_ready(_server) -> None:
+    # Objects created while importing the app live as long as the master.
+    # Keeping them out of garbage collection stops the collector in each
+    # worker from writing to, and so copying, the pages they share
+    gc.freeze()
+
+
+def share_metrics(directory: str, interval: float) -> dict:
+    '''
+    gunicorn hooks sharing the metrics of the workers through a directory
+
+    Args:
+        directory (str): Share directory, emptied when the master starts
+        interval (float): Seconds between the snapshots of each worker
+    Returns:
+        dict: gunicorn settings
+    '''
+    def on_starting(_server) -> None:
+        os.makedirs(directory, exist_ok=True)
+        metrics.clear(directory)
+
+    def post_fork(_server, _worker) -> None:
+        metrics.REGISTRY.share(directory, interval)
+
+    def child_exit(_server, worker) -> None:
+        metrics.retire(directory, worker.pid)
+
+    return {'on_starting': on_starting, 'post_fork': post_fork, 'child_exit': child_exit}
+
+
+def serve(app: Flask, host: str, port: int, workers: int, threads: int, timeout: int,
+          graceful_timeout: int, keepalive: int, max_requests: int = 0,
+          max_requests_jitter: int = 0, metrics_dir: str = '', metrics_interval: float = 5) -> None:
+    '''
+    Serve an app until the master is stopped
+
+    Args:
+        app (Flask): Application
+        host (str): Address to listen on
+        port (int): Port to listen on
+        workers (int): Worker processes
+        threads (int): Threads per worker
+        timeout (int): Seconds a silent worker is given before being replaced
+        graceful_timeout (int): Seconds workers get to finish requests on restart
+        keepalive (int): Seconds an idle client connection is kept open
+        max_requests (int, optional): Requests after which a worker is replaced, 0 never. Defaults to 0.
+        max_requests_jitter (int, optional): Random spread of max_requests. Defaults to 0.
+        metrics_dir (str, optional): Directory where workers share their metrics, empty for none. Defaults to ''.
+        metrics_interval (float, optional): Seconds between metric snapshots. Defaults to 5.
+    '''
+    Server(app, {
+        'bind': f'{host}:{port}',
+        'workers': max(1, workers),
+        'threads': max(1, threads),
+        'worker_class': 'gthread',
+        'timeout': timeout,
+        'graceful_timeout': graceful_timeout,
+        'keepalive': keepalive,
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests_jitter,
+        'preload_app': True,
+        'when_ready': when_ready,
+        'accesslog': '-',
+        **(share_metrics(metrics_dir, metrics_interval) if metrics_dir else {}),
+    }).run()
@@ -4,26 +4,67 @@ Web scrapper for Tarjeta Metrobus Panama
 '''
 # from __future__ import annotations
 import datetime
-from typing import List, Union
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Union
 
-import pandas as pd
 import requests
 
-from bs4 import BeautifulSoup, Tag
-from pytz import timezone
-from slugify import slugify
+from bs4 import BeautifulSoup
 
+from src.core.cache import TTLCache
+from src.core.deadline import bounded, current, until
+from src.core.deadline import timeout as hop_timeout
+from src.core.governor import RateGovernor, UpstreamRejected
+from src.core.resilience import Resilience, UpstreamError
+from src.core.session_pool import SessionPool
+from src.core.singleflight import SingleFlight, coalesced
 from src.core.singleton import SingletonMeta
 
 from .models import (KSI,
-                     CardStat,
+                     CardBatchResult,
                      CardStats,
                      Services,
                      CardInfo,
                      CardInfoResume,
                      CardMovement,
+                     CardSnapshot,
                      ComercialesParams)
-from .utils import bs_table_to_dict, table_to_data
+from .history import MovementHistory
+from .metrics import KSI_LOOKUPS, UPSTREAM_IN_FLIGHT, UPSTREAM_REQUESTS, UPSTREAM_SECONDS, stage, timed
+from .parsers import (CARD_RESUME_MARKER,
+                      CARD_STATS_MARKER,
+                      MOVEMENTS_MARKER,
+                      MovementsCursor,
+                      check_parser_backend,
+                      make_soup,
+                      parse_card_info,
+                      parse_card_resume,
+                      parse_card_stats,
+                      parse_ksi,
+                      parse_movements,
+                      select_movements,
+                      stream_movements)
+from .portal import (DEFAULT_HEADERS,
+                     MOVEMENTS_PAGE,
+                     RESUME_PAGE,
+                     URL,
+                     comerciales_params,
+                     session_params,
+                     snapshot_requests,
+                     snapshot_sections)
+from .settings import (BATCH_WORKERS,
+                       GOVERNOR,
+                       HISTORY_BATCH_SIZE,
+                       HISTORY_PATH,
+                       RESILIENCE,
+                       KSI_CACHE_SIZE,
+                       KSI_CACHE_TTL,
+                       SESSION_MAX_AGE,
+                       SESSION_MAX_IDLE,
+                       SESSION_POOL_MIN_IDLE,
+                       SESSION_POOL_SIZE,
+                       SESSION_POOL_TIMEOUT)
 
 __author__ = "Christhoval Barba"
 __copyright__ = "Copyright 2024, GND labs"
@@ -33,40 +74,185 @@ __version__ = "0.0.1"
 __maintainer__ = "Christhoval Barba"
 __email__ = "me@christhoval.dev"
 
-URL = "http://200.46.245.230:8080/PortalCAE-WAR-MODULE"
-DEFAULT_HEADERS = {
-    "Content-Type":
-    "application/x-www-form-urlencoded",
-    "User-Agent":
-    "Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/33.0.1750.117 Safari/537.36",
-}
+# Portal request failures worth retrying, which also count against the circuit breakers
+RETRYABLE = (requests.ConnectionError, requests.Timeout, UpstreamError)
+
 
 class TarjetaMetrobusPanama(metaclass=SingletonMeta):
     '''
     Tarjeta Metrobus Panama
+
+    Concurrent calls of the same lookup with the same arguments share one
+    portal fetch and get the same result objects.
+
+    Every portal method accepts a `timeout` keyword, the budget in seconds
+    of the whole call. Each hop below it (admission, session checkout,
+    portal requests, retry backoffs) only waits for what is left, and the
+    call raises `DeadlineExceeded` once the budget is spent.
     '''
-    
-    session: requests.Session = None
 
-    def __init__(self) -> None:
-        self.session = self.get_session()
-        
-        
+    pool: SessionPool = None
+    governors: Dict[Services, RateGovernor] = None
+    resilience: Dict[Services, Resilience] = None
+    flights: SingleFlight = None
+    ksi_cache: TTLCache = None
+    history: MovementHistory = None
+    parser: str = None
+    url: str = None
+
+    def __init__(self, parser: str = None, url: str = None, history: MovementHistory = None) -> None:
+        self.url = URL if url is None else url.rstrip('/')
+        self.history = MovementHistory(HISTORY_PATH) if history is None and HISTORY_PATH else history
+        self.parser = check_parser_backend(parser)
+        self.ksi_cache = TTLCache(maxsize=KSI_CACHE_SIZE, ttl=KSI_CACHE_TTL)
+        self.pool = SessionPool(self.get_session,
+                                warm=self.warm_session,
+                                size=SESSION_POOL_SIZE,
+                                min_idle=SESSION_POOL_MIN_IDLE,
+                                max_age=SESSION_MAX_AGE,
+                                max_idle=SESSION_MAX_IDLE,
+                                timeout=SESSION_POOL_TIMEOUT)
+        self.governors = {service: RateGovernor(**GOVERNOR[service.name]) for service in Services}
+        self.resilience = {service: Resilience(RETRYABLE, **RESILIENCE[service.name]) for service in Services}
+        self.flights = SingleFlight()
+
+
+    @bounded
+    @timed('session')
     def get_session(self, ) -> requests.Session:
         '''
-        Get a session to the portal
+        Get a new warm session to the portal. Requests should borrow one from
+        `self.pool` instead.
 
         Returns:
             requests.Session
         '''
         _session = requests.Session()
         _session.headers.update(DEFAULT_HEADERS)
-        _session.request("GET", URL, timeout=15)
+        self.warm_session(_session)
 
         return _session
 
 
-    def get_comerciales_params(self, card_number: str, itemms: str, item: str, accion: str) -> Union[ComercialesParams, None]:
+    def warm_session(self, session: requests.Session) -> None:
+        '''
+        Hit the portal landing page so the session holds its cookies and an
+        open connection
+
+        Args:
+            session (requests.Session): Session to warm
+        '''
+        session.request("GET", self.url, timeout=hop_timeout(15))
+
+
+    @bounded
+    def fetch(self, service: Services, params: dict) -> BeautifulSoup:
+        '''
+        Get and parse a portal page, see `fetch_page`
+
+        Args:
+            service (Services): Portal service
+            params (dict): Query parameters
+        Returns:
+            BeautifulSoup
+        '''
+        text = self.fetch_page(service, params)
+
+        with stage('soup'):
+            return make_soup(text, self.parser)
+
+
+    @bounded
+    def fetch_page(self, service: Services, params: dict) -> str:
+        '''
+        Get a portal page. Failed requests are retried, and hedged when
+        enabled, under the circuit breaker of the service.
+
+        Args:
+            service (Services): Portal service
+            params (dict): Query parameters
+        Returns:
+            str: Page
+        Raises:
+            UpstreamRejected: When the service governor turns the request away or its circuit is open
+            UpstreamError: When the portal keeps answering with an error status
+            requests.RequestException: When the portal keeps failing to answer
+        '''
+        return self.resilience[service].call(lambda: self.request_page(service, params))
+
+
+    @bounded
+    def request_page(self, service: Services, params: dict) -> str:
+        '''
+        Send one portal request. It first waits for admission by the service
+        governor, then borrows a session from the pool.
+
+        Args:
+            service (Services): Portal service
+            params (dict): Query parameters
+        Returns:
+            str: Page
+        Raises:
+            UpstreamRejected: When the service governor turns the request away, or no pooled session frees up
+            DeadlineExceeded: When the request deadline passes while waiting for admission or a session
+            UpstreamError: When the portal answers with an error status
+        '''
+        url = f'{self.url}/{service.value}'
+        governor = self.governors[service]
+
+        try:
+            with stage('admission'):
+                governor.acquire()
+        except UpstreamRejected:
+            UPSTREAM_REQUESTS.labels(service.name, 'UpstreamRejected').inc()
+            raise
+
+        try:
+            with (self.pool.session() as session,
+                  UPSTREAM_IN_FLIGHT.labels(service.name).track(),
+                  UPSTREAM_SECONDS.labels(service.name).time()):
+                res = session.request("GET", url, params=params, timeout=hop_timeout(15))
+        except Exception as error:
+            UPSTREAM_REQUESTS.labels(service.name, error.__class__.__name__).inc()
+            raise
+        finally:
+            governor.release()
+
+        UPSTREAM_REQUESTS.labels(service.name, res.status_code).inc()
+
+        if res.status_code >= 500:
+            raise UpstreamError(res.status_code, f'{service.value} answered {res.status_code}')
+
+        return res.text
+
+
+    @bounded
+    def get_ksi(self, card_number: str, refresh: bool = False) -> Union[KSI, None]:
+        '''
+        Get the KSI session key for a card, reusing a cached one when possible
+
+        Args:
+            card_number (str): Card number
+            refresh (bool, optional): Skip the cache and run the handshake. Defaults to False.
+        Returns:
+            Union[KSI, None]: KSI
+        '''
+        if not refresh:
+            ksi = self.ksi_cache.get(str(card_number))
+            if ksi is not None:
+                KSI_LOOKUPS.labels('hit').inc()
+                return ksi
+
+        KSI_LOOKUPS.labels('miss').inc()
+
+        with stage('ksi'):
+            return self.get_card_info(card_number, only_ksi=True)
+
+
+    @bounded
+    def get_comerciales_params(self, card_number: str, itemms: str, item: str, accion: str,
+                               refresh_ksi: bool = False,
+                               since: datetime.datetime = None) -> Union[ComercialesParams, None]:
         '''
         Get comerciales parameters
 
@@ -75,29 +261,71 @@ class TarjetaMetrobusPanama(metaclass=SingletonMeta):
             itemms (str): itemms
             item (str): item
             accion (str): accion
+            refresh_ksi (bool, optional): Ignore the cached KSI. Defaults to False.
+            since (datetime.datetime, optional): Ask only for movements from this day on. Defaults to the whole window.
         Returns:
             Union[ComercialesParams, None]: ComercialesParams
         '''
 
-        card_info = self.get_card_info(card_number, only_ksi=True)
+        card_info = self.get_ksi(card_number, refresh=refresh_ksi)
 
         if card_info is None:
             return None
 
-        now = datetime.datetime.now(tz=timezone('America/Panama'))
-        now_formated = now.strftime('%Y%m%d%H%M%S')
+        return comerciales_params(card_info.ksi, itemms, item, accion, since=since)
+
+
+    @bounded
+    def get_comerciales_page(self, card_number: str, itemms: str, item: str, accion: str,
+                             marker: str, since: datetime.datetime = None,
+                             parse: bool = True) -> Union[BeautifulSoup, str, None]:
+        '''
+        Get a ComercialesPortalServlet page. When the page comes back without
+        `marker` and the KSI was taken from the cache, the portal is assumed to
+        have rejected a stale key: it is dropped and the request retried once
+        with a fresh one.
+
+        Args:
+            card_number (str): Card number
+            itemms (str): itemms
+            item (str): item
+            accion (str): accion
+            marker (str): Text the page must contain
+            since (datetime.datetime, optional): Ask only for movements from this day on. Defaults to the whole window.
+            parse (bool, optional): Parse the page; False returns its HTML, searched for `marker` as is. Defaults to True.
+        Returns:
+            Union[BeautifulSoup, str, None]: Parsed page, or its HTML
+        '''
+        refresh_ksi = False
+
+        while True:
+            cached_ksi = not refresh_ksi and str(card_number) in self.ksi_cache
+            params = self.get_comerciales_params(card_number, itemms, item, accion, refresh_ksi=refresh_ksi,
+                                                 since=since)
+
+            if params is None:
+                return None
+
+            if parse:
+                page = self.fetch(Services.COMMERCE, params.to_dict())
+                found = page.find(string=marker) is not None
+            else:
+                page = self.fetch_page(Services.COMMERCE, params.to_dict())
+                found = marker in page
 
-        return ComercialesParams.from_dict({
-            'KSI': card_info.ksi,
-            'accion': accion,
-            'itemms': itemms,
-            'item': item,
-            'DiasMov': 45,
-            'fechalogeo': now_formated,
-            'FechaInicioMovimientos': '',
-        })
+            if found:
+                return page
 
+            self.ksi_cache.pop(str(card_number))
 
+            if not cached_ksi:
+                return page
+
+            refresh_ksi = True
+
+
+    @bounded
+    @coalesced
     def get_card_resume(self, card_number: str) -> Union[CardInfoResume, None]:
         '''
         Get card info from resume
@@ -107,35 +335,38 @@ class TarjetaMetrobusPanama(metaclass=SingletonMeta):
         Returns:
             Union[KeySesionId, CardInfo]: Card info
         '''
-        params = self.get_comerciales_params(card_number, 2000, 1, 6)
+        soup = self.get_comerciales_page(card_number, *RESUME_PAGE, marker=CARD_RESUME_MARKER)
 
-        if params is None:
+        if soup is None:
             return None
-        
-        self.session = self.get_session()
-
-        url = f'{URL}/{Services.COMMERCE.value}'
-        res = self.session.request("GET", url, params=params.to_dict(), timeout=15)
 
-        soup = BeautifulSoup(res.text, "html.parser")
+        return parse_card_resume(soup)
 
-        card_info = {}
 
-        card_balance = soup.find(string='Saldo tarjeta:')
+    @bounded
+    def get_session_page(self, card_number: str) -> Union[BeautifulSoup, None]:
+        '''
+        Get the SesionPortalServlet page of a card, caching the KSI it carries
 
-        card_info_table = None
-        if card_balance is None:
-            return None
+        Args:
+            card_number (str): Card number
+        Returns:
+            Union[BeautifulSoup, None]: Parsed page, None when it has no KSI
+        '''
+        soup = self.fetch(Services.SESSION, session_params(card_number))
 
-        card_info_table = card_balance.parent.parent.parent
+        ksi = parse_ksi(soup)
 
-        if card_info_table is None:
+        if ksi is None:
             return None
 
-        card_info = bs_table_to_dict(card_info_table)
-        return CardInfoResume.from_dict(card_info)
+        self.ksi_cache.set(str(card_number), ksi)
+
+        return soup
 
 
+    @bounded
+    @coalesced
     def get_card_info(self, card_number: str, only_ksi: bool = False) -> Union[KSI, CardInfo, None]:
         '''
         Get card info
@@ -146,119 +377,255 @@ class TarjetaMetrobusPanama(metaclass=SingletonMeta):
         Returns:
             Union[KeySesionId, CardInfo]: Card info
         '''
-            
-        params = {
-            'accion': 6,
-            'NumDistribuidor': 99,
-            'NomUsuario': 'usuInternet',
-            'NomHost': 'AFT',
-            'NonDominio': 'aft.cl',
-            'RutUsuario': '0',
-            'NumTarjeta': card_number,
-            'bloqueable': ''
-        }
-        
-        self.session = self.get_session()
+        soup = self.get_session_page(card_number)
 
-        url = f'{URL}/{Services.SESSION.value}'
-        res = self.session.request("GET", url, params=params, timeout=15)
-
-        soup = BeautifulSoup(res.text, "html.parser")
+        if soup is None:
+            return None
 
-        card_info = {}
+        if only_ksi:
+            return parse_ksi(soup)
 
-        ksi_input = soup.find(attrs={'name': 'KSI'})
-        ksi_value = ksi_input['value']
+        return parse_card_info(soup)
 
-        if ksi_input is None:
-            return None
 
-        card_info['ksi'] = ksi_value
+    @bounded
+    @coalesced
+    def get_movements(self, card_number, since: MovementsCursor = None) -> Union[List[CardMovement], None]:
+        '''
+        Get movements for a card number. With a `since` timestamp the portal is
+        asked only for the movements from that day on; either kind of cursor is
+        also applied here, in case the portal ignores it.
 
-        if only_ksi:
-            return KSI(ksi=ksi_value)
+        Args:
+            card_number (str): Card number to get movements for
+            since (MovementsCursor, optional): Last seen timestamp or transaction number. Defaults to all.
 
-        card_balance = soup.find(string='Saldo  tarjeta:')
+        Returns:
+            Union[List[CardMovement], None]: Movements newer than the cursor
+        '''
+        soup = self.get_comerciales_page(card_number, *MOVEMENTS_PAGE, marker=MOVEMENTS_MARKER,
+                                         since=since if isinstance(since, datetime.datetime) else None)
 
-        card_info_table = None
-        if card_balance is None:
+        if soup is None:
             return None
 
-        card_info_table = card_balance.parent.parent.parent
+        movements = parse_movements(soup, since)
+        self.record_movements(card_number, movements)
 
-        if card_info_table is None:
-            return None
-
-        card_info = bs_table_to_dict(card_info_table)
-        return CardInfo.from_dict(card_info)
+        return movements
 
 
-    def get_movements(self, card_number) -> Union[List[CardMovement], None]:
+    @bounded
+    def iter_movements(self, card_number, since: MovementsCursor = None) -> Union[Iterator[CardMovement], None]:
         '''
-        Get movements for a card number
+        Get movements for a card number lazily: the page is fetched by the
+        call, so a missing card or a portal failure surfaces here, while its
+        rows are parsed one by one as the iterator is consumed, without
+        building a tree of the page. Movements are stored in the history,
+        when one is configured, in batches as they go by.
 
         Args:
             card_number (str): Card number to get movements for
+            since (MovementsCursor, optional): Last seen timestamp or transaction number. Defaults to all.
 
         Returns:
-            Union[List[CardMovement], None]: Movements
+            Union[Iterator[CardMovement], None]: Movements newer than the cursor, newest first
         '''
-        params = self.get_comerciales_params(card_number, 3000, 2, 1)
+        page = self.get_comerciales_page(card_number, *MOVEMENTS_PAGE, marker=MOVEMENTS_MARKER,
+                                         since=since if isinstance(since, datetime.datetime) else None,
+                                         parse=False)
 
-        if params is None:
+        rows = None if page is None else stream_movements(page)
+        if rows is None:
             return None
-        
-        self.session = self.get_session()
 
-        url = f'{URL}/{Services.COMMERCE.value}'
-        res = self.session.request("GET", url, params=params.to_dict(), timeout=15)
+        def movements() -> Iterator[CardMovement]:
+            selected = select_movements(rows, since)
 
-        soup = BeautifulSoup(res.text, "html.parser")
+            while batch := list(itertools.islice(selected, HISTORY_BATCH_SIZE)):
+                yield from batch
+                self.record_movements(card_number, batch)
+
+        return movements()
 
-        table_title = soup.find(string='Saldos y movimientos')
-        if table_title is None:
-            return None
 
-        table = table_title.parent.parent.parent.parent
-        table_data = [[cell.text.strip() for cell in row("td")] for row in table.find_all("tr")]
+    def record_movements(self, card_number: str, movements: Union[List[CardMovement], None]) -> int:
+        '''
+        Store movements in the history, when one is configured
 
-        header_name = ['to_drop', *[slugify(x, separator='_') for x in table_data[1][1:]]]
+        Args:
+            card_number (str): Card number
+            movements (Union[List[CardMovement], None]): Movements
+        Returns:
+            int: Number of new movements stored
+        '''
+        if self.history is None or not movements:
+            return 0
+
+        return self.history.record(card_number, movements)
+
+
+    @bounded
+    @coalesced
+    def sync_movements(self, card_number: str) -> Union[int, None]:
+        '''
+        Fetch the movements of a card and store the new ones in the history.
+        Only the movements since the newest stored one are requested.
 
-        table_data = table_data[2::]
-        df = pd.DataFrame(table_data)
-        df.columns = header_name
-        df = df.drop('to_drop', axis=1)
-        # df['fecha_y_hora'] = pd.to_datetime(df['fecha_y_hora'], format='%d/%m/%Y %H:%M')
-        # df.to_json(orient='records')
-        # data = CardMovement.schema().load(df.to_json(orient='records'), many=True)
-        # CardMovement.schema().dump(data, many=True)
+        Args:
+            card_number (str): Card number
+        Returns:
+            Union[int, None]: Number of new movements stored, None when the card was not found
+        Raises:
+            RuntimeError: When no history is configured
+        '''
+        if self.history is None:
+            raise RuntimeError('No movement history configured, set TMPMA_HISTORY_PATH')
+
+        latest = self.history.latest(card_number)
+        since = None if latest is None else latest.fecha_y_hora
+
+        soup = self.get_comerciales_page(card_number, *MOVEMENTS_PAGE, marker=MOVEMENTS_MARKER, since=since)
+
+        if soup is None:
+            return None
 
-        return df.apply(lambda row: CardMovement(**row), axis=1).tolist()
+        return self.history.record(card_number, parse_movements(soup, since) or [])
 
 
-    def get_card_resume_uses_charges(self, card_number: str) -> Union[CardInfoResume, None]:
+    @bounded
+    @coalesced
+    def get_card_resume_uses_charges(self, card_number: str) -> Union[CardStats, None]:
         '''
         Get card uses and charges resume in last 3 months
         Args:
         card_number (str): Card number
 
         Returns:
-            Union[KeySesionId, CardInfo]: Card info
+            Union[CardStats, None]: Card stats
+        '''
+        soup = self.get_comerciales_page(card_number, *RESUME_PAGE, marker=CARD_STATS_MARKER)
+
+        if soup is None:
+            return None
+
+        return parse_card_stats(soup)
+
+
+    @bounded
+    @coalesced
+    def get_card_snapshot(self, card_number: str, sections: Iterable[str] = None) -> Union[CardSnapshot, None]:
+        '''
+        Get several card sections at once, fetching each portal page only once.
+        The card info page also yields the KSI, and resume and stats share the
+        same ComercialesPortalServlet page.
+
+        Args:
+            card_number (str): Card number
+            sections (Iterable[str], optional): Any of SNAPSHOT_SECTIONS. Defaults to all of them.
+        Returns:
+            Union[CardSnapshot, None]: Card snapshot, None when no section was found
+        '''
+        sections = snapshot_sections(sections)
+        snapshot = CardSnapshot()
+
+        if 'info' in sections:
+            soup = self.get_session_page(card_number)
+
+            if soup is None:
+                return None
+
+            snapshot.info = parse_card_info(soup)
+
+        if 'resume' in sections or 'stats' in sections:
+            marker = CARD_RESUME_MARKER if 'resume' in sections else CARD_STATS_MARKER
+            soup = self.get_comerciales_page(card_number, *RESUME_PAGE, marker=marker)
+
+            if soup is not None:
+                if 'resume' in sections:
+                    snapshot.resume = parse_card_resume(soup)
+                if 'stats' in sections:
+                    snapshot.stats = parse_card_stats(soup)
+
+        if 'movements' in sections:
+            soup = self.get_comerciales_page(card_number, *MOVEMENTS_PAGE, marker=MOVEMENTS_MARKER)
+
+            if soup is not None:
+                snapshot.movements = parse_movements(soup)
+                self.record_movements(card_number, snapshot.movements)
+
+        if snapshot.is_empty():
+            return None
+
+        return snapshot
+
+
+    def batch_capacity(self, sections: Iterable[str] = None, seconds: float = None) -> Union[int, None]:
         '''
-        params = self.get_comerciales_params(card_number, 2000, 1, 6)
+        Most cards whose snapshots the service governors can admit within
+        `seconds`, assuming nothing else uses the portal meanwhile
 
-        if params is None:
+        Args:
+            sections (Iterable[str], optional): Any of SNAPSHOT_SECTIONS. Defaults to all of them.
+            seconds (float, optional): Time budget. Defaults to unlimited.
+        Returns:
+            Union[int, None]: Cards, None when unlimited
+        Raises:
+            ValueError: On an unknown section
+        '''
+        requests_per_card = snapshot_requests(sections)
+
+        if seconds is None:
             return None
-        
-        self.session = self.get_session()
 
-        url = f'{URL}/{Services.COMMERCE.value}'
-        res = self.session.request("GET", url, params=params.to_dict(), timeout=15)
+        capacity = min((self.governors[service].capacity(seconds) / count
+                        for service, count in requests_per_card.items() if count),
+                       default=float('inf'))
+
+        return None if capacity == float('inf') else int(capacity)
 
-        soup = BeautifulSoup(res.text, "html.parser")
 
-        data = CardStats(
-            uses=CardStat.schema().load(table_to_data(soup, 'Monto utilizado'), many=True),
-            charges=CardStat.schema().load(table_to_data(soup, 'Monto cargado'), many=True))
+    @bounded
+    def get_card_snapshots(self, card_numbers: Iterable[str], sections: Iterable[str] = None,
+                           max_workers: int = BATCH_WORKERS) -> Iterator[CardBatchResult]:
+        '''
+        Get snapshots of many cards concurrently. Results are yielded as they
+        complete, not in input order, and a failing card yields an error
+        result instead of stopping the batch.
 
-        return data
+        Args:
+            card_numbers (Iterable[str]): Card numbers
+            sections (Iterable[str], optional): Any of SNAPSHOT_SECTIONS. Defaults to all of them.
+            max_workers (int, optional): Cards looked up at once. Defaults to BATCH_WORKERS.
+        Returns:
+            Iterator[CardBatchResult]: One result per distinct card
+        Raises:
+            ValueError: On an unknown section
+        '''
+        sections = snapshot_sections(sections)
+        card_numbers = list(dict.fromkeys(str(card_number) for card_number in card_numbers))
+        # Lookups run in other threads, and after this call returns
+        deadline = current()
+
+        def lookup(card_number: str) -> CardBatchResult:
+            try:
+                with until(deadline):
+                    snapshot = self.get_card_snapshot(card_number, sections)
+            except Exception as error:
+                return CardBatchResult(card=card_number, error=str(error) or error.__class__.__name__)
+
+            if snapshot is None:
+                return CardBatchResult(card=card_number, error='Card not found')
+
+            return CardBatchResult(card=card_number, snapshot=snapshot)
+
+        def results() -> Iterator[CardBatchResult]:
+            executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='card-batch')
+            try:
+                futures = [executor.submit(lookup, card_number) for card_number in card_numbers]
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        return results()
@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+'''
+Asyncio client for Tarjeta Metrobus Panama
+
+Requires the optional `aiohttp` dependency (`poetry install -E async`).
+'''
+import asyncio
+import datetime
+import functools
+from typing import Any, Callable, Dict, Iterable, List, Union
+
+import aiohttp
+
+from bs4 import BeautifulSoup
+
+from src.core.cache import TTLCache
+from src.core.deadline import check
+from src.core.deadline import timeout as hop_timeout
+from src.core.governor import RateGovernor, UpstreamRejected
+from src.core.resilience import Resilience, UpstreamError
+
+from .metrics import KSI_LOOKUPS, UPSTREAM_IN_FLIGHT, UPSTREAM_REQUESTS, UPSTREAM_SECONDS, stage
+from .models import KSI, CardInfo, CardInfoResume, CardMovement, CardSnapshot, CardStats, Services
+from .parsers import (CARD_RESUME_MARKER,
+                      CARD_STATS_MARKER,
+                      MOVEMENTS_MARKER,
+                      MovementsCursor,
+                      check_parser_backend,
+                      make_soup,
+                      parse_card_info,
+                      parse_card_resume,
+                      parse_card_stats,
+                      parse_ksi,
+                      parse_movements)
+from .portal import (DEFAULT_HEADERS,
+                     MOVEMENTS_PAGE,
+                     RESUME_PAGE,
+                     URL,
+                     comerciales_params,
+                     session_params,
+                     snapshot_sections)
+from .settings import ASYNC_POOL_SIZE, KSI_CACHE_SIZE, KSI_CACHE_TTL
+
+# Portal request failures worth retrying, which also count against the circuit breakers
+RETRYABLE = (aiohttp.ClientError, asyncio.TimeoutError, UpstreamError)
+
+
+class AsyncTarjetaMetrobusPanama:
+    '''
+    Tarjeta Metrobus Panama, asyncio flavour. All lookups share one
+    `aiohttp.ClientSession` and its connection pool, so many cards can be in
+    flight at once from a single event loop.
+
+    Portal requests go through the same service governors and circuit
+    breakers as those of `TarjetaMetrobusPanama`, and are retried the same
+    way, but not hedged. They honour the `deadline` of the running task,
+    see `src.core.deadline`. Waiting for admission blocks a thread of the
+    default executor rather than the event loop, and pages are parsed there
+    too, so the loop keeps serving other lookups meanwhile.
+
+    Use it as an async context manager, or call `close()` when done:
+
+        async with AsyncTarjetaMetrobusPanama() as tmpma:
+            info = await tmpma.get_card_info('33070524')
+
+    Args:
+        pool_size (int, optional): Connections to the portal. Defaults to ASYNC_POOL_SIZE.
+        timeout (float, optional): Seconds each portal request may take. Defaults to 15.
+        parser (str, optional): BeautifulSoup tree builder. Defaults to HTML_PARSER.
+        url (str, optional): Portal base URL. Defaults to PORTAL_URL.
+        governors (Dict[Services, RateGovernor], optional): Admission of each service. Defaults to those
+            of the process-wide `TarjetaMetrobusPanama`, so both clients share the portal budget.
+        resilience (Dict[Services, Resilience], optional): Retries and circuit breaker of each service.
+            Defaults to those of the process-wide `TarjetaMetrobusPanama`.
+    '''
+
+    def __init__(self, pool_size: int = ASYNC_POOL_SIZE, timeout: float = 15, parser: str = None,
+                 url: str = None, governors: Dict[Services, RateGovernor] = None,
+                 resilience: Dict[Services, Resilience] = None) -> None:
+        self.url = URL if url is None else url.rstrip('/')
+        self.parser = check_parser_backend(parser)
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.ksi_cache = TTLCache(maxsize=KSI_CACHE_SIZE, ttl=KSI_CACHE_TTL)
+
+        if governors is None or resilience is None:
+            from . import TarjetaMetrobusPanama
+            shared = TarjetaMetrobusPanama()
+            governors = shared.governors if governors is None else governors
+            resilience = shared.resilience if resilience is None else resilience
+
+        self.governors = governors
+        self.resilience = resilience
+        self._session: aiohttp.ClientSession = None
+        self._session_lock = asyncio.Lock()
+
+
+    async def __aenter__(self) -> 'AsyncTarjetaMetrobusPanama':
+        await self.get_session()
+        return self
+
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        '''
+        Get the shared session to the portal, opening and warming it on first use
+
+        Returns:
+            aiohttp.ClientSession
+        Raises:
+            UpstreamError: When the portal answers the warm-up with an error status
+        '''
+        if self._session is not None and not self._session.closed:
+            return self._session
+
+        async with self._session_lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size)
+                session = aiohttp.ClientSession(connector=connector, headers=DEFAULT_HEADERS, timeout=self.timeout)
+                try:
+                    async with session.get(self.url) as res:
+                        await res.read()
+                    if res.status >= 500:
+                        raise UpstreamError(res.status, f'{self.url} answered {res.status}')
+                except BaseException:
+                    await session.close()
+                    raise
+                self._session = session
+
+        return self._session
+
+
+    async def close(self) -> None:
+        '''
+        Close the shared session and its connections
+        '''
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+    async def fetch(self, service: Services, params: dict) -> BeautifulSoup:
+        '''
+        Get and parse a portal page. Failed requests are retried under the
+        circuit breaker of the service.
+
+        Args:
+            service (Services): Portal service
+            params (dict): Query parameters
+        Returns:
+            BeautifulSoup
+        Raises:
+            UpstreamRejected: When the service governor turns the request away or its circuit is open
+            DeadlineExceeded: When the deadline of the task passes first
+            UpstreamError: When the portal keeps answering with an error status
+            aiohttp.ClientError: When the portal keeps failing to answer
+        '''
+        text = await self.resilience[service].acall(lambda: self.request_page(service, params), RETRYABLE)
+
+        return await self.run_in_executor(self.make_soup, text)
+
+
+    async def request_page(self, service: Services, params: dict) -> str:
+        '''
+        Send one portal request, once admitted by the service governor
+
+        Args:
+            service (Services): Portal service
+            params (dict): Query parameters
+        Returns:
+            str: Page
+        Raises:
+            UpstreamRejected: When the service governor turns the request away
+            DeadlineExceeded: When the deadline of the task passes first
+            UpstreamError: When the portal answers with an error status
+        '''
+        check()
+        session = await self.get_session()
+        governor = self.governors[service]
+
+        try:
+            with stage('admission'):
+                await asyncio.to_thread(governor.acquire)
+        except UpstreamRejected:
+            UPSTREAM_REQUESTS.labels(service.name, 'UpstreamRejected').inc()
+            raise
+
+        try:
+            with UPSTREAM_IN_FLIGHT.labels(service.name).track(), UPSTREAM_SECONDS.labels(service.name).time():
+                async with session.get(f'{self.url}/{service.value}', params=params,
+                                       timeout=aiohttp.ClientTimeout(total=hop_timeout(self.timeout.total))) as res:
+                    text = await res.text()
+        except Exception as error:
+            UPSTREAM_REQUESTS.labels(service.name, error.__class__.__name__).inc()
+            raise
+        finally:
+            governor.release()
+
+        UPSTREAM_REQUESTS.labels(service.name, res.status).inc()
+
+        if res.status >= 500:
+            raise UpstreamError(res.status, f'{service.value} answered {res.status}')
+
+        return text
+
+
+    def make_soup(self, text: str) -> BeautifulSoup:
+        '''
+        Parse a portal page with the parser of the client
+
+        Args:
+            text (str): Page
+        Returns:
+            BeautifulSoup
+        '''
+        with stage('soup'):
+            return make_soup(text, self.parser)
+
+
+    async def run_in_executor(self, func: Callable[..., Any], *args) -> Any:
+        '''
+        Run CPU-bound work, such as parsing a page, in the default executor,
+        off the event loop
+
+        Args:
+            func (Callable[..., Any]): Function
+            *args: Its arguments
+        Returns:
+            Any: Its result
+        '''
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+
+    async def get_ksi(self, card_number: str, refresh: bool = False) -> Union[KSI, None]:
+        '''
+        Get the KSI session key for a card, reusing a cached one when possible
+
+        Args:
+            card_number (str): Card number
+            refresh (bool, optional): Skip the cache and run the handshake. Defaults to False.
+        Returns:
+            Union[KSI, None]: KSI
+        '''
+        if not refresh:
+            ksi = self.ksi_cache.get(str(card_number))
+            if ksi is not None:
+                KSI_LOOKUPS.labels('hit').inc()
+                return ksi
+
+        KSI_LOOKUPS.labels('miss').inc()
+
+        with stage('ksi'):
+            return await self.get_card_info(card_number, only_ksi=True)
+
+
+    async def get_comerciales_page(self, card_number: str, itemms: str, item: str, accion: str,
+                                   marker: str, since: datetime.datetime = None) -> Union[BeautifulSoup, None]:
+        '''
+        Get a ComercialesPortalServlet page, renewing a cached KSI once if the
+        portal rejects it
+
+        Args:
+            card_number (str): Card number
+            itemms (str): itemms
+            item (str): item
+            accion (str): accion
+            marker (str): Text the page must contain
+            since (datetime.datetime, optional): Ask only for movements from this day on. Defaults to the whole window.
+        Returns:
+            Union[BeautifulSoup, None]: Parsed page
+        '''
+        refresh_ksi = False
+
+        while True:
+            cached_ksi = not refresh_ksi and str(card_number) in self.ksi_cache
+            ksi = await self.get_ksi(card_number, refresh=refresh_ksi)
+
+            if ksi is None:
+                return None
+
+            params = comerciales_params(ksi.ksi, itemms, item, accion, since=since)
+            soup = await self.fetch(Services.COMMERCE, params.to_dict())
+
+            if soup.find(string=marker) is not None:
+                return soup
+
+            self.ksi_cache.pop(str(card_number))
+
+            if not cached_ksi:
+                return soup
+
+            refresh_ksi = True
+
+
+    async def get_session_page(self, card_number: str) -> Union[BeautifulSoup, None]:
+        '''
+        Get the SesionPortalServlet page of a card, caching the KSI it carries
+
+        Args:
+            card_number (str): Card number
+        Returns:
+            Union[BeautifulSoup, None]: Parsed page, None when it has no KSI
+        '''
+        soup = await self.fetch(Services.SESSION, session_params(card_number))
+
+        ksi = parse_ksi(soup)
+
+        if ksi is None:
+            return None
+
+        self.ksi_cache.set(str(card_number), ksi)
+
+        return soup
+
+
+    async def get_card_info(self, card_number: str, only_ksi: bool = False) -> Union[KSI, CardInfo, None]:
+        '''
+        Get card info
+
+        Args:
+            card_number (str): Card number
+            only_ksi (bool, optional): Only return KSI. Defaults to False.
+        Returns:
+            Union[KSI, CardInfo, None]: Card info
+        '''
+        soup = await self.get_session_page(card_number)
+
+        if soup is None:
+            return None
+
+        if only_ksi:
+            return parse_ksi(soup)
+
+        return await self.run_in_executor(parse_card_info, soup)
+
+
+    async def get_card_resume(self, card_number: str) -> Union[CardInfoResume, None]:
+        '''
+        Get card info from resume
+
+        Args:
+            card_number (str): Card number
+        Returns:
+            Union[CardInfoResume, None]: Card resume
+        '''
+        soup = await self.get_comerciales_page(card_number, *RESUME_PAGE, marker=CARD_RESUME_MARKER)
+
+        if soup is None:
+            return None
+
+        return await self.run_in_executor(parse_card_resume, soup)
+
+
+    async def get_movements(self, card_number: str, since: MovementsCursor = None) -> Union[List[CardMovement], None]:
+        '''
+        Get movements for a card number. With a `since` timestamp the portal is
+        asked only for the movements from that day on; either kind of cursor is
+        also applied here, in case the portal ignores it.
+
+        Args:
+            card_number (str): Card number to get movements for
+            since (MovementsCursor, optional): Last seen timestamp or transaction number. Defaults to all.
+        Returns:
+            Union[List[CardMovement], None]: Movements newer than the cursor
+        '''
+        soup = await self.get_comerciales_page(card_number, *MOVEMENTS_PAGE, marker=MOVEMENTS_MARKER,
+                                               since=since if isinstance(since, datetime.datetime) else None)
+
+        if soup is None:
+            return None
+
+        return await self.run_in_executor(parse_movements, soup, since)
+
+
+    async def get_card_resume_uses_charges(self, card_number: str) -> Union[CardStats, None]:
+        '''
+        Get card uses and charges resume in last 3 months
+
+        Args:
+            card_number (str): Card number
+        Returns:
+            Union[CardStats, None]: Card stats
+        '''
+        soup = await self.get_comerciales_page(card_number, *RESUME_PAGE, marker=CARD_STATS_MARKER)
+
+        if soup is None:
+            return None
+
+        return await self.run_in_executor(parse_card_stats, soup)
+
+
+    async def get_card_snapshot(self, card_number: str, sections: Iterable[str] = None) -> Union[CardSnapshot, None]:
+        '''
+        Get several card sections at once, fetching each portal page only
+        once. Once the KSI is known the remaining pages are fetched concurrently.
+
+        Args:
+            card_number (str): Card number
+            sections (Iterable[str], optional): Any of SNAPSHOT_SECTIONS. Defaults to all of them.
+        Returns:
+            Union[CardSnapshot, None]: Card snapshot, None when no section was found
+        '''
+        sections = snapshot_sections(sections)
+        snapshot = CardSnapshot()
+
+        if 'info' in sections:
+            soup = await self.get_session_page(card_number)
+
+            if soup is None:
+                return None
+
+            snapshot.info = await self.run_in_executor(parse_card_info, soup)
+        elif await self.get_ksi(card_number) is None:
+            return None
+
+        async def resume_page() -> None:
+            marker = CARD_RESUME_MARKER if 'resume' in sections else CARD_STATS_MARKER
+            soup = await self.get_comerciales_page(card_number, *RESUME_PAGE, marker=marker)
+
+            if soup is not None:
+                if 'resume' in sections:
+                    snapshot.resume = await self.run_in_executor(parse_card_resume, soup)
+                if 'stats' in sections:
+                    snapshot.stats = await self.run_in_executor(parse_card_stats, soup)
+
+        async def movements_page() -> None:
+            soup = await self.get_comerciales_page(card_number, *MOVEMENTS_PAGE, marker=MOVEMENTS_MARKER)
+
+            if soup is not None:
+                snapshot.movements = await self.run_in_executor(parse_movements, soup)
+
+        pages = []
+        if 'resume' in sections or 'stats' in sections:
+            pages.append(resume_page())
+        if 'movements' in sections:
+            pages.append(movements_page())
+
+        await asyncio.gather(*pages)
+
+        if snapshot.is_empty():
+            return None
+
+        return snapshot
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+'''
+Analytics helpers for Tarjeta Metrobus Panama
+
+Requires the optional `pandas` dependency (`poetry install -E analytics`).
+'''
+from dataclasses import asdict, fields
+from typing import Iterable
+
+import pandas as pd
+
+from .metrics import timed
+from .models import CardMovement
+
+
+@timed('dataframe')
+def movements_to_dataframe(movements: Iterable[CardMovement]) -> pd.DataFrame:
+    '''
+    Convert movements to a DataFrame, with float amounts
+
+    Args:
+        movements (Iterable[CardMovement]): Movements
+    Returns:
+        pd.DataFrame
+    '''
+    df = pd.DataFrame([asdict(movement) for movement in movements],
+                      columns=[field.name for field in fields(CardMovement)])
+    df['monto'] = df['monto'].astype(float)
+    df['saldo_tarjeta'] = df['saldo_tarjeta'].astype(float)
+
+    return df
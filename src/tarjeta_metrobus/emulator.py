@@ -0,0 +1,484 @@
+# -*- coding: utf-8 -*-
+'''
+Local stand-in for the Metrobus portal
+
+Serves SesionPortalServlet and ComercialesPortalServlet pages built from
+synthetic, deterministic card data, so the client can be load-tested and
+benchmarked offline. Latency, jitter and error rates are configurable.
+
+    poetry run portal-emulator --port 8099 --latency 0.2 --jitter 0.1
+    TMPMA_PORTAL_URL=http://127.0.0.1:8099/PortalCAE-WAR-MODULE poetry run app
+'''
+import argparse
+import datetime
+import random
+import secrets
+import threading
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from html import escape
+from typing import Dict, List, Union
+
+from flask import Flask, Response, request
+from pytz import timezone
+
+from src.core.utils import env_float, env_int
+
+from .models import Services
+from .portal import MOVEMENTS_SINCE_FORMAT
+
+PANAMA = timezone('America/Panama')
+MONTHS = ('Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio',
+          'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre')
+PLACES = ('Albrook', 'Cinco de Mayo', 'Via Argentina', 'San Miguelito', 'Los Andes',
+          'Pueblo Nuevo', 'Fernandez de Cordoba', 'Iglesia del Carmen', 'Santo Tomas', 'Loteria')
+# Text formats of the portal pages. They are kept apart from the client's
+# formatters on purpose, so a client that re-renders values instead of
+# returning the portal text unchanged shows up against the emulator.
+BALANCE_DATE_FORMAT = '%d/%m/%Y %H:%M:%S'
+MOVEMENT_DATE_FORMAT = '%d/%m/%Y %H:%M'
+
+
+def _portal_amount(value: Decimal) -> str:
+    return 'B/. ' + f'{value:.2f}'.replace('.', ',')
+
+
+@dataclass
+class EmulatorConfig:
+    '''
+    Emulator behaviour
+    '''
+    latency: float = env_float('TMPMA_EMULATOR_LATENCY', 0)
+    jitter: float = env_float('TMPMA_EMULATOR_JITTER', 0)
+    error_rate: float = env_float('TMPMA_EMULATOR_ERROR_RATE', 0)
+    missing_rate: float = env_float('TMPMA_EMULATOR_MISSING_RATE', 0)
+    movements_per_day: float = env_float('TMPMA_EMULATOR_MOVEMENTS_PER_DAY', 2)
+    history_days: int = env_int('TMPMA_EMULATOR_HISTORY_DAYS', 120)
+    ksi_ttl: float = env_float('TMPMA_EMULATOR_KSI_TTL', 600)
+    seed: int = env_int('TMPMA_EMULATOR_SEED', 0)
+
+
+@dataclass
+class SyntheticMovement:
+    '''
+    One synthetic card movement
+    '''
+    no_transaccion: int
+    movimiento: str
+    fecha_y_hora: datetime.datetime
+    lugar: str
+    monto: Decimal
+    saldo_tarjeta: Decimal
+
+
+@dataclass
+class SyntheticCard:
+    '''
+    Synthetic card, derived deterministically from its number
+    '''
+    number: str
+    estado: str
+    tipo: str
+    balance: Decimal
+    updated_at: datetime.datetime
+    movements: List[SyntheticMovement] = field(default_factory=list)
+
+    @classmethod
+    def generate(cls, number: str, config: EmulatorConfig = None,
+                 now: datetime.datetime = None, movements: int = None) -> 'SyntheticCard':
+        '''
+        Build the card for a number
+
+        Args:
+            number (str): Card number
+            config (EmulatorConfig, optional): Emulator config. Defaults to EmulatorConfig().
+            now (datetime.datetime, optional): Time of the last movement. Defaults to the current hour.
+            movements (int, optional): Exact number of movements. Defaults to the config rate.
+        Returns:
+            SyntheticCard
+        '''
+        config = EmulatorConfig() if config is None else config
+        now = datetime.datetime.now(tz=PANAMA).replace(minute=0, second=0, microsecond=0) if now is None else now
+        rng = random.Random(f'{config.seed}:{number}')
+
+        if movements is None:
+            movements = int(config.history_days * config.movements_per_day)
+
+        step = datetime.timedelta(days=config.history_days) / max(movements, 1)
+        balance = Decimal(rng.randint(0, 2000)) / 100
+        no_transaccion = rng.randint(100000, 900000)
+        history = []
+
+        for index in range(movements):
+            when = now - step * (movements - index) + datetime.timedelta(minutes=rng.randint(0, 59))
+
+            if rng.random() < 0.1:
+                amount = Decimal(rng.choice((5, 10, 20)))
+                movimiento = 'Carga'
+            else:
+                amount = -Decimal(rng.choice(('0.35', '0.50', '1.25')))
+                movimiento = 'Uso'
+                if balance + amount < 0:
+                    amount = Decimal(10)
+                    movimiento = 'Carga'
+
+            balance += amount
+            no_transaccion += rng.randint(1, 50)
+            history.append(SyntheticMovement(no_transaccion=no_transaccion,
+                                             movimiento=movimiento,
+                                             fecha_y_hora=when,
+                                             lugar=rng.choice(PLACES),
+                                             monto=amount,
+                                             saldo_tarjeta=balance))
+
+        return cls(number=str(number),
+                   estado='Activa' if rng.random() > 0.05 else 'Bloqueada',
+                   tipo=rng.choice(('Normal', 'Normal', 'Normal', 'Estudiante', 'Jubilado')),
+                   balance=balance,
+                   updated_at=history[-1].fecha_y_hora if history else now,
+                   movements=history)
+
+
+    def monthly(self, kind: str, months: int = 3) -> List[tuple]:
+        '''
+        Sum uses or charges per month, oldest first
+
+        Args:
+            kind (str): 'Uso' or 'Carga'
+            months (int, optional): Number of months. Defaults to 3.
+        Returns:
+            List[tuple]: (month name, amount, count)
+        '''
+        totals = {}
+        for movement in self.movements:
+            if movement.movimiento == kind:
+                key = (movement.fecha_y_hora.year, movement.fecha_y_hora.month)
+                amount, count = totals.get(key, (Decimal(0), 0))
+                totals[key] = (amount + abs(movement.monto), count + 1)
+
+        year, month = self.updated_at.year, self.updated_at.month
+        keys = []
+        for _ in range(months):
+            keys.insert(0, (year, month))
+            year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+
+        return [(MONTHS[key[1] - 1], *totals.get(key, (Decimal(0), 0))) for key in keys]
+
+
+def _page(body: str) -> str:
+    return ('<html><head><title>Tarjeta Metrobus</title></head>'
+            f'<body bgcolor="#FFFFFF">{body}</body></html>')
+
+
+def render_landing_page() -> str:
+    '''
+    Render the portal landing page
+    '''
+    return _page('<table width="100%"><tr><td class="titulo">Portal CAE</td></tr></table>')
+
+
+def render_error_page(message: str) -> str:
+    '''
+    Render the page the portal shows on errors
+
+    Args:
+        message (str): Error message
+    '''
+    return _page(f'<table><tr><td class="error">{escape(message)}</td></tr></table>')
+
+
+def render_session_page(card: SyntheticCard, ksi: str) -> str:
+    '''
+    Render the SesionPortalServlet page of a card
+
+    Args:
+        card (SyntheticCard): Card
+        ksi (str): Session key
+    '''
+    return _page(
+        '<form name="formulario" method="post" action="ComercialesPortalServlet">'
+        f'<input type="hidden" name="KSI" value="{ksi}">'
+        '<input type="hidden" name="accion" value="6">'
+        '</form>'
+        '<table width="100%" border="0" cellpadding="2" cellspacing="1">'
+        '<tr>'
+        '<td class="verdanabold-ckc">No. tarjeta:</td>'
+        f'<td class="verdana-ckc">{card.number}</td>'
+        '<td class="verdanabold-ckc">Estado de contrato:</td>'
+        f'<td class="verdana-ckc">{"Activo" if card.estado == "Activa" else "Inactivo"}</td>'
+        '</tr><tr>'
+        '<td class="verdanabold-ckc">Saldo  tarjeta:</td>'
+        f'<td class="verdana-ckc">{_portal_amount(card.balance)}</td>'
+        '<td class="verdanabold-ckc">Fecha saldo:</td>'
+        f'<td class="verdana-ckc">{card.updated_at.strftime(BALANCE_DATE_FORMAT)}</td>'
+        '</tr></table>')
+
+
+def _stats_table(title: str, label: str, rows: List[tuple]) -> str:
+    return (
+        '<table width="100%" border="0" cellpadding="2" cellspacing="1">'
+        f'<tr><td colspan="4"><span class="titulo">{title}</span></td></tr>'
+        '<tr><td class="verdanabold-ckc">Mes</td>'
+        + ''.join(f'<td class="verdanabold-ckc">{month}</td>' for month, _, _ in rows) +
+        '</tr><tr><td class="verdanabold-ckc">Monto</td>'
+        + ''.join(f'<td class="verdana-ckc">{_portal_amount(amount)}</td>' for _, amount, _ in rows) +
+        f'</tr><tr><td class="verdanabold-ckc">{label}</td>'
+        + ''.join(f'<td class="verdana-ckc">{count}</td>' for _, _, count in rows) +
+        '</tr></table>')
+
+
+def render_resume_page(card: SyntheticCard) -> str:
+    '''
+    Render the ComercialesPortalServlet resume page of a card, which also
+    holds the uses and charges of the last 3 months
+
+    Args:
+        card (SyntheticCard): Card
+    '''
+    return _page(
+        '<table width="100%" border="0" cellpadding="2" cellspacing="1">'
+        '<tr>'
+        '<td class="verdanabold-ckc">No. tarjeta:</td>'
+        f'<td class="verdana-ckc">{card.number}</td>'
+        '<td class="verdanabold-ckc">Estado tarjeta:</td>'
+        f'<td class="verdana-ckc">{card.estado}</td>'
+        '</tr><tr>'
+        '<td class="verdanabold-ckc">Tipo de tarjeta:</td>'
+        f'<td class="verdana-ckc">{card.tipo}</td>'
+        '<td class="verdanabold-ckc">Saldo tarjeta:</td>'
+        f'<td class="verdana-ckc">{_portal_amount(card.balance)}</td>'
+        '</tr></table><br>'
+        + _stats_table('Monto utilizado', 'Usos', card.monthly('Uso'))
+        + '<br>'
+        + _stats_table('Monto cargado', 'Cargas', card.monthly('Carga')))
+
+
+def render_movements_page(card: SyntheticCard, days: int = None,
+                          since: datetime.datetime = None) -> str:
+    '''
+    Render the ComercialesPortalServlet movements page of a card, newest first
+
+    Args:
+        card (SyntheticCard): Card
+        days (int, optional): Only movements of the last `days` days. Defaults to all.
+        since (datetime.datetime, optional): Only movements at or after this time. Defaults to all.
+    '''
+    movements = card.movements
+    if days is not None:
+        start = card.updated_at - datetime.timedelta(days=days)
+        movements = [movement for movement in movements if movement.fecha_y_hora >= start]
+    if since is not None:
+        movements = [movement for movement in movements if movement.fecha_y_hora >= since]
+
+    rows = ''.join(
+        '<tr>'
+        f'<td><img src="images/{"carga" if movement.movimiento == "Carga" else "uso"}.gif"></td>'
+        f'<td class="verdana-ckc">{movement.no_transaccion}</td>'
+        f'<td class="verdana-ckc">{movement.movimiento}</td>'
+        f'<td class="verdana-ckc">{movement.fecha_y_hora.strftime(MOVEMENT_DATE_FORMAT)}</td>'
+        f'<td class="verdana-ckc">{escape(movement.lugar)}</td>'
+        f'<td class="verdana-ckc">{_portal_amount(movement.monto)}</td>'
+        f'<td class="verdana-ckc">{_portal_amount(movement.saldo_tarjeta)}</td>'
+        '</tr>'
+        for movement in reversed(movements))
+
+    return _page(
+        '<table width="100%" border="0" cellpadding="2" cellspacing="1">'
+        '<tr><td colspan="7"><span class="titulo">Saldos y movimientos</span></td></tr>'
+        '<tr><td>&nbsp;</td>'
+        '<td class="verdanabold-ckc">No. transacción</td>'
+        '<td class="verdanabold-ckc">Movimiento</td>'
+        '<td class="verdanabold-ckc">Fecha y hora</td>'
+        '<td class="verdanabold-ckc">Lugar</td>'
+        '<td class="verdanabold-ckc">Monto</td>'
+        '<td class="verdanabold-ckc">Saldo tarjeta</td>'
+        f'</tr>{rows}</table>')
+
+
+class PortalEmulator:
+    '''
+    Emulated portal state: issued KSI values and generated cards
+    '''
+
+    def __init__(self, config: EmulatorConfig = None) -> None:
+        self.config = EmulatorConfig() if config is None else config
+        self.rng = random.Random(self.config.seed)
+        self._cards: Dict[str, SyntheticCard] = {}
+        self._ksi: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+
+    def card(self, number: str) -> Union[SyntheticCard, None]:
+        '''
+        Get the synthetic card for a number, None for missing cards
+
+        Args:
+            number (str): Card number
+        Returns:
+            Union[SyntheticCard, None]
+        '''
+        if random.Random(f'{self.config.seed}:missing:{number}').random() < self.config.missing_rate:
+            return None
+
+        with self._lock:
+            card = self._cards.get(number)
+
+        if card is None:
+            card = SyntheticCard.generate(number, self.config)
+            with self._lock:
+                card = self._cards.setdefault(number, card)
+
+        return card
+
+
+    def issue_ksi(self, number: str) -> str:
+        '''
+        Issue a session key for a card
+
+        Args:
+            number (str): Card number
+        Returns:
+            str
+        '''
+        ksi = secrets.token_hex(16).upper()
+
+        with self._lock:
+            now = time.monotonic()
+            self._ksi = {key: value for key, value in self._ksi.items() if value[1] > now}
+            self._ksi[ksi] = (number, now + self.config.ksi_ttl)
+
+        return ksi
+
+
+    def resolve_ksi(self, ksi: str) -> Union[str, None]:
+        '''
+        Get the card a session key was issued for, None when unknown or expired
+
+        Args:
+            ksi (str): Session key
+        Returns:
+            Union[str, None]: Card number
+        '''
+        with self._lock:
+            item = self._ksi.get(ksi)
+
+        if item is None or item[1] <= time.monotonic():
+            return None
+
+        return item[0]
+
+
+    def delay(self) -> None:
+        '''
+        Sleep for the configured latency plus jitter
+        '''
+        with self._lock:
+            seconds = self.config.latency + self.rng.uniform(0, self.config.jitter)
+
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+    def should_fail(self) -> bool:
+        '''
+        Whether the current request should fail
+        '''
+        with self._lock:
+            return self.rng.random() < self.config.error_rate
+
+
+def create_app(config: EmulatorConfig = None) -> Flask:
+    '''
+    Build the emulator Flask app
+
+    Args:
+        config (EmulatorConfig, optional): Emulator config. Defaults to EmulatorConfig().
+    Returns:
+        Flask
+    '''
+    emulator = PortalEmulator(config)
+    app = Flask(__name__)
+    app.config['EMULATOR'] = emulator
+
+    def html(body: str, status: int = 200) -> Response:
+        return Response(body, status=status, mimetype='text/html')
+
+    @app.before_request
+    def simulate_network():
+        emulator.delay()
+        if emulator.should_fail():
+            return html(render_error_page('Error interno del servidor'), 500)
+        return None
+
+    @app.route('/PortalCAE-WAR-MODULE', strict_slashes=False)
+    def landing():
+        return html(render_landing_page())
+
+    @app.route(f'/PortalCAE-WAR-MODULE/{Services.SESSION.value}')
+    def session_servlet():
+        number = request.args.get('NumTarjeta', '')
+        card = emulator.card(number) if number.isdigit() else None
+
+        if card is None:
+            return html(render_error_page('Tarjeta no existe'))
+
+        return html(render_session_page(card, emulator.issue_ksi(number)))
+
+    @app.route(f'/PortalCAE-WAR-MODULE/{Services.COMMERCE.value}')
+    def commerce_servlet():
+        number = emulator.resolve_ksi(request.args.get('KSI', ''))
+
+        if number is None:
+            return html(render_error_page('Su sesion ha expirado'))
+
+        card = emulator.card(number)
+
+        if request.args.get('item') == '2':
+            days = request.args.get('DiasMov', type=int)
+            since = None
+            if request.args.get('FechaInicioMovimientos'):
+                try:
+                    since = PANAMA.localize(datetime.datetime.strptime(request.args['FechaInicioMovimientos'],
+                                                                       MOVEMENTS_SINCE_FORMAT))
+                except ValueError:
+                    since = None
+            return html(render_movements_page(card, days=days, since=since))
+
+        return html(render_resume_page(card))
+
+    return app
+
+
+def main():
+    '''
+    Run the portal emulator
+    '''
+    defaults = EmulatorConfig()
+    parser = argparse.ArgumentParser(description='Local stand-in for the Metrobus portal')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=env_int('TMPMA_EMULATOR_PORT', 8099))
+    parser.add_argument('--latency', type=float, default=defaults.latency, help='Base latency in seconds')
+    parser.add_argument('--jitter', type=float, default=defaults.jitter, help='Extra random latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=defaults.error_rate, help='Share of requests answered 500')
+    parser.add_argument('--missing-rate', type=float, default=defaults.missing_rate, help='Share of unknown cards')
+    parser.add_argument('--movements-per-day', type=float, default=defaults.movements_per_day)
+    parser.add_argument('--history-days', type=int, default=defaults.history_days)
+    parser.add_argument('--ksi-ttl', type=float, default=defaults.ksi_ttl, help='Seconds a KSI stays valid')
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    config = EmulatorConfig(latency=args.latency,
+                            jitter=args.jitter,
+                            error_rate=args.error_rate,
+                            missing_rate=args.missing_rate,
+                            movements_per_day=args.movements_per_day,
+                            history_days=args.history_days,
+                            ksi_ttl=args.ksi_ttl,
+                            seed=args.seed)
+
+    create_app(config).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
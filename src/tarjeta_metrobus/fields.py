@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+'''
+Typed dataclass fields for the models. A portal value is kept twice: the
+text exactly as the portal showed it, output under its original camelCase
+key so that JSON stays a compatible view of the portal, and the value
+parsed once when the model is built, output under a new `...Value` key.
+'''
+import datetime
+import logging
+from dataclasses import field
+from decimal import Decimal
+from typing import Any, Callable, Optional, Tuple, Union
+
+from dataclasses_json import config
+from marshmallow import fields as mm_fields
+
+from .utils import format_amount, format_count, format_datetime, parse_amount, parse_count, parse_datetime
+
+logger = logging.getLogger(__name__)
+
+
+class PortalValueField(mm_fields.Field):
+    '''
+    Marshmallow field that loads a typed value from its JSON rendering, or
+    from portal text, and dumps its JSON rendering
+    '''
+
+    def __init__(self, parse: Callable[[Any], Any], render: Callable[[Any], Any], **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.parse = parse
+        self.render = render
+
+    def _serialize(self, value, attr, obj, **kwargs):
+        return self.render(value)
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        return self.parse(value)
+
+
+def _keep(value: Any) -> Any:
+    # Decoding leaves text as is, __post_init__ keeps it and parses it
+    return value
+
+
+def _decimal_text(value: Union[Decimal, None]) -> Union[str, None]:
+    return None if value is None else str(value)
+
+
+def _isoformat(value: Union[datetime.datetime, None]) -> Union[str, None]:
+    return None if value is None else value.isoformat()
+
+
+def _integer(value: Union[int, None]) -> Union[int, None]:
+    return value
+
+
+def _value_field(data_key: str, parse: Callable[[Any], Any], render: Callable[[Any], Any], default: Any):
+    return field(default=default,
+                 metadata=config(field_name=data_key,
+                                 encoder=render,
+                                 decoder=_keep,
+                                 mm_field=PortalValueField(parse, render, data_key=data_key,
+                                                           allow_none=True, load_default=None)))
+
+
+def amount_field(data_key: str, default: Any = None):
+    '''
+    Decimal amount, output as a decimal string such as "1.25"
+
+    Args:
+        data_key (str): camelCase JSON key
+        default (Any): Default value, MISSING for a required field
+    '''
+    return _value_field(data_key, parse_amount, _decimal_text, default)
+
+
+def datetime_field(data_key: str, default: Any = None):
+    '''
+    Timezone-aware timestamp, output in ISO 8601
+
+    Args:
+        data_key (str): camelCase JSON key
+        default (Any): Default value, MISSING for a required field
+    '''
+    return _value_field(data_key, parse_datetime, _isoformat, default)
+
+
+def count_field(data_key: str, default: Any = None):
+    '''
+    Integer count, output as a JSON number
+
+    Args:
+        data_key (str): camelCase JSON key
+        default (Any): Default value, MISSING for a required field
+    '''
+    return _value_field(data_key, parse_count, _integer, default)
+
+
+def text_field(data_key: str):
+    '''
+    Portal text of a typed value, output unchanged under its original key
+
+    Args:
+        data_key (str): camelCase JSON key
+    '''
+    return field(default=None,
+                 metadata=config(field_name=data_key,
+                                 mm_field=mm_fields.String(data_key=data_key, allow_none=True)))
+
+
+def portal_value(value: Any,
+                 text: Optional[str],
+                 parse: Callable[[Any], Any],
+                 render: Callable[[Any], str],
+                 name: str) -> Tuple[Any, Optional[str]]:
+    '''
+    Settle a typed value and its portal text. Text given as the value is
+    kept as the portal text, unless the text is known already, and parsed.
+    A value given without text, e.g. read back from the history, gets text
+    rendered in the portal format.
+
+    Args:
+        value (Any): Typed value, its JSON rendering or portal text
+        text (Optional[str]): Portal text, if known
+        parse (Callable[[Any], Any]): Parser of the portal text
+        render (Callable[[Any], str]): Formatter to the portal text
+        name (str): Field name, for the log
+    Returns:
+        Tuple[Any, Optional[str]]: Typed value and portal text
+    '''
+    if text is not None and not isinstance(text, str):
+        # A typed value decoded under the portal text key
+        value, text = text, None
+
+    if isinstance(value, str):
+        if text is None:
+            text = value
+    elif value is None and text is not None:
+        value = text
+
+    parsed = parse(value)
+
+    if parsed is None and isinstance(value, str) and value.strip():
+        logger.warning('Unreadable %s %r, keeping the portal text only', name, value)
+
+    if text is None and parsed is not None:
+        text = render(parsed)
+
+    return parsed, text
+
+
+def settle_amount(value: Any, text: Optional[str], name: str) -> Tuple[Optional[Decimal], Optional[str]]:
+    '''
+    `portal_value` for an amount
+    '''
+    return portal_value(value, text, parse_amount, format_amount, name)
+
+
+def settle_datetime(value: Any, text: Optional[str], name: str) -> Tuple[Optional[datetime.datetime], Optional[str]]:
+    '''
+    `portal_value` for a timestamp
+    '''
+    return portal_value(value, text, parse_datetime, format_datetime, name)
+
+
+def settle_count(value: Any, text: Optional[str], name: str) -> Tuple[Optional[int], Optional[str]]:
+    '''
+    `portal_value` for a count
+    '''
+    return portal_value(value, text, parse_count, format_count, name)
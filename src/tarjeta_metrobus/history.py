@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+'''
+Local movement history
+
+The portal only shows the last 45 days of movements. `MovementHistory`
+keeps every movement ever seen in an SQLite database keyed by card and
+transaction number, so older movements survive and range queries run
+against local indexes without touching the portal.
+'''
+import datetime
+import os
+import sqlite3
+import threading
+import weakref
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Union
+
+from .models import CardMovement
+from .utils import PANAMA_TZINFO
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS movements (
+    card TEXT NOT NULL,
+    no_transaccion TEXT NOT NULL,
+    movimiento TEXT NOT NULL,
+    fecha_y_hora INTEGER,
+    lugar TEXT NOT NULL,
+    monto TEXT,
+    saldo_tarjeta TEXT,
+    fecha_y_hora_text TEXT,
+    monto_text TEXT,
+    saldo_tarjeta_text TEXT,
+    PRIMARY KEY (card, no_transaccion)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS movements_card_fecha ON movements (card, fecha_y_hora);
+'''
+
+INSERT = '''
+INSERT INTO movements (card, no_transaccion, movimiento, fecha_y_hora, lugar, monto, saldo_tarjeta,
+                       fecha_y_hora_text, monto_text, saldo_tarjeta_text)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (card, no_transaccion) DO NOTHING
+'''
+
+COLUMNS = ('no_transaccion, movimiento, fecha_y_hora, lugar, monto, saldo_tarjeta,'
+           ' fecha_y_hora_text, monto_text, saldo_tarjeta_text')
+
+# Portal text columns added after the first release, for databases created before
+TEXT_COLUMNS = ('fecha_y_hora_text', 'monto_text', 'saldo_tarjeta_text')
+
+
+def _timestamp(value: Union[datetime.datetime, None]) -> Union[int, None]:
+    if value is None:
+        return None
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=PANAMA_TZINFO)
+
+    return int(value.timestamp())
+
+
+def _amount(value: Union[Decimal, None]) -> Union[str, None]:
+    return None if value is None else str(value)
+
+
+def _reconnect_after_fork(ref: 'weakref.ref[MovementHistory]') -> None:
+    history = ref()
+    if history is not None:
+        history._reconnect()
+
+
+def _movement(row: tuple) -> CardMovement:
+    (no_transaccion, movimiento, fecha_y_hora, lugar, monto, saldo_tarjeta,
+     fecha_y_hora_text, monto_text, saldo_tarjeta_text) = row
+
+    return CardMovement(
+        no_transaccion=no_transaccion,
+        movimiento=movimiento,
+        fecha_y_hora=None if fecha_y_hora is None else datetime.datetime.fromtimestamp(fecha_y_hora, PANAMA_TZINFO),
+        lugar=lugar,
+        monto=None if monto is None else Decimal(monto),
+        saldo_tarjeta=None if saldo_tarjeta is None else Decimal(saldo_tarjeta),
+        fecha_y_hora_text=fecha_y_hora_text,
+        monto_text=monto_text,
+        saldo_tarjeta_text=saldo_tarjeta_text)
+
+
+class MovementHistory:
+    '''
+    SQLite store of card movements. Movements are immutable on the portal,
+    so recording one that is already stored is a no-op. One connection is
+    shared by all threads behind a lock.
+
+    An SQLite connection must not be used on both sides of a fork, so a
+    forked process, e.g. a gunicorn worker, opens its own connection to
+    the same file.
+    '''
+
+    def __init__(self, path: str = ':memory:') -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = self._connect()
+
+        with self._lock, self._connection:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(SCHEMA)
+            existing = {column[1] for column in self._connection.execute('PRAGMA table_info(movements)')}
+            for column in TEXT_COLUMNS:
+                if column not in existing:
+                    self._connection.execute(f'ALTER TABLE movements ADD COLUMN {column} TEXT')
+
+        if path != ':memory:' and hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=lambda ref=weakref.ref(self): _reconnect_after_fork(ref))
+
+
+    def record(self, card_number: str, movements: Iterable[CardMovement]) -> int:
+        '''
+        Store the movements not seen before. Movements without a transaction
+        number cannot be keyed and are skipped.
+
+        Args:
+            card_number (str): Card number
+            movements (Iterable[CardMovement]): Movements, e.g. from `get_movements`
+        Returns:
+            int: Number of new movements stored
+        '''
+        card_number = str(card_number)
+        rows = [(card_number,
+                 movement.no_transaccion,
+                 movement.movimiento,
+                 _timestamp(movement.fecha_y_hora),
+                 movement.lugar,
+                 _amount(movement.monto),
+                 _amount(movement.saldo_tarjeta),
+                 movement.fecha_y_hora_text,
+                 movement.monto_text,
+                 movement.saldo_tarjeta_text)
+                for movement in movements if movement.no_transaccion]
+
+        if not rows:
+            return 0
+
+        with self._lock, self._connection:
+            before = self._connection.total_changes
+            self._connection.executemany(INSERT, rows)
+            return self._connection.total_changes - before
+
+
+    def movements(self, card_number: str, start: datetime.datetime = None, end: datetime.datetime = None,
+                  limit: int = None) -> List[CardMovement]:
+        '''
+        Stored movements of a card, newest first like the portal shows them
+
+        Args:
+            card_number (str): Card number
+            start (datetime.datetime, optional): Earliest timestamp, inclusive. Naive values are Panama time.
+            end (datetime.datetime, optional): Latest timestamp, exclusive. Naive values are Panama time.
+            limit (int, optional): Maximum number of movements. Defaults to all of them.
+        Returns:
+            List[CardMovement]: Movements
+        '''
+        return [_movement(row) for row in self._rows(card_number, start, end, limit)]
+
+
+    def iter_movements(self, card_number: str, start: datetime.datetime = None, end: datetime.datetime = None,
+                       limit: int = None, batch_size: int = 500) -> Iterator[CardMovement]:
+        '''
+        Stored movements of a card, newest first, read `batch_size` at a time.
+        Each batch is a separate query resuming after the last movement of
+        the previous one, so the database is not locked while the caller
+        consumes them, e.g. while a slow client downloads an export.
+
+        Args:
+            card_number (str): Card number
+            start (datetime.datetime, optional): Earliest timestamp, inclusive. Naive values are Panama time.
+            end (datetime.datetime, optional): Latest timestamp, exclusive. Naive values are Panama time.
+            limit (int, optional): Maximum number of movements. Defaults to all of them.
+            batch_size (int, optional): Movements per query. Defaults to 500.
+        Yields:
+            CardMovement
+        '''
+        after = None
+
+        while limit is None or limit > 0:
+            rows = self._rows(card_number, start, end, batch_size if limit is None else min(batch_size, limit), after)
+
+            for row in rows:
+                yield _movement(row)
+
+            if len(rows) < batch_size:
+                return
+
+            if limit is not None:
+                limit -= len(rows)
+            after = rows[-1]
+
+
+    def latest(self, card_number: str) -> Union[CardMovement, None]:
+        '''
+        Newest stored movement of a card
+
+        Args:
+            card_number (str): Card number
+        Returns:
+            Union[CardMovement, None]: Movement, None when nothing is stored
+        '''
+        movements = self.movements(card_number, limit=1)
+        return movements[0] if movements else None
+
+
+    def count(self, card_number: str) -> int:
+        '''
+        Number of stored movements of a card
+
+        Args:
+            card_number (str): Card number
+        Returns:
+            int
+        '''
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM movements WHERE card = ?',
+                                            (str(card_number),)).fetchone()[0]
+
+
+    def close(self) -> None:
+        '''
+        Close the database
+        '''
+        with self._lock:
+            self._connection.close()
+
+
+    def _rows(self, card_number: str, start: datetime.datetime = None, end: datetime.datetime = None,
+              limit: int = None, after: tuple = None) -> List[tuple]:
+        query = f'SELECT {COLUMNS} FROM movements WHERE card = ?'
+        args = [str(card_number)]
+
+        if start is not None:
+            query += ' AND fecha_y_hora >= ?'
+            args.append(_timestamp(start))
+
+        if end is not None:
+            query += ' AND fecha_y_hora < ?'
+            args.append(_timestamp(end))
+
+        # Resume after a row in ORDER BY order, where movements without timestamp come last
+        if after is not None:
+            no_transaccion, fecha_y_hora = after[0], after[2]
+            if fecha_y_hora is None:
+                query += ' AND fecha_y_hora IS NULL AND no_transaccion < ?'
+                args.append(no_transaccion)
+            else:
+                query += (' AND (fecha_y_hora < ? OR fecha_y_hora IS NULL'
+                          ' OR (fecha_y_hora = ? AND no_transaccion < ?))')
+                args.extend((fecha_y_hora, fecha_y_hora, no_transaccion))
+
+        query += ' ORDER BY fecha_y_hora DESC, no_transaccion DESC'
+
+        if limit is not None:
+            query += ' LIMIT ?'
+            args.append(limit)
+
+        with self._lock:
+            return self._connection.execute(query, args).fetchall()
+
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+
+    def _reconnect(self) -> None:
+        # The inherited connection belongs to the parent. It is kept open
+        # but unused: closing it could checkpoint the WAL under the parent
+        self._inherited = self._connection
+        self._lock = threading.Lock()
+        self._connection = self._connect()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+'''
+Metrics of the Tarjeta Metrobus Panama clients
+'''
+import functools
+import time
+from typing import Any, Callable
+
+from src.core.metrics import Counter, Gauge, Histogram
+
+STAGE_SECONDS = Histogram('tmpma_stage_seconds',
+                          'Time spent in each stage of a card lookup: session, admission, ksi, soup, parse_*, '
+                          'serialize, dataframe',
+                          ('stage',))
+UPSTREAM_SECONDS = Histogram('tmpma_upstream_request_seconds', 'Portal request latency', ('service',))
+UPSTREAM_REQUESTS = Counter('tmpma_upstream_requests_total',
+                            'Portal requests by outcome, an HTTP status or an exception name',
+                            ('service', 'outcome'))
+UPSTREAM_IN_FLIGHT = Gauge('tmpma_upstream_in_flight', 'Portal requests running', ('service',))
+KSI_LOOKUPS = Counter('tmpma_ksi_lookups_total', 'KSI lookups by result, hit or miss of the KSI cache',
+                      ('result',))
+
+
+def stage(name: str):
+    '''
+    Time a `with` block as a lookup stage
+
+    Args:
+        name (str): Stage name
+    '''
+    return STAGE_SECONDS.labels(name).time()
+
+
+def timed(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    '''
+    Time every call of a function as a lookup stage
+
+    Args:
+        name (str): Stage name
+    '''
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        histogram = STAGE_SECONDS.labels(name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
@@ -2,11 +2,15 @@
 '''
  Models for Tarjeta Metrobus Panama
 '''
+import datetime
+from decimal import Decimal
 from enum import Enum
-from typing import List
-from dataclasses import dataclass
+from typing import List, Optional
+from dataclasses import MISSING, dataclass
 from dataclasses_json import dataclass_json, LetterCase, DataClassJsonMixin
 
+from .fields import (amount_field, count_field, datetime_field, settle_amount, settle_count, settle_datetime,
+                     text_field)
 
 
 class Services(Enum):
@@ -17,6 +21,10 @@ class Services(Enum):
     COMMERCE = 'ComercialesPortalServlet'
 
 
+# Sections a CardSnapshot can hold
+SNAPSHOT_SECTIONS = ('info', 'resume', 'stats', 'movements')
+
+
 # https://github.com/andrew962/metrobus-api/blob/master/init.py
 # https://json2pyi.pages.dev/#Dataclass
 # https://github.com/qzxtu/Metro-Consulta/blob/main/js/main.js
@@ -45,60 +53,126 @@ class KSI:
     ksi: str
 
 
+# The card models below are slotted and hold parsed values: amounts as
+# Decimal, timestamps as timezone-aware datetimes and counts as int. They
+# accept the portal text as well, keep it in the matching `..._text`
+# attribute and parse it on construction. Their JSON (to_dict, to_json,
+# schema) outputs the portal text unchanged under the original keys and
+# the parsed values under new `...Value` keys.
+
+
 @dataclass_json(letter_case=LetterCase.CAMEL)
-@dataclass
-class CardInfo(DataClassJsonMixin):
+@dataclass(slots=True)
+class CardInfo:
     '''
     Dataclass to store card information
     '''
     no_tarjeta: str
     estado_de_contrato: str
-    saldo_tarjeta: str
-    fecha_saldo: str
+    saldo_tarjeta: Optional[Decimal] = amount_field('saldoTarjetaValue')
+    fecha_saldo: Optional[datetime.datetime] = datetime_field('fechaSaldoValue')
+    saldo_tarjeta_text: Optional[str] = text_field('saldoTarjeta')
+    fecha_saldo_text: Optional[str] = text_field('fechaSaldo')
+
+    def __post_init__(self) -> None:
+        self.saldo_tarjeta, self.saldo_tarjeta_text = settle_amount(self.saldo_tarjeta, self.saldo_tarjeta_text,
+                                                                    'saldoTarjeta')
+        self.fecha_saldo, self.fecha_saldo_text = settle_datetime(self.fecha_saldo, self.fecha_saldo_text,
+                                                                  'fechaSaldo')
 
 
 @dataclass_json(letter_case=LetterCase.CAMEL)
-@dataclass
-class CardInfoResume(DataClassJsonMixin):
+@dataclass(slots=True)
+class CardInfoResume:
     '''
     Dataclass to store card resume information
     '''
     no_tarjeta: str
     estado_tarjeta: str
     tipo_de_tarjeta: str
-    saldo_tarjeta: str
+    saldo_tarjeta: Optional[Decimal] = amount_field('saldoTarjetaValue')
+    saldo_tarjeta_text: Optional[str] = text_field('saldoTarjeta')
+
+    def __post_init__(self) -> None:
+        self.saldo_tarjeta, self.saldo_tarjeta_text = settle_amount(self.saldo_tarjeta, self.saldo_tarjeta_text,
+                                                                    'saldoTarjeta')
 
 
 @dataclass_json(letter_case=LetterCase.CAMEL)
-@dataclass
-class CardMovement(DataClassJsonMixin):
+@dataclass(slots=True)
+class CardMovement:
     '''
     Dataclass to store card movements
     '''
     no_transaccion: str
     movimiento: str
-    fecha_y_hora: str
+    fecha_y_hora: Optional[datetime.datetime] = datetime_field('fechaYHoraValue', default=MISSING)
     lugar: str
-    monto: str
-    saldo_tarjeta: str
+    monto: Optional[Decimal] = amount_field('montoValue')
+    saldo_tarjeta: Optional[Decimal] = amount_field('saldoTarjetaValue')
+    fecha_y_hora_text: Optional[str] = text_field('fechaYHora')
+    monto_text: Optional[str] = text_field('monto')
+    saldo_tarjeta_text: Optional[str] = text_field('saldoTarjeta')
+
+    def __post_init__(self) -> None:
+        self.fecha_y_hora, self.fecha_y_hora_text = settle_datetime(self.fecha_y_hora, self.fecha_y_hora_text,
+                                                                    'fechaYHora')
+        self.monto, self.monto_text = settle_amount(self.monto, self.monto_text, 'monto')
+        self.saldo_tarjeta, self.saldo_tarjeta_text = settle_amount(self.saldo_tarjeta, self.saldo_tarjeta_text,
+                                                                    'saldoTarjeta')
 
 
 @dataclass_json(letter_case=LetterCase.CAMEL)
-@dataclass
-class CardStat(DataClassJsonMixin):
+@dataclass(slots=True)
+class CardStat:
     '''
     Dataclass to store card statistics
     '''
     month: str
-    amount: str
-    count: str
+    amount: Optional[Decimal] = amount_field('amountValue')
+    count: Optional[int] = count_field('countValue')
+    amount_text: Optional[str] = text_field('amount')
+    count_text: Optional[str] = text_field('count')
+
+    def __post_init__(self) -> None:
+        self.amount, self.amount_text = settle_amount(self.amount, self.amount_text, 'amount')
+        self.count, self.count_text = settle_count(self.count, self.count_text, 'count')
 
 
 @dataclass_json(letter_case=LetterCase.CAMEL)
-@dataclass
-class CardStats(DataClassJsonMixin):
+@dataclass(slots=True)
+class CardStats:
     '''
     Dataclass to store card statistics
     '''
     uses: List[CardStat]
     charges: List[CardStat]
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass(slots=True)
+class CardSnapshot:
+    '''
+    Dataclass to store several card sections fetched together
+    '''
+    info: Optional[CardInfo] = None
+    resume: Optional[CardInfoResume] = None
+    stats: Optional[CardStats] = None
+    movements: Optional[List[CardMovement]] = None
+
+    def is_empty(self) -> bool:
+        '''
+        Whether no section was found
+        '''
+        return all(getattr(self, section) is None for section in SNAPSHOT_SECTIONS)
+
+
+@dataclass_json(letter_case=LetterCase.CAMEL)
+@dataclass(slots=True)
+class CardBatchResult:
+    '''
+    Dataclass to store the outcome of one card in a batch lookup
+    '''
+    card: str
+    snapshot: Optional[CardSnapshot] = None
+    error: Optional[str] = None
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+'''
+Parsers for the Metrobus portal pages, shared by the sync and async clients
+'''
+import datetime
+from html.parser import HTMLParser
+from typing import Iterable, Iterator, List, Union
+
+from bs4 import BeautifulSoup, Tag, builder_registry
+from slugify import slugify
+
+from .metrics import timed
+from .models import KSI, CardInfo, CardInfoResume, CardMovement, CardStat, CardStats
+from .settings import HTML_PARSER
+from .utils import PANAMA_TZINFO, bs_table_to_dict, table_to_data
+
+# Movements cursor: the last seen timestamp, or the last seen transaction number
+MovementsCursor = Union[datetime.datetime, str, None]
+
+# Tree builders known to produce the same results on the portal pages
+PARSER_BACKENDS = ('html.parser', 'lxml')
+
+# Texts each page is expected to contain
+CARD_INFO_MARKER = 'Saldo  tarjeta:'
+CARD_RESUME_MARKER = 'Saldo tarjeta:'
+CARD_STATS_MARKER = 'Monto utilizado'
+MOVEMENTS_MARKER = 'Saldos y movimientos'
+
+# Built once: dataclasses_json makes a new schema class on every schema() call
+_CARD_STAT_SCHEMA = CardStat.schema()
+
+
+def check_parser_backend(backend: str = None) -> str:
+    '''
+    Validate an HTML parser backend
+
+    Args:
+        backend (str, optional): Backend name. Defaults to HTML_PARSER.
+    Returns:
+        str: Backend name
+    Raises:
+        ValueError: When the backend is unsupported or not installed
+    '''
+    backend = HTML_PARSER if backend is None else backend
+
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f'Unsupported HTML parser {backend!r}, expected one of: {", ".join(PARSER_BACKENDS)}')
+
+    if builder_registry.lookup(backend) is None:
+        raise ValueError(f'HTML parser {backend!r} is not installed')
+
+    return backend
+
+
+def make_soup(markup: str, backend: str = None) -> BeautifulSoup:
+    '''
+    Parse a portal page with the configured backend
+
+    Args:
+        markup (str): Page HTML
+        backend (str, optional): Backend name. Defaults to HTML_PARSER.
+    Returns:
+        BeautifulSoup
+    '''
+    return BeautifulSoup(markup, HTML_PARSER if backend is None else backend)
+
+
+def parse_ksi(soup: BeautifulSoup) -> Union[KSI, None]:
+    '''
+    Read the KSI session key from a SesionPortalServlet page
+
+    Args:
+        soup (BeautifulSoup): Parsed page
+    Returns:
+        Union[KSI, None]: KSI
+    '''
+    ksi_input = soup.find(attrs={'name': 'KSI'})
+
+    if ksi_input is None or not ksi_input.get('value'):
+        return None
+
+    return KSI(ksi=ksi_input['value'])
+
+
+@timed('parse_info')
+def parse_card_info(soup: BeautifulSoup) -> Union[CardInfo, None]:
+    '''
+    Read the card information from a SesionPortalServlet page
+
+    Args:
+        soup (BeautifulSoup): Parsed page
+    Returns:
+        Union[CardInfo, None]: Card info
+    '''
+    card_balance = soup.find(string=CARD_INFO_MARKER)
+
+    card_info_table = None
+    if card_balance is None:
+        return None
+
+    card_info_table = card_balance.parent.parent.parent
+
+    if card_info_table is None:
+        return None
+
+    card_info = bs_table_to_dict(card_info_table)
+    return CardInfo.from_dict(card_info)
+
+
+@timed('parse_resume')
+def parse_card_resume(soup: BeautifulSoup) -> Union[CardInfoResume, None]:
+    '''
+    Read the card resume from a ComercialesPortalServlet resume page
+
+    Args:
+        soup (BeautifulSoup): Parsed page
+    Returns:
+        Union[CardInfoResume, None]: Card resume
+    '''
+    card_balance = soup.find(string=CARD_RESUME_MARKER)
+
+    card_info_table = None
+    if card_balance is None:
+        return None
+
+    card_info_table = card_balance.parent.parent.parent
+
+    if card_info_table is None:
+        return None
+
+    card_info = bs_table_to_dict(card_info_table)
+    return CardInfoResume.from_dict(card_info)
+
+
+def find_movements_table(soup: BeautifulSoup) -> Union[Tag, None]:
+    '''
+    Find the movements table of a ComercialesPortalServlet movements page
+
+    Args:
+        soup (BeautifulSoup): Parsed page
+    Returns:
+        Union[Tag, None]: Movements table
+    '''
+    table_title = soup.find(string=MOVEMENTS_MARKER)
+    if table_title is None:
+        return None
+
+    return table_title.parent.parent.parent.parent
+
+
+def iter_movements(table: Tag) -> Iterator[CardMovement]:
+    '''
+    Yield the movements of a movements table row by row. The first row is
+    the title, the second one the headers, and the first column of every row
+    carries no data.
+
+    Args:
+        table (Tag): Movements table
+    Yields:
+        CardMovement
+    '''
+    rows = iter(table.find_all("tr"))
+
+    if next(rows, None) is None:
+        return
+
+    header_row = next(rows, None)
+    if header_row is None:
+        return
+
+    header_name = [slugify(cell.text.strip(), separator='_') for cell in header_row("td")[1:]]
+    width = len(header_name) + 1
+
+    for row in rows:
+        cells = row("td")
+        if len(cells) != width:
+            continue
+
+        yield CardMovement(**dict(zip(header_name, [cell.text.strip() for cell in cells[1:]])))
+
+
+class MovementRowParser(HTMLParser):
+    '''
+    Event based reader of the movements table, for pages too long to build
+    a whole tree of. Once the title holding MOVEMENTS_MARKER is seen, the
+    cell texts of the following rows of its table, headers first, are
+    collected into `rows` as markup is fed; the caller takes them out
+    between feeds. Tables nested in it are read as cell text, and
+    unclosed cells and rows end at the next one.
+    '''
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.rows: List[List[str]] = []
+        self.done = False
+        self._depth = 0
+        self._table: int = None
+        self._row: List[str] = None
+        self._cell: List[str] = None
+
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        if tag == 'table':
+            self._depth += 1
+        elif self._in_table():
+            if tag == 'tr':
+                self._end_row()
+                self._row = []
+            elif tag == 'td' and self._row is not None:
+                self._end_cell()
+                self._cell = []
+
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == 'table':
+            if self._in_table():
+                self._end_row()
+                self.done = True
+            self._depth = max(0, self._depth - 1)
+        elif self._in_table():
+            if tag == 'td':
+                self._end_cell()
+            elif tag == 'tr':
+                self._end_row()
+
+
+    def handle_data(self, data: str) -> None:
+        if self._cell is not None:
+            self._cell.append(data)
+        elif self._table is None and self._depth and data == MOVEMENTS_MARKER:
+            self._table = self._depth
+
+
+    def _in_table(self) -> bool:
+        return not self.done and self._table is not None and self._depth == self._table
+
+
+    def _end_cell(self) -> None:
+        if self._cell is not None:
+            self._row.append(''.join(self._cell).strip())
+            self._cell = None
+
+
+    def _end_row(self) -> None:
+        self._end_cell()
+        if self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+
+def stream_movements(page: str, chunk_size: int = 65536) -> Union[Iterator[CardMovement], None]:
+    '''
+    Yield the movements of a ComercialesPortalServlet movements page as
+    `MovementRowParser` reads them, `chunk_size` characters at a time,
+    without building a tree of the page. The first movements come out
+    after reading only the start of the page, and memory stays flat
+    whatever the table length.
+
+    Args:
+        page (str): Page HTML
+        chunk_size (int, optional): Characters fed to the parser at a time. Defaults to 65536.
+    Returns:
+        Union[Iterator[CardMovement], None]: Movements, None when the page has no movements table
+    '''
+    if MOVEMENTS_MARKER not in page:
+        return None
+
+    def movements() -> Iterator[CardMovement]:
+        parser = MovementRowParser()
+        header_name = None
+
+        for start in range(0, len(page), chunk_size):
+            parser.feed(page[start:start + chunk_size])
+            rows, parser.rows = parser.rows, []
+
+            for cells in rows:
+                if header_name is None:
+                    header_name = [slugify(cell, separator='_') for cell in cells[1:]]
+                elif len(cells) == len(header_name) + 1:
+                    yield CardMovement(**dict(zip(header_name, cells[1:])))
+
+            if parser.done:
+                break
+
+        parser.close()
+
+    return movements()
+
+
+def select_movements(movements: Iterable[CardMovement], since: MovementsCursor = None) -> Iterator[CardMovement]:
+    '''
+    Yield the movements newer than a cursor. A timestamp keeps the movements
+    at or after it, since portal timestamps only have minutes. A transaction
+    number keeps the movements listed before it, newest first as the portal
+    lists them, and stops consuming `movements` once it is found.
+
+    Args:
+        movements (Iterable[CardMovement]): Movements, newest first
+        since (MovementsCursor, optional): Last seen timestamp or transaction number. Defaults to all.
+    Yields:
+        CardMovement
+    '''
+    if since is None:
+        yield from movements
+        return
+
+    if isinstance(since, datetime.datetime):
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=PANAMA_TZINFO)
+
+        for movement in movements:
+            if movement.fecha_y_hora is not None and movement.fecha_y_hora >= since:
+                yield movement
+        return
+
+    since = str(since)
+
+    for movement in movements:
+        if movement.no_transaccion == since:
+            return
+        yield movement
+
+
+def filter_movements(movements: Iterable[CardMovement], since: MovementsCursor = None) -> List[CardMovement]:
+    '''
+    Keep the movements newer than a cursor, see `select_movements`
+
+    Args:
+        movements (Iterable[CardMovement]): Movements, newest first
+        since (MovementsCursor, optional): Last seen timestamp or transaction number. Defaults to all.
+    Returns:
+        List[CardMovement]: Movements
+    '''
+    return list(select_movements(movements, since))
+
+
+@timed('parse_movements')
+def parse_movements(soup: BeautifulSoup, since: MovementsCursor = None) -> Union[List[CardMovement], None]:
+    '''
+    Read the movements table from a ComercialesPortalServlet movements page
+
+    Args:
+        soup (BeautifulSoup): Parsed page
+        since (MovementsCursor, optional): Only movements newer than this cursor. Defaults to all.
+    Returns:
+        Union[List[CardMovement], None]: Movements
+    '''
+    table = find_movements_table(soup)
+    if table is None:
+        return None
+
+    return filter_movements(iter_movements(table), since)
+
+
+@timed('parse_stats')
+def parse_card_stats(soup: BeautifulSoup) -> CardStats:
+    '''
+    Read the uses and charges of the last 3 months from a
+    ComercialesPortalServlet resume page
+
+    Args:
+        soup (BeautifulSoup): Parsed page
+    Returns:
+        CardStats: Card stats
+    '''
+    return CardStats(
+        uses=_CARD_STAT_SCHEMA.load(table_to_data(soup, 'Monto utilizado'), many=True),
+        charges=_CARD_STAT_SCHEMA.load(table_to_data(soup, 'Monto cargado'), many=True))
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+'''
+Request building for the Metrobus portal, shared by the sync and async clients
+'''
+import datetime
+from typing import Dict, FrozenSet, Iterable, Union
+
+from pytz import timezone
+
+from src.core.http import accept_encoding
+
+from .models import SNAPSHOT_SECTIONS, ComercialesParams, Services
+from .settings import PORTAL_URL
+from .utils import PANAMA, PANAMA_TZINFO
+
+URL = PORTAL_URL
+DEFAULT_HEADERS = {
+    "Content-Type":
+    "application/x-www-form-urlencoded",
+    "User-Agent":
+    "Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/33.0.1750.117 Safari/537.36",
+    # Pages are mostly repeated table markup and shrink several times when compressed
+    "Accept-Encoding":
+    accept_encoding(),
+}
+
+# (itemms, item, accion) of the ComercialesPortalServlet pages
+RESUME_PAGE = (2000, 1, 6)
+MOVEMENTS_PAGE = (3000, 2, 1)
+
+# Date format of the FechaInicioMovimientos parameter
+MOVEMENTS_SINCE_FORMAT = '%d/%m/%Y'
+
+
+def session_params(card_number: str) -> dict:
+    '''
+    Get SesionPortalServlet parameters
+
+    Args:
+        card_number (str): Card number
+    Returns:
+        dict
+    '''
+    return {
+        'accion': 6,
+        'NumDistribuidor': 99,
+        'NomUsuario': 'usuInternet',
+        'NomHost': 'AFT',
+        'NonDominio': 'aft.cl',
+        'RutUsuario': '0',
+        'NumTarjeta': card_number,
+        'bloqueable': ''
+    }
+
+
+def movements_since_param(since: Union[datetime.datetime, None]) -> str:
+    '''
+    Format a movements cursor as FechaInicioMovimientos. The portal only
+    takes a day, so the result also covers earlier movements of that day.
+
+    Args:
+        since (Union[datetime.datetime, None]): Earliest movement. Naive values are Panama time.
+    Returns:
+        str: Panama date, empty for the whole window
+    '''
+    if since is None:
+        return ''
+
+    if since.tzinfo is not None and since.tzinfo is not PANAMA_TZINFO:
+        since = since.astimezone(PANAMA)
+
+    return since.strftime(MOVEMENTS_SINCE_FORMAT)
+
+
+def comerciales_params(ksi: str, itemms: str, item: str, accion: str,
+                       since: datetime.datetime = None) -> ComercialesParams:
+    '''
+    Get comerciales parameters for a KSI
+
+    Args:
+        ksi (str): KSI session key
+        itemms (str): itemms
+        item (str): item
+        accion (str): accion
+        since (datetime.datetime, optional): Ask only for movements from this day on. Defaults to the whole window.
+    Returns:
+        ComercialesParams
+    '''
+    now = datetime.datetime.now(tz=timezone('America/Panama'))
+    now_formated = now.strftime('%Y%m%d%H%M%S')
+
+    return ComercialesParams.from_dict({
+        'KSI': ksi,
+        'accion': accion,
+        'itemms': itemms,
+        'item': item,
+        'DiasMov': 45,
+        'fechalogeo': now_formated,
+        'FechaInicioMovimientos': movements_since_param(since),
+    })
+
+
+def snapshot_sections(sections: Iterable[str] = None) -> FrozenSet[str]:
+    '''
+    Validate the sections requested for a card snapshot
+
+    Args:
+        sections (Iterable[str], optional): Section names. Defaults to all of them.
+    Returns:
+        FrozenSet[str]
+    Raises:
+        ValueError: On an unknown section
+    '''
+    if sections is None:
+        return frozenset(SNAPSHOT_SECTIONS)
+
+    sections = frozenset(sections)
+    unknown = sections.difference(SNAPSHOT_SECTIONS)
+
+    if unknown:
+        raise ValueError(f'Unknown sections: {", ".join(sorted(unknown))}')
+
+    return sections
+
+
+def snapshot_requests(sections: Iterable[str] = None) -> Dict[Services, int]:
+    '''
+    Portal requests a card snapshot makes at most, per service: the session
+    page, for the info or the KSI, then one ComercialesPortalServlet page
+    for resume and stats and one for the movements
+
+    Args:
+        sections (Iterable[str], optional): Section names. Defaults to all of them.
+    Returns:
+        Dict[Services, int]
+    Raises:
+        ValueError: On an unknown section
+    '''
+    sections = snapshot_sections(sections)
+
+    return {
+        Services.SESSION: 1,
+        Services.COMMERCE: int('resume' in sections or 'stats' in sections) + int('movements' in sections),
+    }
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+'''
+Precompiled JSON serializers for the models
+
+Each model gets, once, a list of (key prefix, attribute getter, value
+encoder) built from its dataclass fields and dataclasses_json config, so
+serializing is a single pass that writes the same camelCase JSON as
+`to_json()` without building marshmallow schemas or intermediate dicts.
+'''
+import csv
+import dataclasses
+import io
+from decimal import Decimal
+from json.encoder import encode_basestring_ascii
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, Type, Union, get_args, get_origin
+
+from .metrics import timed
+
+Encoder = Callable[[Any], str]
+
+_ENCODERS: Dict[type, Encoder] = {}
+
+
+def _encode_str(value: Any) -> str:
+    return 'null' if value is None else encode_basestring_ascii(value)
+
+
+def _encode_int(value: Any) -> str:
+    return 'null' if value is None else str(int(value))
+
+
+def _encode_float(value: Any) -> str:
+    return 'null' if value is None else repr(float(value))
+
+
+def _encode_bool(value: Any) -> str:
+    return 'null' if value is None else ('true' if value else 'false')
+
+
+def _encode_any(value: Any) -> str:
+    if value is None:
+        return 'null'
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if dataclasses.is_dataclass(value):
+        return encoder_for(type(value))(value)
+    if isinstance(value, bool):
+        return _encode_bool(value)
+    if isinstance(value, int):
+        return _encode_int(value)
+    if isinstance(value, float):
+        return _encode_float(value)
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(_encode_any(item) for item in value) + ']'
+    return encode_basestring_ascii(str(value))
+
+
+def _rendered(render: Callable[[Any], Any]) -> Encoder:
+    def encode(value: Any) -> str:
+        return _encode_any(render(value))
+    return encode
+
+
+def _type_encoder(annotation: Any) -> Encoder:
+    origin = get_origin(annotation)
+
+    if origin is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return _type_encoder(args[0]) if len(args) == 1 else _encode_any
+
+    if origin in (list, tuple) or annotation in (list, tuple):
+        args = get_args(annotation)
+        item = _type_encoder(args[0]) if args else _encode_any
+
+        def encode_list(value: Any) -> str:
+            if value is None:
+                return 'null'
+            return '[' + ','.join([item(element) for element in value]) + ']'
+        return encode_list
+
+    if dataclasses.is_dataclass(annotation):
+        return _lazy(annotation)
+
+    return {
+        str: _encode_str,
+        bool: _encode_bool,
+        int: _encode_int,
+        float: _encode_float,
+        Decimal: _encode_str,
+    }.get(annotation, _encode_any)
+
+
+def _lazy(cls: type) -> Encoder:
+    # Nested models are resolved on first use so self references work
+    def encode(value: Any) -> str:
+        return encoder_for(cls)(value)
+    return encode
+
+
+def _compile(cls: type) -> Encoder:
+    letter_case = getattr(cls, 'dataclass_json_config', {}).get('letter_case')
+    parts = []
+
+    for field in dataclasses.fields(cls):
+        overrides = field.metadata.get('dataclasses_json', {})
+        case = overrides.get('letter_case', letter_case)
+        key = overrides.get('field_name') or (case(field.name) if case else field.name)
+        render = overrides.get('encoder')
+        value_encoder = _rendered(render) if render is not None else _type_encoder(field.type)
+        parts.append((encode_basestring_ascii(key) + ':', attrgetter(field.name), value_encoder))
+
+    parts = tuple(parts)
+
+    def encode(obj: Any) -> str:
+        if obj is None:
+            return 'null'
+        return '{' + ','.join([prefix + value_encoder(get(obj)) for prefix, get, value_encoder in parts]) + '}'
+
+    return encode
+
+
+def encoder_for(cls: Type) -> Encoder:
+    '''
+    Get the compiled JSON encoder of a model
+
+    Args:
+        cls (Type): Dataclass model
+    Returns:
+        Encoder: Function from a model instance to its JSON text
+    '''
+    encoder = _ENCODERS.get(cls)
+    if encoder is None:
+        encoder = _ENCODERS.setdefault(cls, _compile(cls))
+    return encoder
+
+
+@timed('serialize')
+def dumps(obj: Any) -> bytes:
+    '''
+    Serialize a model to camelCase JSON bytes
+
+    Args:
+        obj (Any): Model instance
+    Returns:
+        bytes
+    '''
+    return encoder_for(type(obj))(obj).encode('ascii')
+
+
+@timed('serialize')
+def dumps_many(objs: Iterable[Any], cls: Type) -> bytes:
+    '''
+    Serialize models of one type to a camelCase JSON array
+
+    Args:
+        objs (Iterable[Any]): Model instances
+        cls (Type): Their model
+    Returns:
+        bytes
+    '''
+    encode = encoder_for(cls)
+    return ('[' + ','.join([encode(obj) for obj in objs]) + ']').encode('ascii')
+
+
+def dumps_lines(objs: Iterable[Any], cls: Type) -> Iterator[bytes]:
+    '''
+    Serialize models of one type to newline delimited JSON, one line per
+    model as `objs` yields them
+
+    Args:
+        objs (Iterable[Any]): Model instances
+        cls (Type): Their model
+    Yields:
+        bytes: JSON line
+    '''
+    encode = encoder_for(cls)
+    for obj in objs:
+        yield (encode(obj) + '\n').encode('ascii')
+
+
+def dumps_csv(objs: Iterable[Any], cls: Type) -> Iterator[bytes]:
+    '''
+    Serialize models of one type to CSV, a header row of the camelCase JSON
+    keys first, then one row per model as `objs` yields them. Values are
+    rendered as in the JSON, null as an empty cell.
+
+    Args:
+        objs (Iterable[Any]): Model instances
+        cls (Type): Their flat model
+    Yields:
+        bytes: UTF-8 CSV row
+    '''
+    letter_case = getattr(cls, 'dataclass_json_config', {}).get('letter_case')
+    keys, columns = [], []
+
+    for field in dataclasses.fields(cls):
+        overrides = field.metadata.get('dataclasses_json', {})
+        case = overrides.get('letter_case', letter_case)
+        keys.append(overrides.get('field_name') or (case(field.name) if case else field.name))
+        columns.append((attrgetter(field.name), overrides.get('encoder') or str))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+
+    def row(values: Iterable[Any]) -> bytes:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue().encode('utf-8')
+
+    yield row(keys)
+
+    for obj in objs:
+        cells = []
+        for get, render in columns:
+            value = get(obj)
+            cells.append('' if value is None else render(value))
+        yield row(cells)
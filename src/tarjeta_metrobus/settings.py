@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+'''
+Settings for the Tarjeta Metrobus Panama client, read from the environment
+'''
+from src.core.utils import env_float, env_int, env_str
+
+# Base URL of the Metrobus portal
+PORTAL_URL = env_str('TMPMA_PORTAL_URL', 'http://200.46.245.230:8080/PortalCAE-WAR-MODULE')
+
+# Seconds a KSI session key is reused for the same card
+KSI_CACHE_TTL = env_float('TMPMA_KSI_CACHE_TTL', 300)
+# Maximum number of cards whose KSI is kept
+KSI_CACHE_SIZE = env_int('TMPMA_KSI_CACHE_SIZE', 1024)
+
+# Upstream governor of each portal service (Services member name): requests per second and
+# burst of the token bucket, requests running at once, requests allowed to wait, seconds a
+# request may wait before it is rejected, and tokens background refreshes leave to user
+# requests. A rate or in-flight limit of 0 means unlimited
+GOVERNOR = {
+    service: {
+        'rate': env_float(f'TMPMA_GOVERNOR_{service}_RATE', 10),
+        'burst': env_int(f'TMPMA_GOVERNOR_{service}_BURST', 20),
+        'max_in_flight': env_int(f'TMPMA_GOVERNOR_{service}_MAX_IN_FLIGHT', 8),
+        'max_queue': env_int(f'TMPMA_GOVERNOR_{service}_MAX_QUEUE', 100),
+        'timeout': env_float(f'TMPMA_GOVERNOR_{service}_TIMEOUT', 10),
+        'reserve': env_int(f'TMPMA_GOVERNOR_{service}_RESERVE', 10),
+    }
+    for service in ('SESSION', 'COMMERCE')
+}
+
+# Resilience of each portal service (Services member name): attempts in total for requests failing
+# with a connection error, a timeout or a 5xx answer, and the first and largest jittered backoff
+# between them in seconds; consecutive failures opening the circuit breaker (0 disables it) and
+# seconds it stays open; latency percentile of recent requests after which a duplicate hedged
+# request is sent (0 disables hedging) and the shortest wait before hedging in seconds
+RESILIENCE = {
+    service: {
+        'attempts': env_int(f'TMPMA_RETRY_{service}_ATTEMPTS', 3),
+        'backoff': env_float(f'TMPMA_RETRY_{service}_BACKOFF', 0.2),
+        'max_backoff': env_float(f'TMPMA_RETRY_{service}_MAX_BACKOFF', 2),
+        'failure_threshold': env_int(f'TMPMA_BREAKER_{service}_FAILURES', 5),
+        'reset_timeout': env_float(f'TMPMA_BREAKER_{service}_RESET_TIMEOUT', 30),
+        'hedge_percentile': env_float(f'TMPMA_HEDGE_{service}_PERCENTILE', 0),
+        'hedge_min_delay': env_float(f'TMPMA_HEDGE_{service}_MIN_DELAY', 0.05),
+    }
+    for service in ('SESSION', 'COMMERCE')
+}
+
+# Maximum number of portal sessions in use or idle at once. Defaults to one session for each
+# request the governors let run at once, and as many again for the hedges of a hedged service;
+# 8 for a service without an in-flight limit
+SESSION_POOL_SIZE = env_int('TMPMA_SESSION_POOL_SIZE', sum(
+    (GOVERNOR[service]['max_in_flight'] or 8) * (2 if RESILIENCE[service]['hedge_percentile'] > 0 else 1)
+    for service in ('SESSION', 'COMMERCE')))
+# Warm sessions kept ready for the next request
+SESSION_POOL_MIN_IDLE = env_int('TMPMA_SESSION_POOL_MIN_IDLE', 1)
+# Seconds before a session is discarded and replaced by a fresh one
+SESSION_MAX_AGE = env_float('TMPMA_SESSION_MAX_AGE', 300)
+# Seconds a session may sit idle before it is re-warmed
+SESSION_MAX_IDLE = env_float('TMPMA_SESSION_MAX_IDLE', 60)
+# Seconds to wait for a free session before giving up
+SESSION_POOL_TIMEOUT = env_float('TMPMA_SESSION_POOL_TIMEOUT', 15)
+
+# Connections shared by all lookups of the asyncio client
+ASYNC_POOL_SIZE = env_int('TMPMA_ASYNC_POOL_SIZE', 100)
+
+# Cards looked up concurrently by a batch
+BATCH_WORKERS = env_int('TMPMA_BATCH_WORKERS', 8)
+
+# BeautifulSoup tree builder: 'html.parser' (pure Python) or 'lxml' (C, optional dependency)
+HTML_PARSER = env_str('TMPMA_HTML_PARSER', 'html.parser')
+
+# SQLite file keeping every movement seen, beyond the portal's 45 days. Empty disables the history
+HISTORY_PATH = env_str('TMPMA_HISTORY_PATH', '')
+
+# Movements read from or written to the history per statement while streaming an export
+HISTORY_BATCH_SIZE = env_int('TMPMA_HISTORY_BATCH_SIZE', 500)
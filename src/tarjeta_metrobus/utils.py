@@ -1,6 +1,18 @@
+import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Union
+
 from bs4 import Tag
+from pytz import timezone
 from slugify import slugify
 
+PANAMA = timezone('America/Panama')
+# Panama has kept UTC-5 without DST since 1908, so its localized tzinfo can be
+# attached directly instead of paying for PANAMA.localize on every timestamp
+PANAMA_TZINFO = PANAMA.localize(datetime.datetime(2000, 1, 1)).tzinfo
+# Timestamp formats used by the portal, the first one is the canonical one
+DATETIME_FORMATS = ('%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y')
+
 
 def bs_table_to_dict(table: Tag):
     '''
@@ -36,3 +48,140 @@ def table_to_data(soup, text_in_table):
     merged_columns = zip(table_data[0][1:], table_data[1][1:],  table_data[2][1:])
 
     return [dict(zip(keys, values)) for values in merged_columns]
+
+
+def parse_amount(value: Union[str, Decimal, None]) -> Union[Decimal, None]:
+    '''
+    Parse a portal amount such as "B/. 1.25", "B/. 1,25" or "B/. 1,234.50"
+
+    Args:
+        value (Union[str, Decimal, None]): Portal text, or an already parsed amount
+    Returns:
+        Union[Decimal, None]: Amount, None when empty or unreadable
+    '''
+    if value is None or isinstance(value, Decimal):
+        return value
+
+    text = value.replace('B/.', '').replace(' ', '').strip()
+    if not text:
+        return None
+
+    if ',' in text and '.' in text:
+        thousands = ',' if text.rfind(',') < text.rfind('.') else '.'
+        text = text.replace(thousands, '')
+    elif ',' in text:
+        whole, _, fraction = text.rpartition(',')
+        text = f'{whole.replace(",", "")}.{fraction}' if len(fraction) != 3 else text.replace(',', '')
+
+    text = text.replace(',', '.')
+
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        return None
+
+
+def format_amount(value: Union[Decimal, None]) -> str:
+    '''
+    Format an amount with the portal currency prefix, as "B/. 1,234.50": a dot
+    for decimals and commas for thousands, unlike the decimal comma of the
+    portal itself
+
+    Args:
+        value (Union[Decimal, None]): Amount
+    Returns:
+        str: Formatted amount, empty for None
+    '''
+    if value is None:
+        return ''
+
+    return f'B/. {value:,.2f}'
+
+
+def parse_datetime(value: Union[str, datetime.datetime, None]) -> Union[datetime.datetime, None]:
+    '''
+    Parse a portal timestamp such as "31/05/2024 18:45" as Panama local time
+
+    Args:
+        value (Union[str, datetime.datetime, None]): Portal text, or an already parsed timestamp,
+            taken as Panama local time when naive
+    Returns:
+        Union[datetime.datetime, None]: Timezone-aware timestamp, None when empty or unreadable
+    '''
+    if value is None:
+        return None
+
+    if isinstance(value, datetime.datetime):
+        return value if value.tzinfo is not None else PANAMA.localize(value)
+
+    text = value.strip()
+
+    # Fast path for the canonical "dd/mm/YYYY HH:MM", strptime is slow
+    if len(text) == 16 and text[2] == '/' and text[5] == '/' and text[13] == ':':
+        try:
+            return datetime.datetime(int(text[6:10]), int(text[3:5]), int(text[0:2]),
+                                     int(text[11:13]), int(text[14:16]), tzinfo=PANAMA_TZINFO)
+        except ValueError:
+            pass
+
+    for date_format in DATETIME_FORMATS:
+        try:
+            return PANAMA.localize(datetime.datetime.strptime(text, date_format))
+        except ValueError:
+            continue
+
+    # ISO 8601, as the models output the parsed timestamp
+    try:
+        parsed = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        return None
+
+    return parsed if parsed.tzinfo is not None else PANAMA.localize(parsed)
+
+
+def format_datetime(value: Union[datetime.datetime, None]) -> str:
+    '''
+    Format a timestamp the way the portal shows it, in Panama local time
+
+    Args:
+        value (Union[datetime.datetime, None]): Timestamp
+    Returns:
+        str
+    '''
+    if value is None:
+        return ''
+
+    if value.tzinfo is not None and value.tzinfo is not PANAMA_TZINFO:
+        value = value.astimezone(PANAMA)
+
+    return value.strftime(DATETIME_FORMATS[0])
+
+
+def parse_count(value: Union[str, int, None]) -> Union[int, None]:
+    '''
+    Parse a portal count such as "12" or "1,024"
+
+    Args:
+        value (Union[str, int, None]): Portal text, or an already parsed count
+    Returns:
+        Union[int, None]: Count, None when empty or unreadable
+    '''
+    if value is None or isinstance(value, int):
+        return value
+
+    try:
+        return int(value.replace(',', '').replace('.', '').strip())
+    except ValueError:
+        return None
+
+
+def format_count(value: Union[int, None]) -> str:
+    '''
+    Format a count the way the portal shows it
+
+    Args:
+        value (Union[int, None]): Count
+    Returns:
+        str
+    '''
+    return '' if value is None else str(value)
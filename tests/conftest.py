@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import Counter
+
+import pytest
+from flask.testing import FlaskClient
+from werkzeug.serving import make_server
+
+from src.apis.card import response_cache
+from src.core.singleton import SingletonMeta
+from src.main import app
+from src.tarjeta_metrobus import TarjetaMetrobusPanama
+from src.tarjeta_metrobus.emulator import EmulatorConfig, create_app
+
+
+class FakeClock:
+    '''
+    Monotonic timer the test moves by hand, for the `timer` argument of the
+    core primitives
+    '''
+
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+class Portal:
+    '''
+    Portal emulator served on a free local port, counting the requests of
+    each servlet
+    '''
+
+    def __init__(self, config: EmulatorConfig = None) -> None:
+        self.requests = Counter()
+        app = create_app(config)
+        self.emulator = app.config['EMULATOR']
+
+        def counted(environ, start_response):
+            self.requests[environ['PATH_INFO'].rstrip('/').rsplit('/', 1)[-1]] += 1
+            return app(environ, start_response)
+
+        self.server = make_server('127.0.0.1', 0, counted, threaded=True)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/PortalCAE-WAR-MODULE'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class BufferedClient(FlaskClient):
+    '''
+    Test client reading each response whole, so its close callbacks run,
+    unless the test asks for `buffered=False`
+    '''
+
+    def open(self, *args, **kwargs):
+        kwargs.setdefault('buffered', True)
+        return super().open(*args, **kwargs)
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def portal_config() -> EmulatorConfig:
+    # Overridden by tests needing a slow or failing portal
+    return EmulatorConfig()
+
+
+@pytest.fixture
+def portal(portal_config):
+    portal = Portal(portal_config)
+    yield portal
+    portal.close()
+
+
+@pytest.fixture
+def tarjeta(portal):
+    '''
+    A new portal client on the emulator, in place of the process-wide one
+    '''
+    SingletonMeta._instances.pop(TarjetaMetrobusPanama, None)
+    client = TarjetaMetrobusPanama(url=portal.url)
+    yield client
+    client.pool.close()
+    SingletonMeta._instances.pop(TarjetaMetrobusPanama, None)
+
+
+@pytest.fixture
+def api(tarjeta):
+    '''
+    Test client of the API, with an empty response cache
+    '''
+    response_cache.clear()
+    yield BufferedClient(app, app.response_class)
+    response_cache.clear()
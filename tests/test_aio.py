@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from src.core.deadline import DeadlineExceeded, deadline
+from src.core.governor import RateGovernor
+from src.core.resilience import Resilience, UpstreamError
+from src.tarjeta_metrobus.emulator import EmulatorConfig
+from src.tarjeta_metrobus.models import Services
+
+pytest.importorskip('aiohttp')
+
+from src.tarjeta_metrobus.aio import RETRYABLE, AsyncTarjetaMetrobusPanama  # noqa: E402
+
+CARD = '33070524'
+
+
+def client(url: str, **resilience) -> AsyncTarjetaMetrobusPanama:
+    settings = {'attempts': 2, 'backoff': 0, 'failure_threshold': 0, **resilience}
+    return AsyncTarjetaMetrobusPanama(url=url,
+                                      governors={service: RateGovernor(rate=0) for service in Services},
+                                      resilience={service: Resilience(RETRYABLE, **settings)
+                                                  for service in Services})
+
+
+def test_lookups_go_through_the_governors(portal):
+    async def lookup(tmpma):
+        async with tmpma:
+            return await tmpma.get_card_snapshot(CARD, ['info', 'resume'])
+
+    tmpma = client(portal.url)
+    snapshot = asyncio.run(lookup(tmpma))
+
+    assert snapshot.info.no_tarjeta == CARD
+    assert snapshot.resume is not None
+    assert tmpma.governors[Services.SESSION].stats()['admitted'] == 1
+    assert tmpma.governors[Services.COMMERCE].stats()['admitted'] == 1
+    assert tmpma._session is None
+
+
+@pytest.mark.parametrize('portal_config', [EmulatorConfig(error_rate=1)])
+def test_failed_warm_up_closes_the_session(portal):
+    tmpma = client(portal.url)
+
+    with pytest.raises(UpstreamError) as failed:
+        asyncio.run(tmpma.get_session())
+
+    assert failed.value.status == 500
+    assert tmpma._session is None
+
+
+def test_unreachable_portal_closes_the_session(portal):
+    url = portal.url
+    portal.close()
+    tmpma = client(url)
+
+    with pytest.raises(RETRYABLE):
+        asyncio.run(tmpma.get_session())
+
+    assert tmpma._session is None
+
+
+def test_error_statuses_are_retried_then_raised(portal):
+    async def lookup(tmpma):
+        async with tmpma:
+            portal.emulator.config.error_rate = 1
+            return await tmpma.get_card_info(CARD)
+
+    tmpma = client(portal.url)
+
+    with pytest.raises(UpstreamError) as failed:
+        asyncio.run(lookup(tmpma))
+
+    assert failed.value.status == 500
+    assert portal.requests['SesionPortalServlet'] == 2
+    assert tmpma.resilience[Services.SESSION].stats()['retries'] == 1
+
+
+def test_lookups_honour_the_deadline(portal):
+    async def lookup(tmpma):
+        async with tmpma:
+            with deadline(0):
+                return await tmpma.get_card_info(CARD)
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(lookup(client(portal.url)))
+
+    assert portal.requests['SesionPortalServlet'] == 0
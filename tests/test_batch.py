@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+
+import pytest
+
+from src.apis import card
+from src.tarjeta_metrobus.emulator import EmulatorConfig
+
+CARDS = ['33070524', '33070525', 'not-a-card']
+
+
+def lines(response) -> dict:
+    return {result['card']: result for result in map(json.loads, response.data.splitlines())}
+
+
+def test_results_stream_with_per_card_errors(api):
+    response = api.post('/api/v1/card/batch', json={'cards': CARDS + ['33070524'], 'sections': ['info']})
+    results = lines(response)
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert sorted(results) == sorted(CARDS)
+    assert results['not-a-card'] == {'card': 'not-a-card', 'snapshot': None, 'error': 'Card not found'}
+    assert results['33070524']['error'] is None
+    assert results['33070524']['snapshot']['info']['noTarjeta'] == '33070524'
+    assert results['33070524']['snapshot']['movements'] is None
+
+
+def test_too_many_cards_are_refused(api, monkeypatch):
+    monkeypatch.setattr(card, 'BATCH_MAX_CARDS', 2)
+
+    response = api.post('/api/v1/card/batch', json={'cards': CARDS})
+
+    assert response.status_code == 400
+    assert 'At most 2 cards' in response.json['message']
+
+
+def test_unknown_sections_are_refused(api):
+    response = api.post('/api/v1/card/batch', json={'cards': CARDS, 'sections': ['balance']})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('portal_config', [EmulatorConfig(latency=0.05)])
+def test_pending_cards_are_dropped_when_the_client_leaves(api, portal):
+    cards = [str(33070000 + number) for number in range(40)]
+
+    response = api.post('/api/v1/card/batch', json={'cards': cards, 'sections': ['info']}, buffered=False)
+    assert json.loads(next(response.response))['card'] in cards
+    response.close()
+
+    time.sleep(0.5)
+    looked_up = portal.requests['SesionPortalServlet']
+    time.sleep(0.5)
+
+    # Only the lookups already running when the client left have finished
+    assert looked_up == portal.requests['SesionPortalServlet'] < len(cards)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from src.core.cache import StaleWhileRevalidateCache, TTLCache
+
+
+def wait_refreshed(cache: StaleWhileRevalidateCache) -> None:
+    while cache.stats()['refreshing']:
+        time.sleep(0.001)
+
+
+class Loader:
+    def __init__(self, *values) -> None:
+        self.values = list(values)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        value = self.values.pop(0)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+def test_ttl_entries_expire(clock):
+    cache = TTLCache(ttl=10, timer=clock)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=30)
+
+    clock.advance(9.9)
+    assert cache.get('a') == 1
+    assert 'a' in cache
+
+    clock.advance(0.1)
+    assert cache.get('a') is None
+    assert 'a' not in cache
+    assert cache.get('b') == 2
+
+
+def test_ttl_evicts_the_least_recently_used(clock):
+    cache = TTLCache(maxsize=2, ttl=10, timer=clock)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    assert len(cache) == 2
+
+
+def test_fresh_entries_are_not_reloaded(clock):
+    cache = StaleWhileRevalidateCache(ttl=10, stale_ttl=20, timer=clock)
+    loader = Loader('v1')
+
+    assert cache.get_or_load('card', loader) == 'v1'
+    clock.advance(9)
+    assert cache.get_or_load('card', loader) == 'v1'
+
+    assert loader.calls == 1
+    assert cache.stats()['hits'] == 1
+
+
+def test_stale_entries_are_served_while_one_refresh_runs(clock):
+    cache = StaleWhileRevalidateCache(ttl=10, stale_ttl=20, timer=clock)
+    cache.set('card', 'v1')
+    clock.advance(15)
+
+    release = threading.Event()
+    calls = []
+
+    def reload():
+        calls.append(1)
+        release.wait(5)
+        return 'v2'
+
+    assert cache.get_or_load('card', reload) == 'v1'
+    assert cache.get_or_load('card', reload) == 'v1'
+    release.set()
+    wait_refreshed(cache)
+
+    assert len(calls) == 1
+    assert cache.stats()['staleHits'] == 2
+    assert cache.get_or_load('card', Loader()) == 'v2'
+
+
+def test_failed_refresh_keeps_the_stale_value(clock):
+    cache = StaleWhileRevalidateCache(ttl=10, stale_ttl=20, timer=clock)
+    cache.set('card', 'v1')
+    clock.advance(15)
+
+    assert cache.get_or_load('card', Loader(RuntimeError('portal'))) == 'v1'
+    wait_refreshed(cache)
+
+    assert cache.stats()['refreshErrors'] == 1
+    assert cache.get_or_load('card', Loader()) == 'v1'
+
+
+def test_entries_past_the_stale_window_load_synchronously(clock):
+    cache = StaleWhileRevalidateCache(ttl=10, stale_ttl=20, timer=clock)
+    cache.set('card', 'v1')
+    clock.advance(30)
+
+    assert cache.get_or_load('card', Loader('v2')) == 'v2'
+    assert cache.stats()['misses'] == 1
+
+
+def test_none_is_not_cached(clock):
+    cache = StaleWhileRevalidateCache(ttl=10, stale_ttl=20, timer=clock)
+    loader = Loader(None, 'v1')
+
+    assert cache.get_or_load('card', loader) is None
+    assert cache.get_or_load('card', loader) == 'v1'
+    assert loader.calls == 2
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+import json
+
+import pytest
+
+from src.tarjeta_metrobus.emulator import EmulatorConfig
+from src.tarjeta_metrobus.models import CardMovement
+from src.tarjeta_metrobus.serializers import dumps, dumps_csv, dumps_lines
+
+CARD = '33070524'
+
+
+def movements() -> list:
+    return [
+        CardMovement(no_transaccion='2', movimiento='Uso', fecha_y_hora='31/05/2024 18:45:07',
+                     lugar='Albrook, "Mall"\nAndén 2', monto='B/. -1,25', saldo_tarjeta='B/. 3,00'),
+        CardMovement(no_transaccion='1', movimiento='Recarga', fecha_y_hora=None,
+                     lugar='5 de Mayo', monto='B/. 5,00', saldo_tarjeta=None),
+    ]
+
+
+def test_csv_has_the_json_keys_and_escapes_cells():
+    rows = list(dumps_csv(movements(), CardMovement))
+    table = list(csv.reader(io.StringIO(b''.join(rows).decode('utf-8'), newline='')))
+
+    assert len(rows) == 3
+    assert all(row.endswith(b'\r\n') for row in rows)
+    assert table[0] == list(json.loads(dumps(movements()[0])))
+    assert dict(zip(table[0], table[1]))['lugar'] == 'Albrook, "Mall"\nAndén 2'
+    # null is an empty cell
+    assert dict(zip(table[0], table[2]))['fechaYHoraValue'] == ''
+
+
+def test_ndjson_is_one_json_document_per_line():
+    lines = list(dumps_lines(movements(), CardMovement))
+
+    assert len(lines) == 2
+    assert all(line.endswith(b'\n') and line.count(b'\n') == 1 for line in lines)
+    assert [json.loads(line) for line in lines] == [json.loads(dumps(movement)) for movement in movements()]
+
+
+def test_exports_stream_the_movements(api):
+    listed = api.get(f'/api/v1/card/{CARD}/transactions').json
+    ndjson = api.get(f'/api/v1/card/{CARD}/transactions.ndjson')
+    exported = api.get(f'/api/v1/card/{CARD}/transactions.csv')
+
+    assert ndjson.mimetype == 'application/x-ndjson'
+    assert [json.loads(line) for line in ndjson.data.splitlines()] == listed
+
+    assert exported.mimetype == 'text/csv'
+    assert exported.headers['Content-Disposition'] == f'attachment; filename={CARD}-transactions.csv'
+    table = list(csv.DictReader(io.StringIO(exported.data.decode('utf-8'), newline='')))
+    assert [row['noTransaccion'] for row in table] == [movement['noTransaccion'] for movement in listed]
+
+
+@pytest.mark.parametrize('portal_config', [EmulatorConfig(latency=0.2)])
+def test_export_past_its_deadline_is_a_504(api):
+    response = api.get(f'/api/v1/card/{CARD}/transactions.ndjson', headers={'X-Request-Timeout': '0.3'})
+
+    assert response.status_code == 504
+    assert response.mimetype == 'application/json'
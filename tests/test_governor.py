@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from src.core.deadline import DeadlineExceeded, deadline
+from src.core.governor import RateGovernor, UpstreamRejected, background
+
+
+def wait_queued(governor: RateGovernor, count: int) -> None:
+    while governor.stats()['queued'] < count:
+        time.sleep(0.001)
+
+
+def test_tokens_refill_at_the_rate(clock):
+    governor = RateGovernor(rate=2, burst=2, max_in_flight=0, timer=clock)
+
+    governor.acquire(timeout=0)
+    governor.acquire(timeout=0)
+    with pytest.raises(UpstreamRejected):
+        governor.acquire(timeout=0)
+
+    clock.advance(0.25)
+    with pytest.raises(UpstreamRejected):
+        governor.acquire(timeout=0)
+
+    clock.advance(0.25)
+    governor.acquire(timeout=0)
+    assert governor.stats()['admitted'] == 3
+
+
+def test_waiters_are_admitted_in_arrival_order():
+    governor = RateGovernor(rate=0, max_in_flight=1, timeout=5)
+    governor.acquire()
+    order = []
+    admitted = threading.Semaphore(0)
+
+    def wait(name):
+        governor.acquire()
+        order.append(name)
+        admitted.release()
+
+    threads = []
+    for index, name in enumerate('abc'):
+        threads.append(threading.Thread(target=wait, args=(name,)))
+        threads[-1].start()
+        wait_queued(governor, index + 1)
+
+    for _ in threads:
+        governor.release()
+        assert admitted.acquire(timeout=5)
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ['a', 'b', 'c']
+
+
+def test_full_queue_rejects_at_once():
+    governor = RateGovernor(rate=0, max_in_flight=1, max_queue=1, timeout=5)
+    governor.acquire()
+    waiter = threading.Thread(target=governor.acquire)
+    waiter.start()
+    wait_queued(governor, 1)
+
+    started = time.monotonic()
+    with pytest.raises(UpstreamRejected, match='queue full'):
+        governor.acquire()
+    assert time.monotonic() - started < 1
+
+    governor.release()
+    waiter.join(5)
+    assert governor.stats()['rejected'] == 1
+
+
+def test_governor_wait_limit_rejects():
+    governor = RateGovernor(rate=0, max_in_flight=1, timeout=0.05)
+    governor.acquire()
+
+    with pytest.raises(UpstreamRejected):
+        governor.acquire()
+
+    # A later deadline does not extend the governor's own limit
+    with deadline(10), pytest.raises(UpstreamRejected):
+        governor.acquire()
+
+
+def test_request_deadline_cuts_the_wait_short():
+    governor = RateGovernor(rate=0, max_in_flight=1, timeout=10)
+    governor.acquire()
+
+    started = time.monotonic()
+    with deadline(0.05), pytest.raises(DeadlineExceeded):
+        governor.acquire()
+    assert time.monotonic() - started < 5
+
+    with deadline(0), pytest.raises(DeadlineExceeded):
+        governor.acquire()
+    assert governor.stats()['queued'] == 0
+    assert (governor.stats()['expired'], governor.stats()['rejected']) == (2, 0)
+
+
+def test_background_requests_leave_the_reserve(clock):
+    governor = RateGovernor(rate=1, burst=4, max_in_flight=0, reserve=2, timer=clock)
+
+    with background():
+        governor.acquire(timeout=0)
+        governor.acquire(timeout=0)
+        with pytest.raises(UpstreamRejected):
+            governor.acquire(timeout=0)
+
+    governor.acquire(timeout=0)
+    governor.acquire(timeout=0)
+    with pytest.raises(UpstreamRejected):
+        governor.acquire(timeout=0)
+
+    clock.advance(3)
+    with background():
+        governor.acquire(timeout=0)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import datetime
+from itertools import islice
+
+import pytest
+
+from src.tarjeta_metrobus.history import MovementHistory
+from src.tarjeta_metrobus.models import CardMovement
+from src.tarjeta_metrobus.utils import PANAMA_TZINFO
+
+NOON = datetime.datetime(2024, 5, 31, 12, 0, tzinfo=PANAMA_TZINFO)
+
+
+def movement(number: int, when: datetime.datetime = NOON) -> CardMovement:
+    return CardMovement(no_transaccion=f'{number:06d}', movimiento='Uso', fecha_y_hora=when,
+                        lugar='Albrook', monto='B/. -1,25', saldo_tarjeta='B/. 3,00')
+
+
+@pytest.fixture
+def history():
+    history = MovementHistory()
+    # Runs of equal timestamps, split across batches, and movements without one
+    history.record('1', [movement(number) for number in range(1, 8)])
+    history.record('1', [movement(number, NOON - datetime.timedelta(hours=1)) for number in range(8, 12)])
+    history.record('1', [movement(number, None) for number in range(12, 15)])
+    history.record('2', [movement(99)])
+    yield history
+    history.close()
+
+
+def numbers(movements) -> list:
+    return [movement.no_transaccion for movement in movements]
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 3, 4, 7, 14, 100])
+def test_batches_resume_exactly_after_equal_timestamps(history, batch_size):
+    expected = numbers(history.movements('1'))
+
+    assert expected[:7] == [f'{number:06d}' for number in range(7, 0, -1)]
+    assert expected[-3:] == [f'{number:06d}' for number in range(14, 11, -1)]
+    # Bounded, so a cursor that repeats rows fails instead of looping forever
+    assert numbers(islice(history.iter_movements('1', batch_size=batch_size), len(expected) + 1)) == expected
+
+
+@pytest.mark.parametrize('batch_size', [1, 3, 5])
+def test_batches_honour_limit_and_range(history, batch_size):
+    assert numbers(history.iter_movements('1', limit=9, batch_size=batch_size)) == \
+        numbers(history.movements('1', limit=9))
+
+    start, end = NOON - datetime.timedelta(hours=1), NOON
+    ranged = numbers(history.iter_movements('1', start=start, end=end, batch_size=batch_size))
+    assert ranged == ['000011', '000010', '000009', '000008']
+
+
+def test_recording_twice_is_a_no_op(history):
+    assert history.record('1', [movement(1), movement(20)]) == 1
+    assert history.count('1') == 15
+    assert history.latest('2').no_transaccion == '000099'
+
+
+def test_portal_text_survives_the_round_trip(history):
+    stored = history.movements('1', limit=1)[0]
+
+    assert (stored.monto, stored.monto_text) == (movement(7).monto, 'B/. -1,25')
+    assert stored.fecha_y_hora == NOON
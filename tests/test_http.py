@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import zlib
+
+import pytest
+from werkzeug.http import parse_accept_header
+
+from src.core.http import ENCODINGS, compress_stream, negotiate_encoding, strong_etag
+
+CARD = '33070524'
+
+
+@pytest.mark.parametrize('header, encoding', [
+    ('gzip', 'gzip'),
+    ('gzip;q=0', None),
+    ('*', ENCODINGS[0]),
+    ('*, gzip;q=0', 'br' if 'br' in ENCODINGS else None),
+    ('identity', None),
+    ('', None),
+])
+def test_negotiates_the_preferred_offered_encoding(header, encoding):
+    assert negotiate_encoding(parse_accept_header(header)) == encoding
+
+
+def test_brotli_is_not_chosen_when_not_offered():
+    accept = parse_accept_header('br, gzip;q=0.5')
+
+    assert negotiate_encoding(accept, ('gzip',)) == 'gzip'
+    assert negotiate_encoding(accept, ('br', 'gzip')) == 'br'
+
+
+def test_streamed_gzip_decodes_after_every_chunk():
+    chunks = [b'{"a":1}\n' * 100, b'{"b":2}\n' * 100, b'{"c":3}\n']
+    decoder = zlib.decompressobj(31)
+    decoded = b''
+
+    encoded = compress_stream(chunks, 'gzip')
+    for index in range(len(chunks)):
+        decoded += decoder.decompress(next(encoded))
+        assert decoded == b''.join(chunks[:index + 1])
+
+    assert decoder.decompress(b''.join(encoded)) == b''
+    assert decoder.eof
+    assert gzip.decompress(b''.join(compress_stream([], 'gzip'))) == b''
+
+
+def test_etag_is_stable_and_answers_if_none_match(api):
+    first = api.get(f'/api/v1/card/{CARD}/info')
+    again = api.get(f'/api/v1/card/{CARD}/info')
+
+    assert first.status_code == 200
+    assert first.headers['ETag'] == again.headers['ETag'] == f'"{strong_etag(first.data)}"'
+
+    cached = api.get(f'/api/v1/card/{CARD}/info', headers={'If-None-Match': first.headers['ETag']})
+    assert cached.status_code == 304
+    assert cached.data == b''
+    assert cached.headers['ETag'] == first.headers['ETag']
+
+    changed = api.get(f'/api/v1/card/{CARD}/info', headers={'If-None-Match': '"other"'})
+    assert changed.status_code == 200
+
+
+def test_large_responses_are_compressed_for_clients_accepting_it(api):
+    plain = api.get(f'/api/v1/card/{CARD}/transactions')
+    zipped = api.get(f'/api/v1/card/{CARD}/transactions', headers={'Accept-Encoding': 'gzip'})
+    refused = api.get(f'/api/v1/card/{CARD}/transactions', headers={'Accept-Encoding': 'gzip;q=0'})
+    brotli = api.get(f'/api/v1/card/{CARD}/transactions', headers={'Accept-Encoding': 'br'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert zipped.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(zipped.data) == plain.data
+    # The encoded variant has its own tag, which also revalidates
+    assert zipped.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+    assert 'Content-Encoding' not in refused.headers
+    assert brotli.headers.get('Content-Encoding') == ('br' if 'br' in ENCODINGS else None)
+
+    revalidated = api.get(f'/api/v1/card/{CARD}/transactions',
+                          headers={'Accept-Encoding': 'gzip', 'If-None-Match': zipped.headers['ETag']})
+    assert revalidated.status_code == 304
+
+
+def test_streamed_exports_are_compressed(api):
+    plain = api.get(f'/api/v1/card/{CARD}/transactions.ndjson')
+    zipped = api.get(f'/api/v1/card/{CARD}/transactions.ndjson', headers={'Accept-Encoding': 'gzip'})
+
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(zipped.data) == plain.data
+    assert all(json.loads(line) for line in plain.data.splitlines())
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+from src.core.metrics import Callback, Counter, Gauge, Histogram, Registry, clear, retire
+
+
+def worker() -> Registry:
+    registry = Registry()
+    requests = Counter('requests_total', 'Requests', ('status',), registry=registry)
+    Gauge('in_flight', 'Requests running', registry=registry).labels().inc(2)
+    Histogram('seconds', 'Latency', buckets=(1,), registry=registry).labels().observe(0.5)
+    Callback('lag_seconds', 'Lag', 'gauge', (), lambda: {(): 3.0}, registry=registry, aggregate='max')
+    requests.labels(200).inc(5)
+    return registry
+
+
+def other_worker(directory, pid: int = 1) -> None:
+    with open(os.path.join(directory, f'{pid}.json'), 'w', encoding='utf-8') as file:
+        json.dump(worker().snapshot(), file)
+
+
+def test_registry_renders_the_prometheus_format():
+    assert worker().render().splitlines() == [
+        '# HELP requests_total Requests',
+        '# TYPE requests_total counter',
+        'requests_total{status="200"} 5',
+        '# HELP in_flight Requests running',
+        '# TYPE in_flight gauge',
+        'in_flight 2',
+        '# HELP seconds Latency',
+        '# TYPE seconds histogram',
+        'seconds_bucket{le="1"} 1',
+        'seconds_bucket{le="+Inf"} 1',
+        'seconds_sum 0.5',
+        'seconds_count 1',
+        '# HELP lag_seconds Lag',
+        '# TYPE lag_seconds gauge',
+        'lag_seconds 3',
+    ]
+
+
+def test_shared_metrics_add_up_across_processes(tmp_path):
+    registry = worker()
+    registry.share(str(tmp_path), interval=3600)
+    other_worker(tmp_path)
+
+    lines = registry.render().splitlines()
+
+    assert 'requests_total{status="200"} 10' in lines
+    assert 'in_flight 4' in lines
+    assert 'seconds_bucket{le="+Inf"} 2' in lines
+    assert 'lag_seconds 3' in lines
+
+
+def test_finished_processes_keep_their_counts_only(tmp_path):
+    registry = worker()
+    registry.share(str(tmp_path), interval=3600)
+    other_worker(tmp_path)
+
+    retire(str(tmp_path), 1)
+    lines = registry.render().splitlines()
+
+    assert 'requests_total{status="200"} 10' in lines
+    assert 'in_flight 2' in lines
+
+    clear(str(tmp_path))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+from decimal import Decimal
+
+from src.tarjeta_metrobus.models import CardMovement, CardStat
+from src.tarjeta_metrobus.serializers import dumps
+
+
+def movement(**values) -> CardMovement:
+    return CardMovement(**{'no_transaccion': '1', 'movimiento': 'Uso', 'fecha_y_hora': '31/05/2024 18:45:07',
+                           'lugar': 'Albrook', 'monto': 'B/. -1,25', 'saldo_tarjeta': 'B/. 3,00', **values})
+
+
+def test_portal_text_is_output_unchanged():
+    data = movement().to_dict()
+
+    assert data['fechaYHora'] == '31/05/2024 18:45:07'
+    assert data['monto'] == 'B/. -1,25'
+    assert data['saldoTarjeta'] == 'B/. 3,00'
+    assert data['fechaYHoraValue'] == '2024-05-31T18:45:07-05:00'
+    assert data['montoValue'] == '-1.25'
+
+
+def test_serializers_match_to_json():
+    parsed = movement()
+
+    assert dumps(parsed) == parsed.to_json(separators=(',', ':')).encode()
+
+
+def test_round_trips():
+    parsed = movement()
+
+    assert CardMovement.from_dict(parsed.to_dict()) == parsed
+    assert CardMovement.schema().load(CardMovement.schema().dump(parsed)) == parsed
+
+    stat = CardStat.schema().load({'month': 'Mayo', 'amount': 'B/. 1,25', 'count': '3'})
+    assert (stat.amount, stat.count, stat.amount_text) == (Decimal('1.25'), 3, 'B/. 1,25')
+    assert CardStat.schema().load(CardStat.schema().dump(stat)) == stat
+
+
+def test_typed_values_get_portal_text():
+    parsed = CardMovement(no_transaccion='1', movimiento='Uso',
+                          fecha_y_hora=datetime.datetime(2024, 5, 31, 18, 45), lugar='Albrook',
+                          monto=Decimal('-1.25'), saldo_tarjeta=None)
+
+    assert parsed.fecha_y_hora.isoformat() == '2024-05-31T18:45:00-05:00'
+    assert (parsed.fecha_y_hora_text, parsed.monto_text, parsed.saldo_tarjeta_text) == \
+        ('31/05/2024 18:45', 'B/. -1.25', None)
+
+
+def test_unreadable_values_keep_the_text_and_log(caplog):
+    with caplog.at_level(logging.WARNING):
+        parsed = movement(monto='B/. n/d', saldo_tarjeta='')
+
+    assert (parsed.monto, parsed.monto_text) == (None, 'B/. n/d')
+    assert (parsed.saldo_tarjeta, parsed.saldo_tarjeta_text) == (None, '')
+    assert len(caplog.records) == 1
+    assert 'B/. n/d' in caplog.text
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from benchmarks import pages
+from src.tarjeta_metrobus.parsers import (make_soup,
+                                          parse_card_info,
+                                          parse_card_resume,
+                                          parse_card_stats,
+                                          parse_ksi,
+                                          parse_movements,
+                                          stream_movements)
+
+pytest.importorskip('lxml')
+
+PAGES = {
+    'session': (parse_ksi, parse_card_info),
+    'resume': (parse_card_resume, parse_card_stats),
+    'movements': (parse_movements,),
+}
+
+
+@pytest.mark.parametrize('page, parser', [(page, parser) for page, parsers in PAGES.items() for parser in parsers],
+                         ids=lambda value: value if isinstance(value, str) else value.__name__)
+def test_backends_parse_recorded_pages_alike(page, parser):
+    html = pages.load(page)
+
+    expected = parser(make_soup(html, 'html.parser'))
+
+    assert expected
+    assert parser(make_soup(html, 'lxml')) == expected
+
+
+def test_streamed_movements_match_the_soup():
+    html = pages.load('movements')
+
+    assert list(stream_movements(html)) == parse_movements(make_soup(html, 'lxml'))
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from src.core.deadline import DeadlineExceeded, deadline
+from src.core.resilience import CircuitBreaker, CircuitOpen, Resilience, UpstreamError
+
+
+class Attempts:
+    def __init__(self, *outcomes) -> None:
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def hedging(**kwargs) -> Resilience:
+    resilience = Resilience(attempts=1, hedge_percentile=50, hedge_min_delay=0.02, **kwargs)
+    for _ in range(20):
+        resilience.latencies.add(0.001)
+    return resilience
+
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, timer=clock)
+
+    breaker.allow()
+    breaker.failure()
+    breaker.allow()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.advance(4)
+    with pytest.raises(CircuitOpen) as refused:
+        breaker.allow()
+    assert refused.value.retry_after == pytest.approx(6)
+
+    clock.advance(6)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.allow()
+    # One trial call at a time
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+    breaker.success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert (breaker.opened, breaker.refused) == (1, 2)
+
+
+def test_failed_trial_reopens_the_circuit(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, timer=clock)
+    breaker.failure()
+
+    clock.advance(10)
+    breaker.allow()
+    breaker.failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opened == 2
+
+
+def test_retries_retryable_errors_with_backoff():
+    sleeps = []
+    resilience = Resilience(attempts=3, backoff=0.2, sleep=sleeps.append)
+    attempt = Attempts(UpstreamError(502), UpstreamError(503), 'page')
+
+    assert resilience.call(attempt) == 'page'
+    assert attempt.calls == 3
+    assert len(sleeps) == 2 and all(0 <= sleep <= 0.4 for sleep in sleeps)
+    assert resilience.stats()['retries'] == 2
+    assert resilience.stats()['circuit'] == CircuitBreaker.CLOSED
+
+
+def test_other_errors_are_not_retried_nor_counted():
+    resilience = Resilience(attempts=3, failure_threshold=1, sleep=lambda _: None)
+    attempt = Attempts(ValueError('parser'))
+
+    with pytest.raises(ValueError):
+        resilience.call(attempt)
+
+    assert attempt.calls == 1
+    assert resilience.stats()['circuit'] == CircuitBreaker.CLOSED
+
+
+def test_open_circuit_fails_fast(clock):
+    resilience = Resilience(attempts=1, failure_threshold=2, reset_timeout=30, timer=clock)
+    attempt = Attempts(UpstreamError(500), UpstreamError(500))
+
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            resilience.call(attempt)
+
+    with pytest.raises(CircuitOpen):
+        resilience.call(attempt)
+    assert attempt.calls == 2
+
+
+def test_deadline_does_not_count_against_the_circuit():
+    resilience = Resilience(attempts=3, failure_threshold=1, sleep=lambda _: None)
+
+    def slow():
+        time.sleep(0.02)
+        raise UpstreamError(504)
+
+    with deadline(0.01), pytest.raises(DeadlineExceeded):
+        resilience.call(slow)
+
+    assert resilience.stats()['circuit'] == CircuitBreaker.CLOSED
+
+
+def test_hedge_answers_for_a_slow_attempt():
+    resilience = hedging()
+    release = threading.Event()
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            return 'slow'
+        return 'fast'
+
+    try:
+        assert resilience.call(attempt) == 'fast'
+        assert (resilience.hedges, resilience.hedge_wins) == (1, 1)
+    finally:
+        release.set()
+        resilience.close()
+
+
+def test_hedge_not_started_is_cancelled():
+    # With one hedging thread, busy with the first attempt, the hedge waits
+    # in the queue and must not run once the first attempt has answered
+    resilience = hedging(hedge_workers=1)
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'page'
+
+    try:
+        assert resilience.call(attempt) == 'page'
+        time.sleep(0.2)
+        assert len(calls) == 1
+        assert (resilience.hedges, resilience.hedge_wins) == (1, 0)
+    finally:
+        resilience.close()
+
+
+def test_deadline_in_the_first_attempt_is_not_hedged():
+    resilience = hedging()
+    attempt = Attempts(DeadlineExceeded('portal'), 'page')
+
+    try:
+        with pytest.raises(DeadlineExceeded):
+            resilience.call(attempt)
+        assert attempt.calls == 1
+        assert resilience.hedges == 0
+    finally:
+        resilience.close()
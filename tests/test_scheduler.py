@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from src.core.governor import RateGovernor, UpstreamRejected
+from src.core.scheduler import RefreshScheduler
+
+
+def test_cards_are_watched_from_their_second_request(clock):
+    scheduler = RefreshScheduler(lambda key: None, workers=0, idle_ttl=300, min_requests=2, timer=clock)
+
+    scheduler.touch(1)
+    assert scheduler.stats()['watched'] == 0
+
+    clock.advance(10)
+    scheduler.touch(1)
+    assert scheduler.stats()['watched'] == 1
+
+
+def test_requests_further_apart_than_the_idle_ttl_do_not_add_up(clock):
+    scheduler = RefreshScheduler(lambda key: None, workers=0, idle_ttl=300, min_requests=2, timer=clock)
+
+    scheduler.touch(1)
+    clock.advance(301)
+    scheduler.touch(1)
+    assert scheduler.stats()['watched'] == 0
+
+    clock.advance(1)
+    scheduler.touch(1)
+    assert scheduler.stats()['watched'] == 1
+
+
+def test_refreshes_are_background_work():
+    # One token left, all of it reserved for user requests
+    governor = RateGovernor(rate=0.001, burst=3, max_in_flight=0, reserve=2)
+    governor.acquire(timeout=0)
+    governor.acquire(timeout=0)
+    outcomes = []
+    refreshed = threading.Event()
+
+    def refresh(key):
+        try:
+            governor.acquire(timeout=0)
+            outcomes.append('admitted')
+        except UpstreamRejected:
+            outcomes.append('rejected')
+        refreshed.set()
+
+    scheduler = RefreshScheduler(refresh, workers=1, min_interval=0.01, max_interval=0.01, jitter=0,
+                                 min_requests=1)
+    try:
+        scheduler.touch(1)
+        assert refreshed.wait(5)
+    finally:
+        scheduler.close()
+
+    assert outcomes[0] == 'rejected'
+    governor.acquire(timeout=0)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from src.core.deadline import DeadlineExceeded, deadline
+from src.core.governor import UpstreamRejected
+from src.core.session_pool import PoolTimeout, SessionPool
+
+
+class Session:
+    def __init__(self) -> None:
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture
+def pool(clock):
+    pool = SessionPool(Session, size=2, min_idle=0, max_age=300, timeout=0.05, timer=clock)
+    yield pool
+    pool.close()
+
+
+def test_returned_sessions_are_reused(pool):
+    with pool.session() as first:
+        pass
+    with pool.session() as second:
+        assert pool.stats()['idle'] == 0
+
+    assert second is first
+    assert not first.closed
+    assert pool.stats() == {'size': 2, 'idle': 1}
+
+
+def test_sessions_past_their_age_are_replaced(pool, clock):
+    entry = pool.checkout()
+    pool.checkin(entry)
+
+    clock.advance(300)
+    replaced = pool.checkout()
+
+    assert replaced.session is not entry.session
+    assert entry.session.closed
+    pool.checkin(replaced)
+
+
+def test_full_pool_times_out(pool):
+    entries = [pool.checkout(), pool.checkout()]
+
+    with pytest.raises(PoolTimeout) as refused:
+        pool.checkout()
+    # Served as 503 like every request turned away upstream
+    assert isinstance(refused.value, UpstreamRejected)
+
+    pool.checkin(entries.pop())
+    assert pool.checkout(timeout=0) is not None
+
+
+def test_request_deadline_cuts_the_wait_short(pool):
+    pool.checkout()
+    pool.checkout()
+
+    with deadline(0.01), pytest.raises(DeadlineExceeded):
+        pool.checkout(timeout=10)
+
+    with deadline(0), pytest.raises(DeadlineExceeded):
+        pool.checkout()
+
+
+def test_sessions_that_raise_are_discarded(pool):
+    with pytest.raises(ValueError), pool.session() as session:
+        raise ValueError('portal')
+
+    assert session.closed
+    assert pool.stats()['idle'] == 0
+    # The slot was given back
+    pool.checkout(timeout=0)
+    pool.checkout(timeout=0)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from src.core.deadline import DeadlineExceeded, deadline
+from src.core.singleflight import SingleFlight
+
+
+def test_followers_share_the_leader_result():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'page'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do('card', fetch)))
+    leader.start()
+    started.wait(5)
+
+    follower = threading.Thread(target=lambda: results.append(flights.do('card', fetch)))
+    follower.start()
+    while flights.stats()['coalesced'] == 0:
+        time.sleep(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert results == ['page', 'page']
+    assert len(calls) == 1
+
+
+def test_followers_get_the_leader_error():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fetch():
+        started.set()
+        release.wait(5)
+        raise ValueError('portal')
+
+    errors = []
+
+    def run():
+        try:
+            flights.do('card', fetch)
+        except ValueError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    threads[0].start()
+    started.wait(5)
+    threads[1].start()
+    while flights.stats()['coalesced'] == 0:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 2
+
+
+def test_leader_deadline_does_not_fail_followers():
+    flights = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        if len(calls) == 1:
+            started.set()
+            # The leader, with a tiny budget, runs out of time
+            while flights.stats()['coalesced'] == 0:
+                time.sleep(0.001)
+            raise DeadlineExceeded('Deadline exceeded')
+        return 'page'
+
+    outcome = {}
+
+    def leader():
+        with deadline(0.1):
+            try:
+                flights.do('card', fetch)
+            except DeadlineExceeded:
+                outcome['leader'] = 'timeout'
+
+    def follower():
+        with deadline(10):
+            outcome['follower'] = flights.do('card', fetch)
+
+    first = threading.Thread(target=leader)
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=follower)
+    second.start()
+    first.join(5)
+    second.join(5)
+
+    assert outcome == {'leader': 'timeout', 'follower': 'page'}
+    assert len(calls) == 2
+
+
+def test_follower_gives_up_at_its_own_deadline():
+    flights = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fetch():
+        started.set()
+        release.wait(5)
+        return 'page'
+
+    leader = threading.Thread(target=lambda: flights.do('card', fetch))
+    leader.start()
+    started.wait(5)
+
+    with deadline(0.05), pytest.raises(DeadlineExceeded):
+        flights.do('card', fetch)
+
+    release.set()
+    leader.join(5)
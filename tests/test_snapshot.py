@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from src.tarjeta_metrobus.models import SNAPSHOT_SECTIONS
+
+CARD = '33070524'
+
+
+def servlets(portal) -> dict:
+    # Landing page hits only warm up new sessions
+    return {name: count for name, count in portal.requests.items() if name.endswith('Servlet')}
+
+
+def test_full_snapshot_fetches_each_page_once(tarjeta, portal):
+    snapshot = tarjeta.get_card_snapshot(CARD)
+
+    assert all(getattr(snapshot, section) for section in SNAPSHOT_SECTIONS)
+    # One KSI handshake, which also has the info, then the resume page for
+    # resume and stats, and the movements page
+    assert servlets(portal) == {'SesionPortalServlet': 1, 'ComercialesPortalServlet': 2}
+
+
+@pytest.mark.parametrize('sections, commerce', [(['resume'], 1), (['resume', 'stats'], 1), (['movements'], 1),
+                                                (['stats', 'movements'], 2)])
+def test_sections_without_info_reuse_the_cached_ksi(tarjeta, portal, sections, commerce):
+    tarjeta.get_card_snapshot(CARD, ['info'])
+    snapshot = tarjeta.get_card_snapshot(CARD, sections)
+
+    assert all(getattr(snapshot, section) is not None for section in sections)
+    assert servlets(portal) == {'SesionPortalServlet': 1, 'ComercialesPortalServlet': commerce}